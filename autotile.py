@@ -0,0 +1,107 @@
+"""
+Bulk wall autotiling.
+
+`Wall.place` looks at the four neighbours of a single wall.  When a whole map is being built it is much
+faster to work out the neighbour masks(see `map_objects.NORTH` etc.) of an entire row at once.  Each row of
+the token grid is turned into a row of 0/1 wall flags with `bytearray.translate`, and the flags of the row,
+the row above and the row below are added together as big integers(one byte per cell, so the sums never
+carry into the next cell).  The resulting bytes hold the mask of every cell in the row, which then only has
+to be looked up in the 16 entry `Wall.glyphs` table.
+"""
+from map_objects import NORTH, SOUTH, EAST, WEST, Wall
+
+
+def wall_flags(tokens, y, wall='#'):
+    """
+    Get a bytes object with a 1 for every `wall` token in row `y` of the token grid and a 0 everywhere else.
+
+    :param tokens: grid.TokenGrid
+    :param y: int
+    :param wall: str
+    :return bytes:
+    """
+
+    code = tokens.codes.get(wall)
+    row = tokens.row(y)
+    if code is None or code not in row:
+        return bytes(len(row))
+
+    if tokens.wide:
+        return bytes([stored == code for stored in row])
+
+    table = bytearray(256)
+    table[code] = 1
+    return row.translate(table)
+
+
+def row_masks(tokens, y, wall='#'):
+    """
+    Get the neighbour masks of every cell in row `y` as a bytes object, indexed by the column(relative to
+    the grid origin).  The mask is only meaningful for cells that hold a wall.
+
+    :param tokens: grid.TokenGrid
+    :param y: int
+    :param wall: str
+    :return bytes:
+    """
+
+    row = wall_flags(tokens, y, wall)
+    width = len(row)
+    if not width or not any(row):
+        return bytes(width)
+
+    above = wall_flags(tokens, y - 1, wall)[:width]
+    below = wall_flags(tokens, y + 1, wall)[:width]
+
+    limit = (1 << (8 * width)) - 1
+    current = int.from_bytes(row, 'little')
+    masks = (
+        int.from_bytes(above, 'little') * NORTH +
+        int.from_bytes(below, 'little') * SOUTH +
+        (current >> 8) * EAST +
+        ((current << 8) & limit) * WEST
+    )
+    return masks.to_bytes(width, 'little')
+
+
+def autotiles(wall_class):
+    """
+    Check if the given class can be placed with the bulk autotiling instead of its `place` method.
+
+    :param wall_class: class
+    :return bool:
+    """
+
+    return isinstance(wall_class, type) and issubclass(wall_class, Wall) and wall_class.place is Wall.place
+
+
+def retile(game_map, cell):
+    """
+    Have the wall at the given cell(if there is one) pick its character again from its current neighbours.
+
+    :param game_map: Map
+    :param cell: tuple
+    :return bool: True if the wall looks different now.
+    """
+
+    wall = game_map.objects.get(cell)
+    if not isinstance(wall, Wall):
+        return False
+
+    before = wall.ch_number, wall.drawing, wall.color
+    if autotiles(type(wall)):
+        wall.set_mask(wall.border_mask(cell[0], cell[1], game_map))
+    else:
+        # `Map.changed` calls this and tells the watchers about the wall itself, placing it on a watched map
+        # would call `changed` again.
+        watchers, game_map.watchers = game_map.watchers, []
+        try:
+            wall.place(game_map)
+        finally:
+            game_map.watchers = watchers
+
+    if (wall.ch_number, wall.drawing, wall.color) == before:
+        return False
+    # Write the wall back, so maps that track changes to their cells(like a ChunkedMap) notice it.
+    game_map.objects[cell] = wall
+    return True
@@ -0,0 +1,681 @@
+"""
+Benchmarks for building, storing, moving and drawing maps.  Run them with:
+
+    python benchmarks.py [size] [--only build,move] [--json results.json]
+
+`size` is the height and width of the maps most benchmarks use(500 by default), `bench_build` builds maps
+of `--build-sizes` with each of the `--densities` of walls instead.  The maps are generated from fixed
+seeds, so runs on the same machine can be compared; `--json` writes the results with the Python version
+and platform to a file(or `-` for stdout) to keep track of them between changes.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+from autotile import row_masks, wall_flags
+from editor import Map, MapBuilder
+from grid import TokenGrid, ObjectGrid
+from map_objects import MAP_OBJECTS, Wall, Ground, Treasure
+from renderer import Renderer
+from textrender import TextRenderer
+
+
+def synthetic_map(height, width, wall_density=0.3, seed=0):
+    """
+    Create the text for a random map with the given size.  Roughly `wall_density` of the cells are walls,
+    the rest is mostly floor with a few doors, water, treasure and food sprinkled in.
+
+    :param height: int
+    :param width: int
+    :param wall_density: float
+    :param seed: int
+    :return str:
+    """
+
+    rng = random.Random(seed)
+    others = ' ' * 40 + '|-w$f'
+    rows = []
+    for _ in range(height):
+        rows.append(''.join(
+            '#' if rng.random() < wall_density else rng.choice(others) for _ in range(width)
+        ))
+    return '\n'.join(rows)
+
+
+def measure_memory(factory):
+    """
+    Get the number of bytes allocated while building the object returned by `factory`.
+
+    :param factory: callable
+    :return int:
+    """
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        result = factory()
+        used = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    del result
+    return used
+
+
+class FakeScreen(object):
+    """
+    Stands in for a curses window, so frames can be drawn without a terminal.  It counts the characters
+    drawn to it.
+    """
+
+    def __init__(self, height, width):
+        self.height, self.width = height, width
+        self.drawn = 0
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def addch(self, y, x, ch, attribute=0):
+        self.drawn += 1
+
+    def addstr(self, y, x, string, attribute=0):
+        self.drawn += len(string)
+
+    def noutrefresh(self):
+        pass
+
+
+class FakeScreenRenderer(Renderer):
+    """
+    A Renderer that draws onto a FakeScreen, without asking curses for color pairs or updating the terminal.
+    """
+
+    def __init__(self, window):
+        # Renderer.__init__ imports curses, which drawing onto a FakeScreen never needs.
+        self.window = window
+        self.front = {}
+        self.kinds = {}
+        self.attributes = {}
+
+    def attribute(self, color):
+        return color
+
+    def present(self):
+        self.window.noutrefresh()
+
+
+def bench_build(sizes=(100, 500, 1000, 2000, 4000), densities=(0.1, 0.3, 0.6)):
+    """
+    Time `MapBuilder.build` for square maps of each size with each density of walls.
+
+    :return dict:
+    """
+
+    results = {}
+    for size in sizes:
+        for density in densities:
+            map_text = synthetic_map(size, size, density)
+            # Large maps take long enough that one build is a stable measurement.
+            repeat = 3 if size * size <= 1000000 else 1
+            seconds = min(timeit.repeat(lambda: MapBuilder.build(map_text, Map(), MAP_OBJECTS),
+                                        number=1, repeat=repeat))
+            results['%dx%d_walls_%d%%' % (size, size, density * 100)] = {
+                'seconds': seconds,
+                'cells_per_second': size * size / seconds,
+            }
+    return results
+
+
+def bench_lookup(height=500, width=500, lookups=200000):
+    """
+    Time random `objects[y, x]` lookups on a built map.
+
+    :return dict:
+    """
+
+    game_map = MapBuilder.build(synthetic_map(height, width), Map(), MAP_OBJECTS)
+    objects = game_map.objects
+    rng = random.Random(4)
+    keys = [(rng.randrange(height), rng.randrange(width)) for _ in range(lookups)]
+
+    def run():
+        for key in keys:
+            objects[key]
+
+    return {'lookups_per_second': lookups / min(timeit.repeat(run, number=1, repeat=3))}
+
+
+def bench_move(height=500, width=500, steps=20):
+    """
+    Time `MapObject.move` by walking every Treasure on a map a random step onto the floor next to it,
+    `steps` times, and the same walk with each step made as one `Map.transaction`.
+
+    :return dict:
+    """
+
+    map_text = synthetic_map(height, width)
+    results = {}
+    for name in ('moves', 'transaction_moves'):
+        game_map = MapBuilder.build(map_text, Map(), MAP_OBJECTS)
+        objects = game_map.objects
+        movers = [map_object for map_object in objects.values() if type(map_object) is Treasure]
+        rng = random.Random(5)
+        directions = [rng.choice(((-1, 0), (1, 0), (0, 1), (0, -1))) for _ in range(len(movers) * steps)]
+
+        moves = 0
+        start = timeit.default_timer()
+        for step in range(steps):
+            transaction = game_map.transaction()
+            for mover, (dy, dx) in zip(movers, directions[step * len(movers):]):
+                y, x = mover.y + dy, mover.x + dx
+                if type(objects.get((y, x))) is Ground:
+                    if name == 'moves':
+                        mover.move(y, x, game_map)
+                    else:
+                        transaction.move(mover, y, x)
+                    moves += 1
+            # Movers that step onto the same floor cell as an earlier mover are left out.
+            transaction.commit(skip_conflicts=True)
+        seconds = timeit.default_timer() - start
+
+        results[name + '_per_second'] = moves / seconds
+    results['moves'] = moves
+    return results
+
+
+def bench_render(height=500, width=500, frames=10):
+    """
+    Time drawing whole frames of a map onto a FakeScreen as large as the map: a full redraw(after
+    `Renderer.invalidate`) and a frame where nothing changed.  Also times drawing the map into a string
+    with `textrender.TextRenderer`, as plain text and with ANSI colors.
+
+    :return dict:
+    """
+
+    game_map = MapBuilder.build(synthetic_map(height, width), Map(), MAP_OBJECTS)
+    screen = FakeScreen(height, width)
+    renderer = FakeScreenRenderer(screen)
+
+    def full():
+        renderer.invalidate()
+        renderer.draw(game_map)
+
+    full_time = min(timeit.repeat(full, number=1, repeat=frames))
+    drawn = screen.drawn
+    unchanged_time = min(timeit.repeat(lambda: renderer.draw(game_map), number=1, repeat=frames))
+
+    text_renderer, ansi_renderer = TextRenderer(), TextRenderer(ansi=True)
+    text_time = min(timeit.repeat(lambda: text_renderer.render(game_map), number=1, repeat=frames))
+    ansi_time = min(timeit.repeat(lambda: ansi_renderer.render(game_map), number=1, repeat=frames))
+    return {
+        'full_frame_seconds': full_time,
+        'unchanged_frame_seconds': unchanged_time,
+        'text_frame_seconds': text_time,
+        'ansi_frame_seconds': ansi_time,
+        'cells_per_second': height * width / full_time,
+        'characters_per_frame': drawn // frames,
+    }
+
+
+def bench_grid_storage(height=500, width=500, lookups=200000):
+    """
+    Compare the memory used by and lookup speed of the old tuple keyed dicts against the `grid` containers
+    for a map with `height` * `width` cells.
+
+    :return dict:
+    """
+
+    rows = synthetic_map(height, width).split('\n')
+    value = object()
+
+    def token_dict():
+        return {(y, x): token for y, row in enumerate(rows) for x, token in enumerate(row)}
+
+    def token_grid():
+        grid = TokenGrid()
+        for y, row in enumerate(rows):
+            grid.set_row(y, row)
+        return grid
+
+    def object_dict():
+        return {(y, x): value for y, row in enumerate(rows) for x in range(len(row))}
+
+    def object_grid():
+        grid = ObjectGrid()
+        for y, row in enumerate(rows):
+            grid.set_row(y, [value] * len(row))
+        return grid
+
+    rng = random.Random(1)
+    keys = [(rng.randrange(height), rng.randrange(width)) for _ in range(lookups)]
+
+    def lookup(container):
+        def run():
+            for key in keys:
+                container[key]
+        return min(timeit.repeat(run, number=1, repeat=3))
+
+    results = {'cells': height * width}
+    for name, factory in [('token_dict', token_dict), ('token_grid', token_grid),
+                          ('object_dict', object_dict), ('object_grid', object_grid)]:
+        results[name] = {
+            'bytes': measure_memory(factory),
+            'lookups_per_second': lookups / lookup(factory()),
+        }
+    return results
+
+
+def bench_autotile(height=500, width=500, wall_density=0.3):
+    """
+    Compare placing every wall with `Wall.place` against the bulk autotiling done by `MapBuilder`.
+
+    :return dict:
+    """
+
+    game_map = Map()
+    MapBuilder.place_tokens(synthetic_map(height, width, wall_density), game_map)
+    walls = [(y, x) for (y, x), token in game_map.tokens.items() if token == '#']
+
+    def per_cell():
+        for y, x in walls:
+            Wall(y, x).place(game_map)
+
+    def bulk():
+        objects = game_map.objects
+        for y in range(game_map.tokens.height):
+            masks = row_masks(game_map.tokens, y)
+            for x, flag in enumerate(wall_flags(game_map.tokens, y)):
+                if flag:
+                    wall = Wall(y, x)
+                    wall.set_mask(masks[x])
+                    objects[y, x] = wall
+
+    per_cell_time = min(timeit.repeat(per_cell, number=1, repeat=3))
+    bulk_time = min(timeit.repeat(bulk, number=1, repeat=3))
+    return {
+        'walls': len(walls),
+        'per_cell_walls_per_second': len(walls) / per_cell_time,
+        'bulk_walls_per_second': len(walls) / bulk_time,
+    }
+
+
+def bench_compiled(height=500, width=500, path='bench.map'):
+    """
+    Compare building a map from text against loading it from the compiled format.
+
+    :return dict:
+    """
+
+    import os
+    import compiled
+
+    map_text = synthetic_map(height, width)
+    start = timeit.default_timer()
+    game_map = MapBuilder.build(map_text, Map(), MAP_OBJECTS)
+    build_time = timeit.default_timer() - start
+
+    compiled.save(game_map, path)
+    try:
+        start = timeit.default_timer()
+        loaded = compiled.load(path)
+        load_time = timeit.default_timer() - start
+
+        # The loaded map has to match the one that was built.
+        for (y, x), map_object in game_map.objects.items():
+            assert compiled.glyph(loaded.objects[y, x]) == compiled.glyph(map_object)
+            assert type(loaded.objects[y, x]) is type(map_object)
+        assert dict(loaded.tokens.items()) == dict(game_map.tokens.items())
+        loaded.close()
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+    return {'cells': height * width, 'build_seconds': build_time, 'load_seconds': load_time, 'file_bytes': size}
+
+
+def bench_retile(height=500, width=500, edits=1000):
+    """
+    Compare changing single cells with `MapBuilder.place_token` against rebuilding the whole map.  That both
+    end up with the same map is checked by `test_maps.RetileTest`.
+
+    :return dict:
+    """
+
+    rows = [list(row) for row in synthetic_map(height, width).split('\n')]
+    game_map = MapBuilder.build('\n'.join(''.join(row) for row in rows), Map(), MAP_OBJECTS)
+
+    rng = random.Random(2)
+    start = timeit.default_timer()
+    for _ in range(edits):
+        y, x = rng.randrange(height), rng.randrange(width)
+        token = rng.choice('#   $w')
+        rows[y][x] = token
+        MapBuilder.place_token(game_map, y, x, token, MAP_OBJECTS)
+    edit_time = (timeit.default_timer() - start) / edits
+
+    start = timeit.default_timer()
+    MapBuilder.build('\n'.join(''.join(row) for row in rows), Map(), MAP_OBJECTS)
+    rebuild_time = timeit.default_timer() - start
+
+    return {'edit_seconds': edit_time, 'rebuild_seconds': rebuild_time}
+
+
+def bench_build_cache(height=500, width=500, edits=100):
+    """
+    Time building a map again through a `buildcache.BuildCache` after typing a character into it, against
+    building it from scratch, and check that both end up with the same map.
+
+    :return dict:
+    """
+
+    import compiled
+    from buildcache import BuildCache
+
+    rows = synthetic_map(height, width).split('\n')
+    cache = BuildCache(MAP_OBJECTS)
+    cache.build('\n'.join(rows))
+    start = timeit.default_timer()
+    hit = cache.build('\n'.join(rows))
+    hit_time = timeit.default_timer() - start
+
+    rng = random.Random(6)
+    start = timeit.default_timer()
+    for _ in range(edits):
+        y, x = rng.randrange(height), rng.randrange(width)
+        rows[y] = rows[y][:x] + rng.choice('#   $w') + rows[y][x + 1:]
+        game_map = cache.build('\n'.join(rows))
+    edit_time = (timeit.default_timer() - start) / edits
+
+    start = timeit.default_timer()
+    rebuilt = MapBuilder.build('\n'.join(rows), Map(), MAP_OBJECTS)
+    rebuild_time = timeit.default_timer() - start
+
+    assert game_map is hit and len(game_map.objects) == len(rebuilt.objects)
+    for (y, x), map_object in rebuilt.objects.items():
+        assert compiled.glyph(game_map.objects[y, x]) == compiled.glyph(map_object)
+
+    return {'hit_seconds': hit_time, 'edit_seconds': edit_time, 'rebuild_seconds': rebuild_time}
+
+
+def bench_spatial(height=500, width=500, queries=1000):
+    """
+    Compare finding the nearest Treasure with the spatial index against scanning the map, and check that
+    both find equally close cells.
+
+    :return dict:
+    """
+
+    game_map = MapBuilder.build(synthetic_map(height, width), Map(), MAP_OBJECTS)
+
+    start = timeit.default_timer()
+    index = game_map.spatial_index()
+    index_time = timeit.default_timer() - start
+
+    rng = random.Random(3)
+    points = [(rng.randrange(height), rng.randrange(width)) for _ in range(queries)]
+    start = timeit.default_timer()
+    found = [index.nearest(Treasure, y, x) for y, x in points]
+    query_time = (timeit.default_timer() - start) / queries
+
+    def distance(cell, y, x):
+        return (cell[0] - y) ** 2 + (cell[1] - x) ** 2
+
+    start = timeit.default_timer()
+    treasures = [cell for cell, map_object in game_map.objects.items() if isinstance(map_object, Treasure)]
+    scan_time = timeit.default_timer() - start
+    for (y, x), cell in list(zip(points, found))[:100]:
+        assert distance(cell, y, x) == min(distance(treasure, y, x) for treasure in treasures)
+
+    return {'index_seconds': index_time, 'nearest_seconds': query_time, 'scan_seconds': scan_time}
+
+
+def bench_parallel(height=500, width=500, maps=16):
+    """
+    Build many maps with `parallel.build_many`, and one map `maps` times as large with
+    `parallel.build_bands`, on 1, 2, 4... up to all cores.  Checks that every process count builds the same
+    maps and that the banded map is the same as a serial build.
+
+    :return dict: The seconds and speed-up over one process for each process count.
+    """
+
+    import compiled
+    import parallel
+
+    texts = [synthetic_map(height, width, seed=seed) for seed in range(maps)]
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    if counts[-1] != (os.cpu_count() or 1):
+        counts.append(os.cpu_count())
+
+    results = {}
+    expected = None
+    for processes in counts:
+        start = timeit.default_timer()
+        game_maps = parallel.build_many(texts, MAP_OBJECTS, processes)
+        seconds = timeit.default_timer() - start
+
+        data = [compiled.dumps(game_map) for game_map in game_maps]
+        if expected is None:
+            expected = data
+        assert data == expected
+        results['processes_%d_seconds' % processes] = seconds
+        results['processes_%d_speedup' % processes] = results['processes_1_seconds'] / seconds
+
+    text = synthetic_map(height * maps, width)
+    start = timeit.default_timer()
+    expected = compiled.dumps(MapBuilder.build(text, Map(), MAP_OBJECTS))
+    results['serial_seconds'] = timeit.default_timer() - start
+    for processes in counts:
+        start = timeit.default_timer()
+        game_map = parallel.build_bands(text, MAP_OBJECTS, processes)
+        results['bands_%d_seconds' % processes] = seconds = timeit.default_timer() - start
+        results['bands_%d_speedup' % processes] = results['serial_seconds'] / seconds
+        assert compiled.dumps(game_map) == expected
+    return results
+
+
+def bench_tile_memory(height=500, width=500):
+    """
+    Report the bytes used per cell by a built map with tiles that have a `__dict__`(how tiles used to be),
+    with the `__slots__` tiles and with flyweight tiles.
+
+    :return dict:
+    """
+
+    map_text = synthetic_map(height, width)
+    # Subclasses that don't declare __slots__ get a __dict__ again.
+    dict_objects = {name: type(cls.__name__, (cls,), {}) for name, cls in MAP_OBJECTS.items()}
+
+    results = {}
+    for name, map_objects, flyweights in [('dict_tiles', dict_objects, False),
+                                          ('slotted_tiles', MAP_OBJECTS, False),
+                                          ('flyweight_tiles', MAP_OBJECTS, True)]:
+        used = measure_memory(lambda: MapBuilder.build(map_text, Map(flyweights=flyweights), map_objects))
+        results[name + '_bytes_per_cell'] = used / float(height * width)
+    return results
+
+
+def bench_lazy(height=500, width=500, view_height=24, view_width=80):
+    """
+    Compare building a map with every object created against a lazy map(see `Map.lazy`): the build time,
+    the bytes used per cell and the time to draw the first screen of the map into a string.  Checks that
+    the screen is the same for both.
+
+    :return dict:
+    """
+
+    map_text = synthetic_map(height, width)
+    renderer = TextRenderer()
+    results = {}
+    screens = []
+    for name, lazy in (('eager', False), ('lazy', True)):
+        build_time = min(timeit.repeat(lambda: MapBuilder.build(map_text, Map(lazy=lazy), MAP_OBJECTS),
+                                       number=1, repeat=3))
+        used = measure_memory(lambda: MapBuilder.build(map_text, Map(lazy=lazy), MAP_OBJECTS))
+        game_map = MapBuilder.build(map_text, Map(lazy=lazy), MAP_OBJECTS)
+        start = timeit.default_timer()
+        screens.append(list(renderer.rows(game_map, height // 2, width // 2, view_height, view_width)))
+        results[name + '_first_screen_seconds'] = timeit.default_timer() - start
+        results[name + '_build_seconds'] = build_time
+        results[name + '_bytes_per_cell'] = used / float(height * width)
+
+    assert screens[0] == screens[1]
+    return results
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter with `python -X importtime`.
+
+    :param module: str
+    :return dict: The cumulative import time of the module and of every module it imported, in microseconds.
+    """
+
+    # Let the interpreter write the bytecode, so only the first run pays for compiling the modules.
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+        # Modules are listed after the modules they import, the ones before an unindented module that
+        # isn't the one asked for were imported by the interpreter itself.
+        if not name[2:3].isspace():
+            if name.strip() == module:
+                return times
+            times = {}
+    return times
+
+
+def bench_import(modules=('core', 'textrender', 'renderer'), repeat=5, budget_ms=50,
+                 forbidden=('curses', '_curses')):
+    """
+    Time the cold start import of the headless modules, each in a fresh interpreter, and check that none of
+    them imports curses.  Fails when the core takes more than `budget_ms` milliseconds to import.
+
+    :return dict:
+    """
+
+    results = {}
+    for module in modules:
+        best = None
+        for _ in range(repeat):
+            times = import_times(module)
+            loaded = sorted(set(forbidden) & set(times))
+            assert not loaded, '{} imports {}'.format(module, ', '.join(loaded))
+            if best is None or times[module] < best[module]:
+                best = times
+        results[module + '_import_ms'] = best[module] / 1000.0
+        if module == 'core':
+            # The slowest modules the core pulls in, to see what to look at when the budget is blown.
+            own = sorted((name for name in best if name != module), key=lambda name: -best[name])
+            results['core_slowest'] = [[name, best[name] / 1000.0] for name in own[:5]]
+
+    if 'core' in modules:
+        assert results['core_import_ms'] <= budget_ms, 'Importing core took {:.1f}ms, the budget is {}ms.'.format(
+            results['core_import_ms'], budget_ms)
+    return results
+
+
+BENCHMARKS = {
+    'build': bench_build,
+    'lookup': bench_lookup,
+    'move': bench_move,
+    'render': bench_render,
+    'grid_storage': bench_grid_storage,
+    'autotile': bench_autotile,
+    'compiled': bench_compiled,
+    'retile': bench_retile,
+    'build_cache': bench_build_cache,
+    'spatial': bench_spatial,
+    'parallel': bench_parallel,
+    'tile_memory': bench_tile_memory,
+    'lazy': bench_lazy,
+    'import': bench_import,
+}
+
+
+def run(names, size=500, build_sizes=None, densities=None, import_budget=None):
+    """
+    Run the named benchmarks.
+
+    :param names: list
+    :param size: int
+    :param build_sizes: tuple
+    :param densities: tuple
+    :param import_budget: float
+    :return dict: The results of each benchmark by name.
+    """
+
+    results = {}
+    for name in names:
+        if name == 'build':
+            kwargs = {}
+            if build_sizes:
+                kwargs['sizes'] = build_sizes
+            if densities:
+                kwargs['densities'] = densities
+            results[name] = bench_build(**kwargs)
+        elif name == 'import':
+            results[name] = bench_import(budget_ms=import_budget) if import_budget else bench_import()
+        else:
+            results[name] = BENCHMARKS[name](size, size)
+    return results
+
+
+def report(name, results):
+    print(name)
+    for key, value in sorted(results.items()):
+        print('    %-20s %s' % (key, value))
+
+
+if __name__ == '__main__':
+    def numbers(kind):
+        return lambda text: tuple(kind(number) for number in text.split(','))
+
+    parser = argparse.ArgumentParser(description='Run the map benchmarks.')
+    parser.add_argument('size', nargs='?', type=int, default=500, help='height and width of the maps')
+    parser.add_argument('--only', type=lambda text: text.split(','), default=list(BENCHMARKS),
+                        help='comma separated benchmarks to run: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--build-sizes', type=numbers(int), help='map sizes for the build benchmark')
+    parser.add_argument('--densities', type=numbers(float), help='wall densities for the build benchmark')
+    parser.add_argument('--import-budget', type=float, metavar='MS',
+                        help='most milliseconds importing the core may take in the import benchmark')
+    parser.add_argument('--json', metavar='PATH', help='write the results as JSON, - for stdout')
+    args = parser.parse_args()
+
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(sorted(unknown)))
+
+    results = run(args.only, args.size, args.build_sizes, args.densities, args.import_budget)
+    if args.json is None:
+        for name, result in results.items():
+            report(name, result)
+    else:
+        output = json.dumps({
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'size': args.size,
+            'results': results,
+        }, indent=2, sort_keys=True)
+        if args.json == '-':
+            print(output)
+        else:
+            with open(args.json, 'w') as f:
+                f.write(output + '\n')
@@ -0,0 +1,134 @@
+"""
+Build the same few maps over and over without paying for a whole build every time, like an editor that
+builds its level again after every keystroke:
+
+    cache = BuildCache(map_objects)
+    game_map = cache.build(map_text)        # built from scratch the first time
+    game_map = cache.build(map_text)        # the same map, straight from the cache
+    game_map = cache.build(edited_text)     # only the edited rows(and the walls next to them) are rebuilt
+
+Maps are cached by a hash of their text and the map objects(see `key`).  When a text isn't in the cache,
+the most recently built map with the same map objects is turned into the new one by rebuilding only the
+rows that differ(see `MapBuilder.replace_rows`), so the time it takes depends on the size of the edit
+instead of the size of the map.  That map is changed in place and is no longer cached under its old text.
+"""
+import hashlib
+from collections import OrderedDict
+
+from editor import Map, MapBuilder
+
+
+def text_hash(map_text):
+    """
+    Get a digest of the map text.
+
+    :param map_text: str
+    :return bytes:
+    """
+
+    return hashlib.blake2b(map_text.encode('utf-8'), digest_size=16).digest()
+
+
+def changed_rows(old_rows, new_rows):
+    """
+    Get the rows of `new_rows` that differ from `old_rows`.  When rows were added or removed in the middle
+    every row from the first difference on counts as changed, since the rows below moved.
+
+    :param old_rows: list
+    :param new_rows: list
+    :return dict: {row number: line}
+    """
+
+    if len(old_rows) == len(new_rows):
+        return {y: line for y, (old, line) in enumerate(zip(old_rows, new_rows)) if old != line}
+
+    first = 0
+    for old, line in zip(old_rows, new_rows):
+        if old != line:
+            break
+        first += 1
+    return {y: new_rows[y] for y in range(first, len(new_rows))}
+
+
+class BuildCache(object):
+    """
+    Keeps the maps of the last `size` map texts built with the given map_objects.
+
+    new_map         -   Called to get an empty map for texts that can't be made from a cached map.
+    max_changed     -   Most changed rows, as a share of the rows of the map, to rebuild rows instead of
+                        building the map from scratch.
+
+    hits            -   Builds that were served from the cache.
+    updates         -   Builds that rebuilt the changed rows of a cached map.
+    misses          -   Builds from scratch.
+    """
+
+    def __init__(self, map_objects, size=8, new_map=Map, max_changed=0.5):
+        self.map_objects = map_objects
+        self.registry = MapBuilder.registry(map_objects)
+        self.size = size
+        self.new_map = new_map
+        self.max_changed = max_changed
+        # key -> (rows, game_map), the most recently used last.
+        self.entries = OrderedDict()
+        self.hits = self.updates = self.misses = 0
+
+    def key(self, map_text, map_objects=None):
+        """
+        Get the cache key of a map text built with the given map_objects(the cache's by default).
+
+        :param map_text: str
+        :param map_objects: dict
+        :return tuple:
+        """
+
+        registry = self.registry if map_objects is None else MapBuilder.registry(map_objects)
+        return text_hash(map_text), frozenset(registry.classes.items())
+
+    def build(self, map_text, map_objects=None):
+        """
+        Get the map for the map text, see `MapBuilder.build`.  Don't keep using a map returned earlier after
+        building another text: it may have been turned into the map of that text.
+
+        :param map_text: str
+        :param map_objects: dict
+        :return Map:
+        """
+
+        if map_objects is None:
+            map_objects = self.map_objects
+        key = self.key(map_text, map_objects)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        rows = list(MapBuilder.rows(map_text.split('\n')))
+        game_map = self.update(key[1], rows, map_objects)
+        if game_map is None:
+            game_map = MapBuilder.build(map_text, self.new_map(), map_objects)
+            self.misses += 1
+
+        self.entries[key] = rows, game_map
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return game_map
+
+    def update(self, classes, rows, map_objects):
+        # Turn the most recently used map with the same map objects into the map of the rows, if few enough
+        # of them changed.
+        for old_key, (old_rows, game_map) in reversed(self.entries.items()):
+            if old_key[1] != classes:
+                continue
+            lines = changed_rows(old_rows, rows)
+            if len(lines) > self.max_changed * max(len(rows), 1):
+                return None
+            del self.entries[old_key]
+            MapBuilder.replace_rows(game_map, lines, map_objects, len(rows))
+            self.updates += 1
+            return game_map
+        return None
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,168 @@
+"""
+Measure where the time of a map build goes.
+
+    stats = BuildStats()
+    MapBuilder.build(map_text, Map(), map_objects, stats=stats)
+    print(stats.report())
+
+Or from the command line, for a map file:
+
+    python buildstats.py level.txt [--json] [--no-memory]
+
+Builds without a BuildStats aren't measured at all.
+"""
+import json
+import timeit
+import tracemalloc
+from collections import Counter
+
+# The phases of a build in the order they happen.
+PHASES = ('tokens', 'lookup', 'autotile', 'objects', 'regions')
+
+
+class BuildStats(object):
+    """
+    Collects the timings of a build.  Pass it as `stats` to `MapBuilder.build`.
+
+    phases          -   Seconds spent in each phase:
+                            tokens      -   Reading the map text into the token grid.
+                            lookup      -   Finding the class for each token.
+                            autotile    -   Working out the characters of the walls.
+                            objects     -   Creating and placing the map objects.
+    counts          -   Number of cells placed for each class, `str` for tokens without a class.
+    cells           -   Number of cells placed.
+    seconds         -   Time the whole build took, including measuring it.
+    peak_memory     -   Most bytes allocated at once during the build, None when not measured.
+
+    memory          -   Measure the peak memory with tracemalloc.  Tracing allocations slows the build
+                        down considerably, so the timings of builds with memory=True are not comparable to
+                        builds without it.
+    callback        -   Called with the stats when the build is done.
+    """
+
+    clock = staticmethod(timeit.default_timer)
+
+    def __init__(self, memory=False, callback=None):
+        self.memory = memory
+        self.callback = callback
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.codes = Counter()
+        self.counts = {}
+        self.cells = 0
+        self.seconds = 0.0
+        self.peak_memory = None
+        self.started = self.last = None
+        self.traced = False
+
+    def start(self):
+        if self.memory:
+            # Leave tracing on if someone else started it.
+            self.traced = not tracemalloc.is_tracing()
+            if self.traced:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self.started = self.last = self.clock()
+
+    def lap(self, phase=None):
+        """
+        Add the time since the last lap to the given phase.  Without a phase the time is not counted.
+
+        :param phase: str
+        :return:
+        """
+
+        now = self.clock()
+        if phase is not None:
+            self.phases[phase] += now - self.last
+        self.last = now
+
+    def count(self, codes):
+        """
+        Count the token codes of placed cells.
+
+        :param codes: bytes
+        :return:
+        """
+
+        self.codes.update(codes)
+
+    def finish(self, game_map, registry):
+        """
+        Stop measuring and tell the callback.
+
+        :param game_map: Map
+        :param registry: TokenRegistry
+        :return:
+        """
+
+        self.seconds = self.clock() - self.started
+        if self.memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self.traced:
+                tracemalloc.stop()
+
+        classes = registry.for_symbols(game_map.tokens.symbols)
+        self.counts = {}
+        for code, count in self.codes.items():
+            if code:
+                map_object_class = classes[code] or str
+                self.counts[map_object_class] = self.counts.get(map_object_class, 0) + count
+        self.cells = sum(self.counts.values())
+
+        if self.callback is not None:
+            self.callback(self)
+
+    @property
+    def cells_per_second(self):
+        return self.cells / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'seconds': self.seconds,
+            'phases': dict(self.phases),
+            'cells': self.cells,
+            'cells_per_second': self.cells_per_second,
+            'counts': {map_object_class.__name__: count for map_object_class, count in self.counts.items()},
+            'peak_memory': self.peak_memory,
+        }
+
+    def report(self):
+        """
+        Get a human readable report of the build.
+
+        :return str:
+        """
+
+        lines = ['{} cells in {:.3f}s, {:,.0f} cells/s'.format(self.cells, self.seconds, self.cells_per_second)]
+        if self.peak_memory is not None:
+            lines.append('peak memory {:,.1f} KiB'.format(self.peak_memory / 1024))
+
+        lines.append('')
+        for phase in PHASES:
+            seconds = self.phases[phase]
+            share = seconds / self.seconds * 100 if self.seconds else 0.0
+            lines.append('{:<10} {:>9.3f}s {:>5.1f}%'.format(phase, seconds, share))
+
+        lines.append('')
+        for map_object_class, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            lines.append('{:<16} {:>10}'.format(map_object_class.__name__, count))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from editor import Map, MapBuilder
+    from map_objects import MAP_OBJECTS
+
+    parser = argparse.ArgumentParser(description='Build a map file and report where the time went.')
+    parser.add_argument('path', help='map file to build')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--no-memory', action='store_true', help="don't measure the peak memory")
+    args = parser.parse_args()
+
+    with open(args.path) as f:
+        text = f.read()
+    stats = BuildStats(memory=not args.no_memory)
+    MapBuilder.build(text, Map(), MAP_OBJECTS, stats=stats)
+    print(json.dumps(stats.as_dict(), indent=2) if args.json else stats.report())
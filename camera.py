@@ -0,0 +1,80 @@
+class Camera(object):
+    """
+    The part of the map that is on the screen.
+
+    `top` and `left` are the map coordinates shown in the top left corner of the screen, `height` and `width`
+    the size of the screen.  The camera can be scrolled by hand or told to keep an object(like the player)
+    on the screen:
+
+        camera = Camera(24, 80)
+        camera.follow(player, game_map)
+        renderer.draw(game_map, camera)
+
+    margin      -   How close(in cells) a followed object may get to the edge of the screen before the
+                    camera scrolls.  None keeps the object in the center of the screen.
+    """
+
+    def __init__(self, height, width, top=0, left=0, margin=None):
+        self.height, self.width = height, width
+        self.top, self.left = top, left
+        self.margin = margin
+
+    @property
+    def window(self):
+        return self.top, self.left, self.height, self.width
+
+    def to_screen(self, y, x):
+        return y - self.top, x - self.left
+
+    def to_map(self, y, x):
+        return y + self.top, x + self.left
+
+    def visible(self, y, x):
+        return self.top <= y < self.top + self.height and self.left <= x < self.left + self.width
+
+    def scroll(self, dy, dx, game_map=None):
+        """
+        Move the camera by the given number of cells.  With a game_map the camera stays on the map.
+
+        :param dy: int
+        :param dx: int
+        :param game_map: Map
+        :return:
+        """
+
+        self.move_to(self.top + dy, self.left + dx, game_map)
+
+    def move_to(self, top, left, game_map=None):
+        """
+        Put the top left corner of the camera at the given map coordinates.  With a game_map the camera
+        stays on the map.
+
+        :param top: int
+        :param left: int
+        :param game_map: Map
+        :return:
+        """
+
+        if game_map is not None:
+            top = max(min(top, game_map.height - self.height), 0)
+            left = max(min(left, game_map.width - self.width), 0)
+        self.top, self.left = top, left
+
+    def follow(self, target, game_map=None):
+        """
+        Scroll so the target(anything with `y` and `x`) is on the screen.
+
+        :param target: MapObject
+        :param game_map: Map
+        :return:
+        """
+
+        y, x = target.y, target.x
+        if self.margin is None:
+            top, left = y - self.height // 2, x - self.width // 2
+        else:
+            margin_y = min(self.margin, (self.height - 1) // 2)
+            margin_x = min(self.margin, (self.width - 1) // 2)
+            top = min(max(self.top, y + margin_y + 1 - self.height), y - margin_y)
+            left = min(max(self.left, x + margin_x + 1 - self.width), x - margin_x)
+        self.move_to(top, left, game_map)
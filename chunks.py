@@ -0,0 +1,248 @@
+import pickle
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from editor import Map, MapBuilder, TokenClasses
+from grid import TokenGrid, ObjectGrid, GridItems, GridValues
+
+
+class ChunkedMap(Map):
+    """
+    A Map for worlds that are too large to keep in memory.
+
+    The world is split into square chunks of `chunk_size` cells.  A chunk is built from the map file the
+    first time one of its cells is accessed and the least recently used chunks are dropped once more than
+    `max_chunks` are loaded.  Chunks that were changed(for example by `Ground.move`) are pickled into `store`
+    when they are dropped and loaded from there the next time they are needed, so no change is lost.
+
+        game_map = ChunkedMap('world.txt', map_objects, chunk_size=64, max_chunks=256)
+        game_map.objects[y, x].move(y, x + 1, game_map)
+
+    `tokens` and `objects` can be used just like the ones on a `Map`.  Iterating over them goes through the
+    map a chunk at a time, so it never needs more than one chunk loaded at once.
+
+    path            -   Path of the map file.
+
+    map_objects     -   A dictionary of map objects that have not been instantiated, or their TokenRegistry.
+
+    store           -   Where changed chunks are written back to.  Anything that maps str keys to bytes
+                        works, for example a `shelve` or `dbm` database for changes that don't fit into
+                        memory either.  Defaults to a dict.
+    """
+
+    def __init__(self, path, map_objects, chunk_size=64, max_chunks=64, store=None, encoding='utf-8'):
+        Map.__init__(self)
+        self.path = path
+        self.registry = MapBuilder.registry(map_objects)
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.store = {} if store is None else store
+        self.encoding = encoding
+
+        # Loaded chunks, least recently used first, and the keys of the ones that were changed.
+        self.chunks = OrderedDict()
+        self.dirty = set()
+
+        # Byte offset of every row in the map file, so any row can be read without going through the file.
+        self.file = open(path, 'rb')
+        self.offsets = array('Q')
+        self.line_width = 0
+        offset = 0
+        for line in self.file:
+            content = line.rstrip(b'\r\n')
+            if content:
+                self.offsets.append(offset)
+                self.line_width = max(self.line_width, len(content))
+            offset += len(line)
+
+        self.tokens = ChunkView(self, 'tokens')
+        self.objects = ChunkView(self, 'objects')
+
+    @property
+    def height(self):
+        return len(self.offsets)
+
+    @property
+    def width(self):
+        # Line lengths are counted in bytes, so this can be a little wider than the map.
+        return self.line_width
+
+    def chunk_count(self):
+        """
+        Get the number of chunk rows and chunk columns the map is split into.
+
+        :return tuple:
+        """
+
+        size = self.chunk_size
+        return -(-self.height // size), -(-self.width // size)
+
+    def read_row(self, y):
+        """
+        Read row `y` from the map file.
+
+        :param y: int
+        :return str:
+        """
+
+        if not 0 <= y < len(self.offsets):
+            return ''
+        self.file.seek(self.offsets[y])
+        line = self.file.readline().decode(self.encoding)
+        return line.rstrip('\r\n')
+
+    def chunk(self, chunk_y, chunk_x):
+        """
+        Get the chunk with the given chunk coordinates as a Map, loading it if needed.
+
+        :param chunk_y: int
+        :param chunk_x: int
+        :return Map:
+        """
+
+        key = chunk_y, chunk_x
+        chunks = self.chunks
+        try:
+            chunk = chunks[key]
+            chunks.move_to_end(key)
+            return chunk
+        except KeyError:
+            pass
+
+        rows, columns = self.chunk_count()
+        if not (0 <= chunk_y < rows and 0 <= chunk_x < columns):
+            raise KeyError(key)
+
+        while len(chunks) >= self.max_chunks:
+            self.evict(next(iter(chunks)))
+
+        stored = self.store.get(self.store_key(key))
+        chunk = pickle.loads(stored) if stored is not None else self.build_chunk(chunk_y, chunk_x)
+        chunks[key] = chunk
+        return chunk
+
+    def build_chunk(self, chunk_y, chunk_x):
+        """
+        Build a chunk from the map file.  The tokens one cell around the chunk are read as well, so the walls
+        along the edges of the chunk know about their neighbours.
+
+        :param chunk_y: int
+        :param chunk_x: int
+        :return Map:
+        """
+
+        size = self.chunk_size
+        top, left = chunk_y * size, chunk_x * size
+        halo_top, halo_left = max(top - 1, 0), max(left - 1, 0)
+
+        chunk = Map()
+        chunk.tokens = TokenGrid(origin=(halo_top, halo_left))
+        chunk.objects = ObjectGrid(origin=(top, left))
+        for y in range(halo_top, min(top + size + 1, self.height)):
+            chunk.tokens.set_row(y, self.read_row(y)[halo_left:left + size + 1], halo_left)
+
+        token_classes = TokenClasses(chunk, self.registry)
+        for y in range(top, min(top + size, self.height)):
+            MapBuilder.place_row(chunk, y, self.registry, (left, left + size), token_classes=token_classes)
+        return chunk
+
+    def evict(self, key):
+        """
+        Drop a loaded chunk, writing it to the store first if it was changed.
+
+        :param key: tuple
+        :return:
+        """
+
+        chunk = self.chunks.pop(key)
+        if key in self.dirty:
+            self.store[self.store_key(key)] = pickle.dumps(chunk, pickle.HIGHEST_PROTOCOL)
+            self.dirty.discard(key)
+
+    def flush(self):
+        """
+        Write every changed chunk to the store without dropping it.
+
+        :return:
+        """
+
+        for key in list(self.dirty):
+            self.store[self.store_key(key)] = pickle.dumps(self.chunks[key], pickle.HIGHEST_PROTOCOL)
+        self.dirty.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def store_key(key):
+        return '%d,%d' % key
+
+
+class ChunkView(MutableMapping):
+    """
+    The `tokens` or `objects` of a ChunkedMap.  Every cell is looked up in the chunk that holds it.
+    """
+
+    def __init__(self, chunked_map, name):
+        self.map = chunked_map
+        self.name = name
+
+    def grid(self, key, changing=False):
+        y, x = key
+        size = self.map.chunk_size
+        if y < 0 or x < 0:
+            raise KeyError(key)
+        chunk_key = y // size, x // size
+        grid = getattr(self.map.chunk(*chunk_key), self.name)
+        if changing:
+            self.map.dirty.add(chunk_key)
+        return grid
+
+    def __getitem__(self, key):
+        return self.grid(key)[key]
+
+    def __setitem__(self, key, value):
+        self.grid(key, changing=True)[key] = value
+
+    def __delitem__(self, key):
+        self.grid(key, changing=True).__delitem__(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except (KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def iter_items(self):
+        size = self.map.chunk_size
+        rows, columns = self.map.chunk_count()
+        for chunk_y in range(rows):
+            for chunk_x in range(columns):
+                top, left = chunk_y * size, chunk_x * size
+                grid = getattr(self.map.chunk(chunk_y, chunk_x), self.name)
+                for (y, x), value in grid.items():
+                    # The token grids include the cells around the chunk.
+                    if top <= y < top + size and left <= x < left + size:
+                        yield (y, x), value
+
+    def __iter__(self):
+        for key, _ in self.iter_items():
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self.iter_items())
+
+    def items(self):
+        return GridItems(self)
+
+    def values(self):
+        return GridValues(self)
@@ -0,0 +1,429 @@
+"""
+A compact binary format for built maps, so a map only has to be built(and its walls autotiled) once:
+
+    compiled.save(MapBuilder.build(map_text, Map(), map_objects), 'level.map')
+    game_map = compiled.load('level.map')
+
+Loading memory-maps the file.  The tokens are read straight from the mapping and the objects are created
+the first time their cell is accessed, so loading takes about the same time for any size of map.
+
+The file is laid out as(all numbers little-endian):
+
+    header      -   HEADER, see below.
+    meta        -   UTF-8 JSON with the token symbols, the class names and the glyph table.
+    tokens      -   One byte per cell, the token code(0 for cells that are not on the map).
+    classes     -   One byte per cell, 0 for no object, 1 for a plain token string and 2 or more for the
+                    class at that index in the class names.
+    glyphs      -   Two bytes per cell, the index into the glyph table of the object's
+                    (ch_number, drawing, color).  Plain token strings keep their string as the drawing.
+
+Every grid holds `height` rows of `width` cells and starts at an offset that is a multiple of 8.
+"""
+import importlib
+import json
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+from editor import Map
+from grid import TokenGrid, ObjectGrid, LazyObjectGrid
+
+MAGIC = b'2DTM'
+VERSION = 1
+# magic, version, reserved, height, width, token count, object count, meta length,
+# tokens offset, classes offset, glyphs offset
+HEADER = struct.Struct('<4sHHIIQQIQQQ')
+
+# Class ids with a special meaning.
+NO_OBJECT, TOKEN_STRING = 0, 1
+
+# The parts of a compiled map before they are laid out in the file, see `encode`.
+Encoded = namedtuple('Encoded', 'height width symbols class_names glyphs token_grid class_grid glyph_grid '
+                                'token_count object_count')
+
+
+def align(offset):
+    return (offset + 7) & ~7
+
+
+def class_name(map_object_class):
+    return '{}:{}'.format(map_object_class.__module__, map_object_class.__qualname__)
+
+
+def glyph(map_object):
+    """
+    Get the (ch_number, drawing, color) an object is displayed with.
+
+    :param map_object:
+    :return tuple:
+    """
+
+    if isinstance(map_object, str):
+        return None, map_object, None
+    return map_object.ch_number, map_object.drawing, map_object.color
+
+
+def dumps(game_map):
+    """
+    Compile the game_map into bytes.
+
+    :param game_map: Map
+    :return bytes:
+    """
+
+    return pack(encode(game_map))
+
+
+def encode(game_map, top=0, height=None, base=None, tokens=True):
+    """
+    Turn the rows of the game_map into the grids and tables of the compiled format.
+
+    top             -   First row to encode.
+    height          -   Number of rows to encode, all rows from `top` on by default.
+    base            -   Encoded map to start the class and glyph tables from, so classes and glyphs get the
+                        same ids in both and their grids can be compared directly.
+    tokens          -   Encode the tokens as well.  Without them(an empty token grid and symbol table) the
+                        map can have any number of distinct tokens, but the result can't be packed.
+
+    :param game_map: Map
+    :param top: int
+    :param height: int
+    :param base: Encoded
+    :param tokens: bool
+    :return Encoded:
+    """
+
+    map_tokens, objects = game_map.tokens, game_map.objects
+    # The map knows its size, its tokens and objects don't have to be grids(see `chunks.ChunkView`).
+    if height is None:
+        height = game_map.height - top
+    width = game_map.width
+
+    # Grids can be copied a row at a time, other mappings(like a ChunkedMap's) are read cell by cell.
+    copy_tokens = isinstance(map_tokens, TokenGrid) and map_tokens.origin == (0, 0)
+    copy_objects = isinstance(objects, ObjectGrid) and objects.origin == (0, 0)
+    symbols = list(map_tokens.symbols) if copy_tokens and tokens else [None]
+    if len(symbols) > 256:
+        # Token codes are stored in one byte per cell.
+        raise ValueError('The map has too many distinct tokens, classes or glyphs to compile.')
+    symbol_codes = {symbol: code for code, symbol in enumerate(symbols) if code}
+    class_names = [None, None]
+    class_ids = {}
+    glyphs = [[None, None, None]]
+    glyph_ids = {}
+    if base is not None:
+        class_names = list(base.class_names)
+        glyphs = list(base.glyphs)
+        glyph_ids = {tuple(entry): glyph_id for glyph_id, entry in enumerate(glyphs) if glyph_id}
+    name_ids = {name: class_id for class_id, name in enumerate(class_names) if class_id > TOKEN_STRING}
+
+    token_grid = bytearray(height * width if tokens else 0)
+    class_grid = bytearray(height * width)
+    glyph_grid = array('H', bytes(2 * height * width))
+    token_count = object_count = 0
+
+    for y in range(top, top + height):
+        start = (y - top) * width
+
+        if tokens and copy_tokens:
+            # The token codes of the map can be copied as they are.
+            row = map_tokens.row(y)
+            token_grid[start:start + len(row)] = row
+            token_count += len(row) - row.count(0)
+        elif tokens:
+            for x in range(width):
+                token = map_tokens.get((y, x))
+                if token is not None:
+                    code = symbol_codes.get(token)
+                    if code is None:
+                        code = symbol_codes[token] = len(symbols)
+                        symbols.append(token)
+                        if code > 255:
+                            raise ValueError('The map has too many distinct tokens, classes or glyphs to compile.')
+                    token_grid[start + x] = code
+                    token_count += 1
+
+        if copy_objects:
+            row = objects.row(y)
+        else:
+            row = [objects.get((y, x)) for x in range(width)]
+
+        for x, map_object in enumerate(row):
+            if map_object is None:
+                continue
+            object_count += 1
+            cell = start + x
+
+            if isinstance(map_object, str):
+                class_grid[cell] = TOKEN_STRING
+            else:
+                map_object_class = type(map_object)
+                class_id = class_ids.get(map_object_class)
+                if class_id is None:
+                    name = class_name(map_object_class)
+                    class_id = name_ids.get(name)
+                    if class_id is None:
+                        class_id = name_ids[name] = len(class_names)
+                        class_names.append(name)
+                    class_ids[map_object_class] = class_id
+                class_grid[cell] = class_id
+
+            key = glyph(map_object)
+            glyph_id = glyph_ids.get(key)
+            if glyph_id is None:
+                glyph_id = glyph_ids[key] = len(glyphs)
+                glyphs.append(list(key))
+            glyph_grid[cell] = glyph_id
+
+    return Encoded(height, width, symbols, class_names, glyphs, token_grid, class_grid, glyph_grid,
+                   token_count, object_count)
+
+
+def pack(encoded):
+    """
+    Lay out encoded grids(see `encode`) in the compiled format.
+
+    :param encoded: Encoded
+    :return bytes:
+    """
+
+    height, width, symbols, class_names, glyphs, token_grid, class_grid, glyph_grid, token_count, \
+        object_count = encoded
+    if len(symbols) > 256 or len(class_names) > 256 or len(glyphs) > 65536:
+        raise ValueError('The map has too many distinct tokens, classes or glyphs to compile.')
+    if sys.byteorder != 'little':
+        glyph_grid = array('H', glyph_grid)
+        glyph_grid.byteswap()
+
+    meta = json.dumps({'symbols': symbols, 'classes': class_names, 'glyphs': glyphs}).encode('utf-8')
+    tokens_offset = align(HEADER.size + len(meta))
+    classes_offset = align(tokens_offset + len(token_grid))
+    glyphs_offset = align(classes_offset + len(class_grid))
+
+    data = bytearray(glyphs_offset)
+    HEADER.pack_into(data, 0, MAGIC, VERSION, 0, height, width, token_count, object_count, len(meta),
+                     tokens_offset, classes_offset, glyphs_offset)
+    data[HEADER.size:HEADER.size + len(meta)] = meta
+    data[tokens_offset:tokens_offset + len(token_grid)] = token_grid
+    data[classes_offset:classes_offset + len(class_grid)] = class_grid
+    data += glyph_grid.tobytes()
+    return bytes(data)
+
+
+def save(game_map, path):
+    """
+    Compile the game_map into the file at `path`.
+
+    :param game_map: Map
+    :param path: str
+    :return:
+    """
+
+    with open(path, 'wb') as f:
+        f.write(dumps(game_map))
+
+
+def load(path, map_objects=None):
+    """
+    Load a compiled map file by memory-mapping it.
+
+    map_objects     -   Optional dict of map objects(or TokenRegistry) to take the classes from.  Classes
+                        that aren't in it are imported by name.
+
+    :param path: str
+    :param map_objects: dict
+    :return CompiledMap:
+    """
+
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return CompiledMap(buffer, map_objects)
+
+
+def loads(data, map_objects=None):
+    """
+    Load a compiled map from bytes(or anything else supporting the buffer protocol).
+
+    :param data: bytes
+    :param map_objects: dict
+    :return CompiledMap:
+    """
+
+    return CompiledMap(data, map_objects)
+
+
+def resolve(name, known):
+    if name in known:
+        return known[name]
+    module_name, _, qualname = name.partition(':')
+    resolved = importlib.import_module(module_name)
+    for attribute in qualname.split('.'):
+        resolved = getattr(resolved, attribute)
+    return resolved
+
+
+def resolve_classes(class_names, map_objects=None):
+    """
+    Get the class for every id of a class table(see `encode`).  The NO_OBJECT and TOKEN_STRING ids get None.
+
+    map_objects     -   Optional dict of map objects(or TokenRegistry) to take the classes from.  Classes
+                        that aren't in it are imported by name.
+
+    :param class_names: list
+    :param map_objects: dict
+    :return list:
+    """
+
+    known = {}
+    if map_objects is not None:
+        for map_object_class in getattr(map_objects, 'map_objects', map_objects).values():
+            known[class_name(map_object_class)] = map_object_class
+    return [None, None] + [resolve(name, known) for name in class_names[2:]]
+
+
+def restore_glyph(map_object, glyph):
+    """
+    Give the map_object the (ch_number, drawing, color) it was encoded with.  Only the attributes that
+    differ are set, so objects drawn like their class don't get their own copies.
+
+    :param map_object: MapObject
+    :param glyph: tuple
+    :return:
+    """
+
+    ch_number, drawing, color = glyph
+    if map_object.ch_number != ch_number:
+        map_object.ch_number = ch_number
+    if map_object.drawing != drawing:
+        map_object.drawing = drawing
+    if map_object.color != color:
+        map_object.color = color
+
+
+class CompiledMap(Map):
+    """
+    A Map loaded from the compiled format.  It is used like any other Map; `buffer` is the memory-mapped
+    file(or bytes) it reads from.
+    """
+
+    def __init__(self, buffer, map_objects=None):
+        Map.__init__(self)
+        self.buffer = buffer
+        view = memoryview(buffer)
+
+        (magic, version, _, height, width, token_count, object_count, meta_length,
+         tokens_offset, classes_offset, glyphs_offset) = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a compiled map.')
+        if version != VERSION:
+            raise ValueError('Unsupported compiled map version {}.'.format(version))
+
+        meta = json.loads(bytes(view[HEADER.size:HEADER.size + meta_length]).decode('utf-8'))
+        cells = height * width
+
+        classes = resolve_classes(meta['classes'], map_objects)
+        glyphs = [tuple(entry) for entry in meta['glyphs']]
+
+        glyph_grid = view[glyphs_offset:glyphs_offset + 2 * cells]
+        if sys.byteorder == 'little':
+            glyph_grid = glyph_grid.cast('H')
+        else:
+            glyph_grid = array('H', glyph_grid)
+            glyph_grid.byteswap()
+
+        self.tokens = MappedTokenGrid(view[tokens_offset:tokens_offset + cells], height, width,
+                                      meta['symbols'], token_count)
+        self.objects = CompiledObjectGrid(view[classes_offset:classes_offset + cells], glyph_grid,
+                                          classes, glyphs, height, width, object_count)
+
+    def close(self):
+        self.tokens.release()
+        self.objects.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+class MappedTokenGrid(TokenGrid):
+    """
+    A TokenGrid whose rows are slices of the compiled map.  A row is copied the first time it is changed.
+    """
+
+    def __init__(self, view, height, width, symbols, count):
+        TokenGrid.__init__(self)
+        for symbol in symbols[1:]:
+            self.code(symbol)
+        self.rows = [view[y * width:(y + 1) * width] for y in range(height)]
+        self.count = count
+
+    def row(self, y):
+        row = TokenGrid.row(self, y)
+        if isinstance(row, memoryview):
+            # The autotiling needs the bytearray methods.
+            return bytearray(row)
+        return row
+
+    def writable(self, key):
+        y = key[0] - self.origin[0]
+        if 0 <= y < len(self.rows) and isinstance(self.rows[y], memoryview):
+            self.rows[y] = bytearray(self.rows[y])
+
+    def __setitem__(self, key, value):
+        self.writable(key)
+        TokenGrid.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.writable(key)
+        TokenGrid.__delitem__(self, key)
+
+    def set_row(self, y, line, column=0):
+        self.writable((y, column))
+        TokenGrid.set_row(self, y, line, column)
+
+    def delete_row(self, y):
+        self.writable((y, 0))
+        TokenGrid.delete_row(self, y)
+
+    def truncate(self, height):
+        first_row = self.origin[0]
+        for y in range(height, len(self.rows)):
+            self.writable((first_row + y, 0))
+        TokenGrid.truncate(self, height)
+
+    def release(self):
+        self.rows = [bytearray(row) if isinstance(row, memoryview) else row for row in self.rows]
+
+
+class CompiledObjectGrid(LazyObjectGrid):
+    """
+    Creates the objects of a compiled map from its class and glyph grids as they are accessed.
+    """
+
+    def __init__(self, class_grid, glyph_grid, classes, glyphs, height, width, count):
+        LazyObjectGrid.__init__(self, [width] * height, count)
+        self.class_grid = class_grid
+        self.glyph_grid = glyph_grid
+        self.classes = classes
+        self.glyphs = glyphs
+        self.row_width = width
+
+    def load(self, y, x):
+        cell = y * self.row_width + x
+        class_id = self.class_grid[cell]
+        if class_id == NO_OBJECT:
+            return None
+
+        glyph = self.glyphs[self.glyph_grid[cell]]
+        if class_id == TOKEN_STRING:
+            return glyph[1]
+
+        map_object = self.classes[class_id](y, x)
+        restore_glyph(map_object, glyph)
+        return map_object
+
+    def release(self):
+        # Create every object, so the grids no longer need the mapping.
+        for y in range(len(self.rows)):
+            self.row(y)
+        self.class_grid = self.glyph_grid = None
@@ -0,0 +1,25 @@
+"""
+The headless core: everything needed to build maps and move things around on them, without a terminal.
+
+    from core import Map, MapBuilder, MAP_OBJECTS
+
+    game_map = MapBuilder.build(map_text, Map(), MAP_OBJECTS)
+
+Importing it only loads the map modules themselves(`editor`, `map_objects`, `grid`, `registry` and
+`autotile`) and never curses, so servers and workers that build maps start quickly.  The optional parts of
+a map(its spatial index, transactions and regions) are imported the first time they are used, and terminal
+rendering lives in `renderer` and `terminal`.  `benchmarks.py --only import` checks that this stays true
+and how long the import takes.
+"""
+from editor import Map, MapBuilder, TokenObjectGrid
+from map_objects import (
+    MAP_OBJECTS, EmptyTile, Ground, MapObject, Treasure, Food, Wall, Door, VerticalDoor, HorizontalDoor, Water,
+)
+from registry import TokenRegistry, DuplicateTokenError
+
+__all__ = [
+    'Map', 'MapBuilder', 'TokenObjectGrid',
+    'MAP_OBJECTS', 'EmptyTile', 'Ground', 'MapObject', 'Treasure', 'Food', 'Wall', 'Door', 'VerticalDoor',
+    'HorizontalDoor', 'Water',
+    'TokenRegistry', 'DuplicateTokenError',
+]
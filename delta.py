@@ -0,0 +1,253 @@
+"""
+Binary diffs between states of a map, to send only what changed to remote copies of it.
+
+    seen = delta.snapshot(game_map)
+    ...                                     # objects move around
+    data = delta.diff(seen, game_map)       # bytes
+    delta.patch(remote_map, data)           # remote_map now looks like game_map
+
+With a `transaction.ChangeJournal` on the map the diff only looks at the cells that changed since the
+version the snapshot(or plain version number) was taken at:
+
+    journal = ChangeJournal(game_map)
+    version = game_map.version
+    ...
+    data = delta.diff(version, game_map, journal)
+
+Without a journal(or when it doesn't go back far enough) both states are compared a row of class and
+glyph ids at a time, only rows that differ are looked at cell by cell.
+
+A patch is laid out as(all numbers little-endian):
+
+    header      -   HEADER, see below.
+    meta        -   UTF-8 JSON with the class names and the glyph table of the patch(see `compiled`).
+    runs        -   For each run of changed cells next to each other in a row: RUN(y, x, length),
+                    followed by CELLS(count, class id, glyph id) entries giving the class and glyph of the
+                    next `count` cells, until all `length` cells are covered.
+"""
+import json
+import struct
+
+import compiled
+from compiled import NO_OBJECT, TOKEN_STRING
+
+MAGIC = b'2DTD'
+VERSION = 1
+# magic, version, reserved, height, width, from version, to version, meta length, run count
+HEADER = struct.Struct('<4sHHIIQQII')
+RUN = struct.Struct('<IIH')
+CELLS = struct.Struct('<HBH')
+
+
+class Snapshot(object):
+    """
+    The state of a map at one version, as compiled class and glyph grids(see `compiled.encode`).
+    """
+
+    def __init__(self, encoded, version):
+        self.encoded = encoded
+        self.version = version
+
+
+def snapshot(game_map):
+    """
+    Take a snapshot of the game_map to diff against later.
+
+    :param game_map: Map
+    :return Snapshot:
+    """
+
+    # Patches only carry the objects, so the tokens(and their limit of 256 distinct ones) are left out.
+    return Snapshot(compiled.encode(game_map, tokens=False), game_map.version)
+
+
+def changed_cells(old, new):
+    """
+    Compare two encoded maps that share their class and glyph ids.
+
+    :param old: compiled.Encoded
+    :param new: compiled.Encoded
+    :return list: The (y, x) of every cell whose class or glyph differs, in row-major order.
+    """
+
+    cells = []
+    old_width, new_width = old.width, new.width
+    width = max(old_width, new_width)
+    padding = bytes(width)
+    old_glyphs = memoryview(old.glyph_grid).cast('B')
+    new_glyphs = memoryview(new.glyph_grid).cast('B')
+
+    def row(encoded, glyph_bytes, row_width, y):
+        if y >= encoded.height:
+            return padding, padding + padding
+        start = y * row_width
+        classes = bytes(encoded.class_grid[start:start + row_width]) + padding[row_width:]
+        glyphs = bytes(glyph_bytes[2 * start:2 * (start + row_width)]) + padding[row_width:] * 2
+        return classes, glyphs
+
+    for y in range(max(old.height, new.height)):
+        old_classes, old_glyph_row = row(old, old_glyphs, old_width, y)
+        new_classes, new_glyph_row = row(new, new_glyphs, new_width, y)
+        if old_classes == new_classes and old_glyph_row == new_glyph_row:
+            continue
+        for x in range(width):
+            if (old_classes[x] != new_classes[x]
+                    or old_glyph_row[2 * x:2 * x + 2] != new_glyph_row[2 * x:2 * x + 2]):
+                cells.append((y, x))
+    return cells
+
+
+def diff(old, new, journal=None):
+    """
+    Get the patch that turns the old state of a map into the game_map `new`.
+
+    old             -   A Snapshot of the old state(of the same or another map), or the version of `new`
+                        it was at when a journal is given.
+    journal         -   ChangeJournal watching `new`, to only look at the cells changed since the old
+                        version.
+
+    :param old: Snapshot or int
+    :param new: Map
+    :param journal: ChangeJournal
+    :return bytes:
+    """
+
+    version = old if isinstance(old, int) else old.version
+    cells = journal.since(version) if journal is not None else None
+    if cells is not None:
+        cells = sorted(cells)
+    elif isinstance(old, Snapshot):
+        cells = changed_cells(old.encoded, compiled.encode(new, base=old.encoded, tokens=False))
+    else:
+        raise ValueError('The journal does not go back to version {}, diff against a snapshot.'.format(version))
+    return encode_patch(new, cells, version)
+
+
+def encode_patch(game_map, cells, from_version=0):
+    """
+    Write the patch setting the given cells to what they hold on the game_map.
+
+    :param game_map: Map
+    :param cells: list
+    :param from_version: int
+    :return bytes:
+    """
+
+    objects = game_map.objects
+    class_names = [None, None]
+    class_ids = {}
+    glyphs = [[None, None, None]]
+    glyph_ids = {}
+    runs = []
+    run_count = 0
+
+    def value(cell):
+        map_object = objects.get(cell)
+        if map_object is None:
+            return NO_OBJECT, 0
+        if isinstance(map_object, str):
+            class_id = TOKEN_STRING
+        else:
+            map_object_class = type(map_object)
+            class_id = class_ids.get(map_object_class)
+            if class_id is None:
+                class_id = class_ids[map_object_class] = len(class_names)
+                class_names.append(compiled.class_name(map_object_class))
+        key = compiled.glyph(map_object)
+        glyph_id = glyph_ids.get(key)
+        if glyph_id is None:
+            glyph_id = glyph_ids[key] = len(glyphs)
+            glyphs.append(list(key))
+        return class_id, glyph_id
+
+    index = 0
+    while index < len(cells):
+        # A run goes on while the next cell is right of the last one, up to what fits in its length.
+        y, x = cells[index]
+        end = index + 1
+        while (end < len(cells) and end - index < 0xffff
+               and cells[end][0] == y and cells[end][1] == x + end - index):
+            end += 1
+
+        entries = []
+        for cell in cells[index:end]:
+            cell_value = value(cell)
+            if entries and entries[-1][1] == cell_value and entries[-1][0] < 0xffff:
+                entries[-1][0] += 1
+            else:
+                entries.append([1, cell_value])
+        runs.append(RUN.pack(y, x, end - index))
+        run_count += 1
+        runs.extend(CELLS.pack(count, class_id, glyph_id) for count, (class_id, glyph_id) in entries)
+        index = end
+
+    if len(class_names) > 256 or len(glyphs) > 65536:
+        raise ValueError('The patch has too many distinct classes or glyphs.')
+
+    meta = json.dumps({'classes': class_names, 'glyphs': glyphs}).encode('utf-8')
+    header = HEADER.pack(MAGIC, VERSION, 0, game_map.height, game_map.width, from_version, game_map.version,
+                         len(meta), run_count)
+    return header + meta + b''.join(runs)
+
+
+def patch(game_map, data, map_objects=None):
+    """
+    Apply a patch made by `diff` to the game_map.  The map is told about the changed cells(see
+    `Map.changed`), so its tokens and walls are updated and its watchers notified.
+
+    map_objects     -   Optional dict of map objects(or TokenRegistry) to take the classes from.  Classes
+                        that aren't in it are imported by name.
+
+    :param game_map: Map
+    :param data: bytes
+    :param map_objects: dict
+    :return list: The cells that changed.
+    """
+
+    view = memoryview(data)
+    magic, version, _, _, _, _, _, meta_length, run_count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError('Not a map patch.')
+    if version != VERSION:
+        raise ValueError('Unsupported map patch version {}.'.format(version))
+
+    offset = HEADER.size
+    meta = json.loads(bytes(view[offset:offset + meta_length]).decode('utf-8'))
+    offset += meta_length
+
+    classes = compiled.resolve_classes(meta['classes'], map_objects)
+    glyphs = [tuple(entry) for entry in meta['glyphs']]
+
+    objects = game_map.objects
+    cells = []
+    for _ in range(run_count):
+        y, x, length = RUN.unpack_from(view, offset)
+        offset += RUN.size
+        end = x + length
+        while x < end:
+            count, class_id, glyph_id = CELLS.unpack_from(view, offset)
+            offset += CELLS.size
+            for cell_x in range(x, x + count):
+                set_cell(game_map, objects, y, cell_x, classes[class_id], class_id, glyphs[glyph_id])
+                cells.append((y, cell_x))
+            x += count
+
+    if not cells:
+        return []
+    return game_map.changed(*cells)
+
+
+def set_cell(game_map, objects, y, x, map_object_class, class_id, cell_glyph):
+    if class_id == NO_OBJECT:
+        objects.pop((y, x), None)
+        return
+    if class_id == TOKEN_STRING:
+        objects[y, x] = cell_glyph[1]
+        return
+
+    map_object = map_object_class.create(y, x, game_map)
+    if map_object.is_flyweight() and (map_object.ch_number, map_object.drawing, map_object.color) != cell_glyph:
+        # The shared tile is drawn differently, the cell gets its own.
+        map_object = map_object_class(y, x)
+    compiled.restore_glyph(map_object, cell_glyph)
+    objects[y, x] = map_object
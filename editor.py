@@ -1,5 +1,13 @@
 
 
+import os
+
+from autotile import row_masks, autotiles, retile
+from grid import TokenGrid, ObjectGrid, LazyObjectGrid
+from map_objects import EmptyTile, Wall
+from registry import TokenRegistry
+
+
 class Map(object):
     """
     Container that holds all the objects on the game map.
@@ -13,11 +21,266 @@ class Map(object):
         if isinstance(self.objects[y, x], Treasure):
             # do something
             pass
+
+    `tokens` and `objects` are `grid.Grid`s: they are stored densely, row by row, but are indexed with
+    `(y, x)` tuples just like a dict.
+
+    flyweights      -   Put one shared instance of each stateless tile(floor, water, doors) into every cell
+                        that holds one, instead of an instance per cell.  Shared tiles don't know their
+                        position, use `materialize` to get a tile of its own before moving one.
+    lazy            -   Only keep the tokens when the map is built, and create the object of a cell the
+                        first time it is accessed(see `TokenObjectGrid`).  Building is then only as slow as
+                        reading the text, and only the cells that are drawn, moved or looked at ever get an
+                        object.
     """
-    def __init__(self):
+    def __init__(self, flyweights=False, lazy=False):
         # Container to hold coordinates.
-        self.tokens = {}
-        self.objects = {}
+        self.tokens = TokenGrid()
+        self.objects = ObjectGrid()
+        # Share one instance between all cells of the stateless tiles, see `EmptyTile.flyweight`.
+        self.flyweights = flyweights
+        # Create objects as they are accessed, see `TokenObjectGrid`.
+        self.lazy = lazy
+        # Callbacks that are told about changed cells, see `watch`.
+        self.watchers = []
+        # Created the first time it is asked for, see `spatial_index`.
+        self.index = None
+        # Goes up by one every time the map is told about changes, see `changed`.
+        self.version = 0
+        # Rooms and doors of the map, see `MapBuilder.build`.
+        self.regions = None
+
+    @property
+    def height(self):
+        return self.objects.height
+
+    @property
+    def width(self):
+        return self.objects.width
+
+    def materialize(self, y, x):
+        """
+        Get the object at the given cell, replacing it with an instance of its own first if it is a shared
+        flyweight.
+
+        :param y: int
+        :param x: int
+        :return:
+        """
+
+        map_object = self.objects[y, x]
+        if not isinstance(map_object, str) and map_object.is_flyweight():
+            map_object = self.objects[y, x] = type(map_object)(y, x)
+        return map_object
+
+    def spatial_index(self, **kwargs):
+        """
+        Get the map's `spatial.SpatialIndex`, to find objects by class and position without going through
+        every cell.  It is built the first time it is asked for(the keyword arguments are passed to it) and
+        kept up to date as objects are placed and moved.
+
+            for y, x in game_map.spatial_index().within(Treasure, player.y, player.x, 10):
+                pass
+
+        :return SpatialIndex:
+        """
+
+        if self.index is None:
+            from spatial import SpatialIndex
+
+            self.index = SpatialIndex(self, **kwargs)
+        return self.index
+
+    def transaction(self):
+        """
+        Start a batch of moves that are checked and made together, see `transaction.Transaction`.
+
+            with game_map.transaction() as moves:
+                moves.move(treasure, treasure.y + 1, treasure.x)
+
+        :return Transaction:
+        """
+
+        from transaction import Transaction
+
+        return Transaction(self)
+
+    def watch(self, callback):
+        """
+        Call `callback(game_map, cells)` with the list of changed (y, x) cells every time objects on the map
+        are moved, placed or removed(see `changed`).
+
+        :param callback: callable
+        :return:
+        """
+
+        self.watchers.append(callback)
+
+    def unwatch(self, callback):
+        self.watchers.remove(callback)
+
+    def changed(self, *cells):
+        """
+        Tell the map that the objects at the given (y, x) cells were replaced.  The tokens of the cells are
+        updated to match their objects, the walls on and next to the cells pick their characters again and
+        the watchers are told about every cell that changed.  `Ground.move` and `MapBuilder.place_token`
+        call this for you.  Every call is a new `version` of the map.
+
+        :return list: The cells that changed, including walls that changed their character.
+        """
+
+        tokens = self.tokens
+        get, get_token = self.objects.get, tokens.get
+        touched = set()
+        for cell in cells:
+            map_object = get(cell)
+            if isinstance(map_object, str):
+                token = map_object
+            else:
+                token = getattr(map_object, 'token', None)
+                if not isinstance(token, str):
+                    token = None
+            old = get_token(cell)
+            if old != token:
+                if token is None:
+                    del tokens[cell]
+                else:
+                    tokens[cell] = token
+                if old == '#' or token == '#':
+                    # A wall came or went, the walls around the cell have to look again.
+                    y, x = cell
+                    touched.update((cell, (y - 1, x), (y + 1, x), (y, x + 1), (y, x - 1)))
+                    continue
+            if isinstance(map_object, Wall):
+                touched.add(cell)
+
+        changed = list(cells)
+        for cell in touched:
+            if retile(self, cell) and cell not in cells:
+                changed.append(cell)
+
+        self.version += 1
+        for callback in self.watchers:
+            callback(self, changed)
+        return changed
+
+    def viewport(self, top, left, height, width):
+        """
+        Get the objects inside a window of the map as ((y, x), map_object) pairs in row-major order.  Only
+        the cells inside the window are looked at, so this is cheap no matter how large the map is:
+
+            for (y, x), map_object in game_map.viewport(camera_y, camera_x, 24, 80):
+                pass
+
+        :param top: int
+        :param left: int
+        :param height: int
+        :param width: int
+        :return generator:
+        """
+
+        window = getattr(self.objects, 'window', None)
+        if window is not None:
+            return window(top, left, height, width)
+        return self.viewport_cells(top, left, height, width)
+
+    def viewport_cells(self, top, left, height, width):
+        # Look up every cell for containers that can't hand out windows.
+        get = self.objects.get
+        for y in range(max(top, 0), top + height):
+            for x in range(max(left, 0), left + width):
+                map_object = get((y, x))
+                if map_object is not None:
+                    yield (y, x), map_object
+
+
+class TokenClasses(object):
+    """
+    The map object class of every token code of a game_map's tokens(see `TokenRegistry.for_symbols`), if
+    walls of that class are autotiled and its shared instance when the map uses flyweights, so cells are
+    dispatched by their code with list indexes.  Edits and streamed rows can add tokens to the map, `update`
+    adds their codes; the lists only grow, so they can be kept around while a map is built.
+    """
+
+    def __init__(self, game_map, registry):
+        self.map = game_map
+        self.registry = registry
+        self.classes = []
+        self.autotiled = []
+        self.shared = []
+        self.update()
+
+    def update(self):
+        """
+        Add the codes of the tokens the map got since the last update.
+
+        :return:
+        """
+
+        symbols = self.map.tokens.symbols
+        known = len(self.classes)
+        if len(symbols) == known:
+            return
+        classes = self.registry.for_symbols(symbols[known:])
+        flyweights = self.map.flyweights
+        self.classes.extend(classes)
+        self.autotiled.extend(autotiles(map_object) for map_object in classes)
+        self.shared.extend(
+            map_object.flyweight() if flyweights and map_object and map_object.uses_flyweight() else None
+            for map_object in classes
+        )
+
+
+class TokenObjectGrid(LazyObjectGrid):
+    """
+    The objects of a lazy Map(see `Map.lazy`), created from the map's tokens the first time their cell is
+    accessed.  Walls pick their character from the tokens around them when they are created, so a wall
+    looks the same as if the whole map had been built at once.
+
+    Objects of classes with a `place` method of their own(other than the walls) can't be created this way
+    and are placed when the map is built.
+    """
+
+    def __init__(self, game_map, registry):
+        tokens = game_map.tokens
+        LazyObjectGrid.__init__(self, [len(row) for row in tokens.rows], len(tokens), tokens.origin)
+        self.map = game_map
+        self.registry = registry
+        # The lists of `token_classes` grow in place as edits add tokens.
+        self.token_classes = TokenClasses(game_map, registry)
+        self.classes = self.token_classes.classes
+        self.autotiled = self.token_classes.autotiled
+        self.shared = self.token_classes.shared
+
+    def eager_codes(self):
+        """
+        Get the token codes whose objects have to be placed when the map is built.
+
+        :return list:
+        """
+
+        return [code for code, map_object in enumerate(self.classes)
+                if map_object is not None and not self.autotiled[code] and map_object.place is not EmptyTile.place]
+
+    def load(self, y, x):
+        tokens = self.map.tokens
+        row = tokens.row(y)
+        column = x - tokens.origin[1]
+        code = row[column] if 0 <= column < len(row) else 0
+        if not code:
+            return None
+        if code >= len(self.classes):
+            self.token_classes.update()
+
+        map_object = self.classes[code]
+        if map_object is None:
+            return tokens.symbols[code]
+        if self.shared[code] is not None:
+            return self.shared[code]
+        obj = map_object(y, x)
+        if self.autotiled[code]:
+            obj.set_mask(map_object.border_mask(y, x, self.map))
+        return obj
 
 
 class MapBuilder(object):
@@ -28,7 +291,7 @@ class MapBuilder(object):
     """
 
     @staticmethod
-    def build(map_text, game_map, map_objects):
+    def build(map_text, game_map, map_objects, stats=None, regions=False):
         """
         Populate the game_map with the given map_objects, based on the tokens in the map_text.
 
@@ -37,50 +300,339 @@ class MapBuilder(object):
 
         game_map        -   Map object with a `tokens` attribute and an `objects` attribute.
 
-        map_objects     -   A dictionary of map objects that have not been instantiated.
+        map_objects     -   A dictionary of map objects that have not been instantiated, or the
+                            TokenRegistry for them(see `MapBuilder.registry`).
+
+        stats           -   Optional `buildstats.BuildStats` to measure the build with.
+
+        regions         -   Find the rooms of the map and the doors between them once it is built, and keep
+                            them as `game_map.regions`(see `regions.Regions`).
 
         :param map_text: str
         :param game_map: Map
         :param map_objects: dict
+        :param stats: BuildStats
+        :param regions: bool
         :return game_map: Map
         """
 
+        if regions:
+            from regions import Regions
+
+        if stats is None:
+            MapBuilder.place_tokens(map_text, game_map)
+            MapBuilder.place_objects(game_map, map_objects)
+            if regions:
+                game_map.regions = Regions(game_map)
+            return game_map
+
+        stats.start()
         MapBuilder.place_tokens(map_text, game_map)
-        MapBuilder.place_objects(game_map, map_objects)
+        stats.lap('tokens')
+        MapBuilder.place_objects(game_map, map_objects, stats)
+        if regions:
+            game_map.regions = Regions(game_map)
+            stats.lap('regions')
+        stats.finish(game_map, MapBuilder.registry(map_objects))
 
         return game_map
 
     @staticmethod
-    def place_objects(game_map, map_objects):
+    def build_stream(source, game_map, map_objects):
+        """
+        Populate the game_map like `build`, but read the map text line by line from a file instead of
+        needing all of it as one string.  Each row's objects are placed as soon as the row below it has
+        been read, so only the current line is held besides the game_map itself.  Use this for map files
+        that are too large to comfortably read into memory.
+
+        source          -   Path of a map file or a text stream(anything that iterates over lines).
+
+        :param source: str or file
+        :param game_map: Map
+        :param map_objects: dict
+        :return game_map: Map
+        """
+
+        if isinstance(source, (str, bytes, os.PathLike)):
+            with open(source) as stream:
+                return MapBuilder.build_stream(stream, game_map, map_objects)
+
+        registry = MapBuilder.registry(map_objects)
+        if getattr(game_map, 'lazy', False):
+            # Only the tokens are read, the objects are created as they are accessed.
+            for row_number, row in enumerate(MapBuilder.rows(source)):
+                game_map.tokens.set_row(row_number, row)
+            MapBuilder.place_lazy(game_map, registry)
+            return game_map
+
+        token_classes = TokenClasses(game_map, registry)
+        row_number = -1
+        for row_number, row in enumerate(MapBuilder.rows(source)):
+            game_map.tokens.set_row(row_number, row)
+            # The row above is complete now that its southern neighbours are known.
+            if row_number > 0:
+                MapBuilder.place_row(game_map, row_number - 1, registry, token_classes=token_classes)
+
+        if row_number >= 0:
+            MapBuilder.place_row(game_map, row_number, registry, token_classes=token_classes)
+
+        return game_map
+
+    @staticmethod
+    def build_parallel(map_text, map_objects, processes=None, band_height=None):
+        """
+        Build a large map on all cores by cutting it into bands of rows, see `parallel.build_bands`.  The
+        map is the same as the one `build` makes, loaded from the compiled format(see `compiled.CompiledMap`).
+
+        :param map_text: str
+        :param map_objects: dict
+        :param processes: int
+        :param band_height: int
+        :return CompiledMap:
+        """
+
+        import parallel
+
+        return parallel.build_bands(map_text, map_objects, processes, band_height)
+
+    @staticmethod
+    def rows(lines):
+        """
+        Get the rows of a map from an iterable of lines, leaving out empty lines the same way `build` does.
+
+        :param lines: iterable
+        :return generator:
+        """
+
+        for line in lines:
+            if line.endswith('\n'):
+                line = line[:-1]
+            if line != '':
+                yield line
+
+    @staticmethod
+    def registry(map_objects):
+        """
+        Get the TokenRegistry for the given map_objects.  The registry is built once per set of map objects
+        and reused by every build that uses the same set.  Raises a registry.DuplicateTokenError when two
+        of the map objects share a token.
+
+        :param map_objects: dict or TokenRegistry
+        :return TokenRegistry:
+        """
+
+        return TokenRegistry.of(map_objects)
+
+    @staticmethod
+    def place_token(game_map, y, x, token, map_objects):
+        """
+        Change a single cell of an already built game_map to the given token, placing its object(or the token
+        itself if no map object uses it).  Walls around the cell are autotiled again, so adding, removing or
+        replacing walls this way keeps the map looking the same as building it from scratch.  A token of None
+        removes the cell from the map.
+
+        :param game_map: Map
+        :param y: int
+        :param x: int
+        :param token: str
+        :param map_objects: dict
+        :return:
+        """
+
+        # `changed` below puts the token in, so it can tell if a wall came or went.
+        if token is None:
+            game_map.objects.pop((y, x), None)
+        else:
+            map_object = MapBuilder.registry(map_objects).get(token)
+            if map_object is None:
+                game_map.objects[y, x] = token
+            elif game_map.flyweights and map_object.uses_flyweight():
+                game_map.objects[y, x] = map_object.flyweight()
+            elif autotiles(map_object) or map_object.place is EmptyTile.place:
+                # `changed` below autotiles the cell, placing it would tell the watchers twice.
+                game_map.objects[y, x] = map_object(y, x)
+            else:
+                map_object(y, x).place(game_map)
+
+        game_map.changed((y, x))
+
+    @staticmethod
+    def place_objects(game_map, map_objects, stats=None):
         """
         Place the map_objects onto the game_map.
 
         :return:
         """
 
-        # Get a list of map_object_tokens
-        map_object_tokens = []
-        map_objects_list = list(map_objects.values())
-        if map_objects is not None:
-            map_object_tokens = [map_object.token for map_object in map_objects.values()]
+        registry = MapBuilder.registry(map_objects)
+        if stats is not None:
+            stats.lap('lookup')
+        if getattr(game_map, 'lazy', False):
+            MapBuilder.place_lazy(game_map, registry)
+            if stats is not None:
+                stats.lap('objects')
+                for row in game_map.tokens.rows:
+                    stats.count(row)
+                stats.lap()
+            return
+
+        token_classes = TokenClasses(game_map, registry)
+        first_row = game_map.tokens.origin[0]
+        for y in range(first_row, first_row + game_map.tokens.height):
+            MapBuilder.place_row(game_map, y, registry, stats=stats, token_classes=token_classes)
+
+        return
+
+    @staticmethod
+    def place_lazy(game_map, registry):
+        """
+        Give a lazy game_map(see `Map.lazy`) a TokenObjectGrid over its tokens, placing only the objects
+        that can't wait until they are accessed.
+
+        :param game_map: Map
+        :param registry: TokenRegistry
+        :return:
+        """
+
+        tokens = game_map.tokens
+        game_map.objects = objects = TokenObjectGrid(game_map, registry)
+        eager = objects.eager_codes()
+        if not eager:
+            return
+
+        first_row, first_column = tokens.origin
+        for y, row in enumerate(tokens.rows, first_row):
+            for code in eager:
+                for column in tokens.columns(row, code):
+                    objects.classes[code](y, column + first_column).place(game_map)
+
+    @staticmethod
+    def place_row(game_map, y, registry, columns=None, stats=None, token_classes=None):
+        """
+        Place the objects for row `y` of the game_map's tokens.  The rows directly above and below need to
+        have their tokens placed already, since walls look at them to figure out how to display themselves.
+
+        columns         -   Optional (first, last) map columns to place, `last` excluded.  By default the
+                            whole row is placed.
+
+        stats           -   Optional `buildstats.BuildStats` to add the time spent on the row to.
+
+        token_classes   -   The TokenClasses of the game_map, so placing many rows only looks up the class of
+                            each token once.  By default they are looked up for this row.
+
+        :param game_map: Map
+        :param y: int
+        :param registry: TokenRegistry
+        :param columns: tuple
+        :param stats: BuildStats
+        :param token_classes: TokenClasses
+        :return:
+        """
+
+        tokens = game_map.tokens
+        objects = game_map.objects
+        symbols = tokens.symbols
+        # The class for each token code, so every cell is dispatched with a list index.
+        if token_classes is None:
+            token_classes = TokenClasses(game_map, registry)
+        else:
+            token_classes.update()
+        classes, autotiled, shared = token_classes.classes, token_classes.autotiled, token_classes.shared
+        first_column = tokens.origin[1]
+        row = tokens.row(y)
+        start, stop = 0, len(row)
+        if columns is not None:
+            start = max(columns[0] - first_column, 0)
+            stop = min(columns[1] - first_column, stop)
+
+        if stats is not None:
+            stats.lap('lookup')
+
+        # Walls in the row are autotiled in one pass.
+        masks = row_masks(tokens, y)
+        if stats is not None:
+            stats.lap('autotile')
+
+        for x, code in enumerate(row[start:stop], first_column + start):
+            if not code:
+                continue
 
-        # Go through game map tokens and place the corresponding objects into the game map.
-        for (y, x), token in game_map.tokens.items():
             # If the token on the game map corresponds to an object token, place the
             # object on the map instead of the token.
-            if token in map_object_tokens:
-                map_object = map_objects_list[map_object_tokens.index(token)]
+            map_object = classes[code]
+            if shared[code] is not None:
+                objects[y, x] = shared[code]
+                continue
+            if map_object is not None:
                 obj = map_object(y, x)
-                obj.place(game_map)
+                if autotiled[code]:
+                    obj.set_mask(masks[x - first_column])
+                    objects[y, x] = obj
+                else:
+                    obj.place(game_map)
                 continue
 
             # Place the token on the map since there was no
             # game object with a corresponding token.
-            game_map.objects[y, x] = token
-            continue
+            objects[y, x] = symbols[code]
+
+        if stats is not None:
+            stats.lap('objects')
+            stats.count(row[start:stop])
+            stats.lap()
 
         return
 
+    @staticmethod
+    def replace_rows(game_map, lines, map_objects, height=None):
+        """
+        Rebuild some rows of an already built game_map from new lines of map text, leaving the other rows
+        as they are.  The walls in the rows directly above and below the replaced ones are autotiled again,
+        so the game_map ends up the same as building the whole new text from scratch.
+
+        lines           -   {row number: line} of the rows to replace.
+        height          -   The number of rows the map has now, rows past it are removed.  By default the
+                            map keeps its height(or grows to fit the lines).
+
+        :param game_map: Map
+        :param lines: dict
+        :param map_objects: dict
+        :param height: int
+        :return list: The (y, x) cells that were rebuilt or removed.
+        """
+
+        tokens, objects = game_map.tokens, game_map.objects
+        registry = MapBuilder.registry(map_objects)
+        cells = []
+        if height is not None and height < tokens.height:
+            for y in range(height, tokens.height):
+                cells.extend((y, x) for x in range(len(tokens.row(y))))
+            # Objects first, a lazy map still creates the removed ones from their tokens.
+            objects.truncate(height)
+            tokens.truncate(height)
+
+        for y, line in lines.items():
+            cells.extend((y, x) for x in range(max(len(line), len(tokens.row(y)))))
+            objects.set_row(y, objects.new_row(len(line)))
+            tokens.set_row(y, line)
+
+        token_classes = TokenClasses(game_map, registry)
+        halo = set()
+        for y in lines:
+            MapBuilder.place_row(game_map, y, registry, token_classes=token_classes)
+            halo.update((y - 1, y + 1))
+        halo.difference_update(lines)
+        if height is not None:
+            halo.add(height - 1)
+
+        for y in halo:
+            for x in range(len(tokens.row(y))):
+                retile(game_map, (y, x))
+
+        if game_map.watchers and cells:
+            game_map.changed(*cells)
+        return cells
+
     @staticmethod
     def place_tokens(map_text, game_map):
         """
@@ -91,21 +643,17 @@ class MapBuilder(object):
         """
 
         # Go through rows and place tokens on a 2D map.
-        rows = [[char for char in line] for line in map_text.split('\n') if line != '']
-        row_number = 0
-        for row in rows:
-            character_number = 0
-            for character in row:
-                game_map.tokens[row_number, character_number] = character
-                character_number += 1
-            row_number += 1
+        for row_number, row in enumerate(MapBuilder.rows(map_text.split('\n'))):
+            game_map.tokens.set_row(row_number, row)
 
         return
 
 
 if __name__ == '__main__':
     import curses
+    import terminal
     from map_objects import Wall, VerticalDoor, HorizontalDoor, Ground, Treasure, Food, Water
+    from renderer import Renderer
     from time import sleep
 
     def main(stdscr):
@@ -183,9 +731,9 @@ if __name__ == '__main__':
 
         maps = [box1, box2, box3]
         curses.curs_set(0)
-        animation_speed = 0.00025
+        renderer = Renderer(stdscr)
 
-        # Build each map and present it onto the screen in an animated fashion.
+        # Build each map and present it onto the screen.
         for map_text in maps:
             # Instantiate the Map object and assemble dict of MapObjects.
             game_map = Map()
@@ -202,33 +750,10 @@ if __name__ == '__main__':
             # Populate the Map object with MapObjects.
             MapBuilder.build(map_text, game_map, map_objects)
             # Draw the map!
-            for (y, x), obj in game_map.objects.items():
-                try:
-                    stdscr.addch(y, x, obj.ch_number, curses.color_pair(obj.color))
-                except AttributeError:
-                    stdscr.addstr(y, x, obj)
-                except TypeError:
-                    stdscr.addstr(y, x, obj.drawing, curses.color_pair(obj.color))
-                stdscr.refresh()
-                sleep(animation_speed)
+            renderer.draw(game_map)
 
             sleep(5)
             stdscr.clear()
+            renderer.invalidate()
 
-    try:
-        s = curses.initscr()
-        curses.start_color()
-        curses.use_default_colors()
-        for i in range(0, curses.COLORS):
-            curses.init_pair(i + 1, i, -1)
-        main(s)
-    finally:
-        try:
-            curses.nocbreak()
-        except curses.error:
-            import sys
-            sys.exit()
-
-        s.keypad(False)
-        curses.echo()
-        curses.endwin()
+    terminal.run(main)
@@ -1,6 +1,8 @@
 import curses
+import terminal
 from editor import Map, MapBuilder
 from map_objects import Wall, VerticalDoor, HorizontalDoor, Ground, Treasure, Food, Water
+from renderer import Renderer
 from time import sleep
 
 
@@ -79,9 +81,9 @@ def main(stdscr):
 
     maps = [box1, box2, box3]
     curses.curs_set(0)
-    animation_speed = 0.00025
+    renderer = Renderer(stdscr)
 
-    # Build each box and present it onto the screen in an animated fashion.
+    # Build each box and present it onto the screen.
     for map_text in maps:
         # Build the box(converts tokens to wall pieces).
 
@@ -99,35 +101,12 @@ def main(stdscr):
         #
         MapBuilder.build(map_text, game_map, map_objects)
 
-        for (y, x), obj in game_map.objects.items():
-            try:
-                stdscr.addch(y, x, obj.ch_number, curses.color_pair(obj.color))
-            except AttributeError:
-                stdscr.addstr(y, x, obj)
-            except TypeError:
-                stdscr.addstr(y, x, obj.drawing, curses.color_pair(obj.color))
-            stdscr.refresh()
-            sleep(animation_speed)
+        renderer.draw(game_map)
 
         sleep(5)
         stdscr.clear()
+        renderer.invalidate()
 
 
-try:
-    s = curses.initscr()
-    curses.start_color()
-    curses.use_default_colors()
-    for i in range(0, curses.COLORS):
-        curses.init_pair(i + 1, i, -1)
-    main(s)
-finally:
-    try:
-        curses.nocbreak()
-    except curses.error:
-        import sys
-
-        sys.exit()
-
-    s.keypad(False)
-    curses.echo()
-    curses.endwin()
+if __name__ == '__main__':
+    terminal.run(main)
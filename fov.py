@@ -0,0 +1,255 @@
+"""
+What can be seen from where on a built Map.
+
+The map is turned into an `OpacityGrid` once(taken from the `opaque` attribute of each map object class:
+walls and doors block the view, water and the floor don't) and fields of view are cast on that grid with
+recursive shadowcasting:
+
+    view = FieldOfView(game_map)
+    cells = view.visible(player.y, player.x, 10)                # set of visible (y, x) cells
+    seen = view.lines_of_sight([(monster_cell, player_cell), ...])
+
+    # Only draw what the player can see.
+    renderer.draw_cells(view.visible_objects(player.y, player.x, 10))
+    renderer.present()
+
+The FieldOfView caches the field of every origin and watches the map, so opening a door or moving a wall
+only drops the fields the changed cell was visible in.
+"""
+import math
+from collections import OrderedDict
+
+from grid import class_rows, update_class_rows
+
+# Opacity values of the grid.
+TRANSPARENT, OPAQUE = 0, 1
+
+# How x and y of the scanned rows map onto the map for each of the 8 octants: (xx, xy, yx, yy).
+OCTANTS = (
+    (1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+    (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1),
+)
+
+
+def opacity(map_object_class):
+    """
+    Get if objects of the given class block the view as a grid value.  Plain tokens(`str`) don't.
+
+    :param map_object_class: class
+    :return int:
+    """
+
+    if map_object_class is str:
+        return TRANSPARENT
+    return OPAQUE if getattr(map_object_class, 'opaque', False) else TRANSPARENT
+
+
+class OpacityGrid(object):
+    """
+    If every cell of a map blocks the view, one byte per cell.  Cells that are not on the map block it.
+    """
+
+    def __init__(self, game_map, opacity=opacity):
+        self.opacity_of = opacity
+        self.rows = class_rows(game_map, opacity, OPAQUE)
+        self.height = len(self.rows)
+        self.width = len(self.rows[0]) if self.rows else 0
+
+    def opaque(self, y, x):
+        if 0 <= y < self.height and 0 <= x < self.width:
+            return self.rows[y][x] == OPAQUE
+        return True
+
+    def update(self, game_map, cells):
+        """
+        Read the opacity of the given cells from the game_map again.
+
+        :param game_map: Map
+        :param cells: iterable
+        :return list: The cells whose opacity changed.
+        """
+
+        changes = update_class_rows(self.rows, game_map, cells, self.opacity_of, OPAQUE)
+        return [cell for cell, _, _ in changes]
+
+
+def field_of_view(grid, y, x, radius):
+    """
+    Get the cells visible from (y, x) up to `radius` cells away with recursive shadowcasting.  Opaque cells
+    are visible themselves but hide what is behind them.
+
+    :param grid: OpacityGrid
+    :param y: int
+    :param x: int
+    :param radius: int
+    :return set:
+    """
+
+    rows, height, width = grid.rows, grid.height, grid.width
+    radius_squared = radius * radius
+    visible = {(y, x)}
+
+    def opaque(cell_y, cell_x):
+        return not (0 <= cell_y < height and 0 <= cell_x < width) or rows[cell_y][cell_x] == OPAQUE
+
+    def cast(row, start, end, xx, xy, yx, yy):
+        # Scan the rows of an octant between the start and end slopes, going into a new scan below every
+        # opaque cell that narrows the view.
+        if start < end:
+            return
+        for distance in range(row, radius + 1):
+            dx, dy = -distance - 1, -distance
+            blocked = False
+            new_start = start
+            while dx <= 0:
+                dx += 1
+                cell_x, cell_y = x + dx * xx + dy * xy, y + dx * yx + dy * yy
+                left_slope, right_slope = (dx - 0.5) / (dy + 0.5), (dx + 0.5) / (dy - 0.5)
+                if start < right_slope:
+                    continue
+                if end > left_slope:
+                    break
+
+                if dx * dx + dy * dy <= radius_squared:
+                    visible.add((cell_y, cell_x))
+                if blocked:
+                    if opaque(cell_y, cell_x):
+                        new_start = right_slope
+                    else:
+                        blocked = False
+                        start = new_start
+                elif opaque(cell_y, cell_x) and distance < radius:
+                    blocked = True
+                    cast(distance + 1, start, left_slope, xx, xy, yx, yy)
+                    new_start = right_slope
+            if blocked:
+                break
+
+    for octant in OCTANTS:
+        cast(1, 1.0, 0.0, *octant)
+    return visible
+
+
+def affects(origin, radius, visible, cell):
+    """
+    Get if a cell changing its opacity can change the field cast from origin.  Only cells that are visible
+    cast shadows, but cells in the corners of the scanned square outside the circle of the field aren't
+    kept in it, so they count as well.
+
+    :param origin: tuple
+    :param radius: int
+    :param visible: set
+    :param cell: tuple
+    :return bool:
+    """
+
+    if cell in visible:
+        return True
+    dy, dx = cell[0] - origin[0], cell[1] - origin[1]
+    return max(abs(dy), abs(dx)) <= radius and dy * dy + dx * dx > radius * radius
+
+
+class FieldOfView(object):
+    """
+    Casts and caches fields of view on a game_map.  The FieldOfView watches the map(see `Map.watch`): when
+    a cell starts or stops blocking the view, the cached fields it was visible in are dropped.  Call `close`
+    when it is no longer needed so the map stops telling it about changes.
+
+    cache_size      -   How many origins to keep the field of.
+    """
+
+    def __init__(self, game_map, cache_size=1024):
+        self.map = game_map
+        self.grid = OpacityGrid(game_map)
+        self.cache_size = cache_size
+        # (y, x) -> (radius, visible cells)
+        self.cache = OrderedDict()
+        game_map.watch(self.changed)
+
+    def visible(self, y, x, radius):
+        """
+        Get the cells visible from (y, x) up to `radius` cells away(see `field_of_view`).  Don't change the
+        set that is returned, it is shared with the cache.
+
+        :param y: int
+        :param x: int
+        :param radius: int
+        :return set:
+        """
+
+        key = y, x
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] >= radius:
+            self.cache.move_to_end(key)
+            cached_radius, cells = cached
+            if cached_radius == radius:
+                return cells
+            # A smaller radius only cuts the field off earlier.
+            limit = radius * radius
+            return {(cell_y, cell_x) for cell_y, cell_x in cells
+                    if (cell_y - y) ** 2 + (cell_x - x) ** 2 <= limit}
+
+        cells = field_of_view(self.grid, y, x, radius)
+        self.cache[key] = radius, cells
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return cells
+
+    def can_see(self, origin, target):
+        """
+        Get if target is in the field of view of origin.
+
+        :param origin: tuple
+        :param target: tuple
+        :return bool:
+        """
+
+        return self.lines_of_sight([(origin, target)])[0]
+
+    def lines_of_sight(self, pairs):
+        """
+        Get if the target of each (origin, target) pair is in the field of view of its origin.  The field
+        of every origin is cast once, as far as its furthest target.
+
+        :param pairs: iterable
+        :return list:
+        """
+
+        pairs = list(pairs)
+        reach = {}
+        for (origin_y, origin_x), (target_y, target_x) in pairs:
+            needed = int(math.ceil(math.hypot(target_y - origin_y, target_x - origin_x)))
+            if needed > reach.get((origin_y, origin_x), -1):
+                reach[origin_y, origin_x] = needed
+
+        fields = {origin: self.visible(origin[0], origin[1], radius) for origin, radius in reach.items()}
+        return [tuple(target) in fields[tuple(origin)] for origin, target in pairs]
+
+    def visible_objects(self, y, x, radius):
+        """
+        Get the ((y, x), map_object) pairs of the visible cells, to draw only what can be seen(see
+        `renderer.Renderer.draw_cells`).
+
+        :param y: int
+        :param x: int
+        :param radius: int
+        :return generator:
+        """
+
+        objects = self.map.objects
+        for cell in self.visible(y, x, radius):
+            map_object = objects.get(cell)
+            if map_object is not None:
+                yield cell, map_object
+
+    def changed(self, game_map, cells):
+        changes = self.grid.update(game_map, cells)
+        if not changes:
+            return
+        for key, (radius, visible) in list(self.cache.items()):
+            if any(affects(key, radius, visible, cell) for cell in changes):
+                del self.cache[key]
+
+    def close(self):
+        self.map.unwatch(self.changed)
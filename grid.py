@@ -0,0 +1,633 @@
+from array import array
+from collections.abc import MutableMapping, ItemsView, ValuesView
+
+
+class Grid(MutableMapping):
+    """
+    Dense storage for per-cell values that still behaves like the `(y, x)` keyed dicts `Map` used to hold.
+
+    Cells are stored row by row, so a map with millions of cells holds a handful of row buffers instead
+    of millions of tuple keys.  Rows may be ragged(just like the lines of a map text) and cells that were
+    never set are reported as missing, so a lookup outside the map still raises a KeyError:
+
+        game_map.objects[y, x]
+        game_map.tokens.get((y - 1, x))
+        for (y, x), map_object in game_map.objects.items():
+            pass
+
+    origin      -   The (y, x) coordinate of the first cell stored in the grid.  Grids that only hold a part
+                    of a larger map(see `chunks.ChunkedMap`) use it to keep their keys in map coordinates.
+    """
+    absent = None
+    # The length of the longest row, or None until `width` works it out again.  Cameras ask for the width
+    # every frame, so it is kept up to date as rows change instead of going over every row each time.
+    widest = None
+
+    def __init__(self, origin=(0, 0)):
+        self.origin = origin
+        self.rows = []
+        self.count = 0
+
+    # Subclasses decide how a row is stored and how values are encoded in it.
+    def new_row(self, size):
+        raise NotImplementedError
+
+    def encode(self, value):
+        return value
+
+    def decode(self, stored):
+        return stored
+
+    @property
+    def height(self):
+        return len(self.rows)
+
+    @property
+    def width(self):
+        if self.widest is None:
+            self.widest = max([len(row) for row in self.rows] or [0])
+        return self.widest
+
+    def resized(self, old_length, new_length):
+        """
+        Keep `widest` up to date after a row went from `old_length` to `new_length` cells.
+
+        :param old_length: int
+        :param new_length: int
+        :return:
+        """
+
+        widest = self.widest
+        if widest is None:
+            return
+        if new_length >= widest:
+            self.widest = new_length
+        elif old_length == widest:
+            # The longest row got shorter, another row may be the longest now.
+            self.widest = None
+
+    def row(self, y):
+        """
+        Get the raw storage for row `y`(in map coordinates).  Missing rows return an empty row.
+
+        :param y: int
+        :return:
+        """
+
+        y -= self.origin[0]
+        if 0 <= y < len(self.rows):
+            return self.rows[y]
+        return self.new_row(0)
+
+    def window(self, top, left, height, width):
+        """
+        Get the ((y, x), value) pairs of the cells inside the given rectangle in row-major order.  Only the
+        rows and columns inside the rectangle are looked at.
+
+        :param top: int
+        :param left: int
+        :param height: int
+        :param width: int
+        :return generator:
+        """
+
+        absent = self.absent
+        decode = self.decode
+        oy, ox = self.origin
+        start = max(left - ox, 0)
+        stop = max(left + width - ox, 0)
+        for y in range(max(top, oy), min(top + height, oy + len(self.rows))):
+            for x, stored in enumerate(self.rows[y - oy][start:stop], start + ox):
+                if stored != absent:
+                    yield (y, x), decode(stored)
+
+    def __getitem__(self, key):
+        y, x = key
+        y -= self.origin[0]
+        x -= self.origin[1]
+        if y < 0 or x < 0:
+            raise KeyError(key)
+        try:
+            stored = self.rows[y][x]
+        except IndexError:
+            raise KeyError(key)
+        if stored == self.absent:
+            raise KeyError(key)
+        return self.decode(stored)
+
+    def __setitem__(self, key, value):
+        y, x = key
+        y -= self.origin[0]
+        x -= self.origin[1]
+        if y < 0 or x < 0:
+            raise KeyError(key)
+
+        rows = self.rows
+        while len(rows) <= y:
+            rows.append(self.new_row(0))
+        row = rows[y]
+        if len(row) <= x:
+            self.resized(len(row), x + 1)
+            row.extend(self.new_row(x + 1 - len(row)))
+
+        if row[x] == self.absent:
+            self.count += 1
+        row[x] = self.encode(value)
+
+    def __delitem__(self, key):
+        y, x = key
+        y -= self.origin[0]
+        x -= self.origin[1]
+        if y < 0 or x < 0:
+            raise KeyError(key)
+        try:
+            stored = self.rows[y][x]
+        except IndexError:
+            raise KeyError(key)
+        if stored == self.absent:
+            raise KeyError(key)
+        self.rows[y][x] = self.absent
+        self.count -= 1
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except (KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        absent = self.absent
+        oy, ox = self.origin
+        for y, row in enumerate(self.rows):
+            for x, stored in enumerate(row):
+                if stored != absent:
+                    yield y + oy, x + ox
+
+    def iter_items(self):
+        absent = self.absent
+        decode = self.decode
+        oy, ox = self.origin
+        for y, row in enumerate(self.rows):
+            y += oy
+            for x, stored in enumerate(row):
+                if stored != absent:
+                    yield (y, x + ox), decode(stored)
+
+    def items(self):
+        return GridItems(self)
+
+    def values(self):
+        return GridValues(self)
+
+    def clear(self):
+        self.rows = []
+        self.count = 0
+        self.widest = None
+
+    def truncate(self, height):
+        """
+        Remove every row from `height` rows past the origin on.
+
+        :param height: int
+        :return:
+        """
+
+        for row in self.rows[height:]:
+            self.count -= len(row) - row.count(self.absent)
+        del self.rows[height:]
+        self.widest = None
+
+
+class GridItems(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class GridValues(ValuesView):
+    def __iter__(self):
+        for _, value in self._mapping.iter_items():
+            yield value
+
+
+class TokenGrid(Grid):
+    """
+    Holds the map tokens as one byte per cell.
+
+    Every distinct token is given a small code the first time it is seen(`symbols` maps the code back to the
+    token), and rows are `bytearray`s of those codes.  Code 0 marks a cell that is not on the map.  Once a
+    map has more than 255 distinct tokens the rows become `array('H')`s with two bytes per cell instead,
+    see `wide`.
+    """
+    absent = 0
+
+    def __init__(self, origin=(0, 0)):
+        Grid.__init__(self, origin)
+        self.symbols = [None]
+        self.codes = {}
+        # str.translate table from a token to the character holding its code.
+        self.table = {}
+        # True once the codes don't fit in a byte and the rows are array('H')s.
+        self.wide = False
+
+    def new_row(self, size):
+        if self.wide:
+            return array('H', bytes(2 * size))
+        return bytearray(size)
+
+    def widen(self):
+        """
+        Switch every row to two bytes per cell, so codes past 255 can be stored.
+
+        :return:
+        """
+
+        self.wide = True
+        self.rows = [array('H', list(row)) for row in self.rows]
+
+    def code(self, token):
+        """
+        Get the code for the given token, adding it to the symbol table if it is new.
+
+        :param token: str
+        :return int:
+        """
+
+        try:
+            return self.codes[token]
+        except KeyError:
+            pass
+
+        code = len(self.symbols)
+        if code > 65535:
+            raise ValueError('A map can not hold more than 65535 distinct tokens.')
+        if code > 255 and not self.wide:
+            self.widen()
+        self.symbols.append(token)
+        self.codes[token] = code
+        if len(token) == 1:
+            self.table[ord(token)] = chr(code)
+        return code
+
+    @staticmethod
+    def columns(row, code):
+        """
+        Get the index of every cell in the row(as returned by `row`) that holds the given code.
+
+        :param row: bytearray or array
+        :param code: int
+        :return list:
+        """
+
+        if isinstance(row, array):
+            return [x for x, stored in enumerate(row) if stored == code]
+
+        columns = []
+        column = row.find(code)
+        while column != -1:
+            columns.append(column)
+            column = row.find(code, column + 1)
+        return columns
+
+    def get(self, key, default=None):
+        # Walls look up the tokens around them with this, see `map_objects.Wall.border_mask`.
+        y, x = key
+        oy, ox = self.origin
+        if y >= oy and x >= ox:
+            try:
+                stored = self.rows[y - oy][x - ox]
+            except IndexError:
+                return default
+            if stored:
+                return self.symbols[stored]
+        return default
+
+    def encode(self, value):
+        return self.code(value)
+
+    def decode(self, stored):
+        return self.symbols[stored]
+
+    def __setitem__(self, key, value):
+        # A new token can widen the rows, so it has to get its code before the row is looked up.
+        code = self.code(value)
+        y, x = key
+        oy, ox = self.origin
+        if y >= oy and x >= ox:
+            try:
+                row = self.rows[y - oy]
+                if row[x - ox]:
+                    # Cells that are on the map already don't change the count.
+                    row[x - ox] = code
+                    return
+            except IndexError:
+                pass
+        Grid.__setitem__(self, key, value)
+
+    def set_row(self, y, line, column=0):
+        """
+        Replace row `y` with the tokens in `line`, one token per character.  This is a lot faster than
+        setting the cells one at a time.
+
+        column          -   The map column of the first character in `line`.  Grids that don't start at
+                            column 0 only keep the part of the line they cover.
+
+        :param y: int
+        :param line: str
+        :param column: int
+        :return:
+        """
+
+        y -= self.origin[0]
+        if y < 0:
+            raise KeyError((y + self.origin[0], column))
+
+        skip = self.origin[1] - column
+        if skip > 0:
+            line = line[skip:]
+
+        for token in set(line):
+            self.code(token)
+        if self.wide:
+            row = array('H', map(ord, line.translate(self.table)))
+        else:
+            row = bytearray(line.translate(self.table), 'latin-1')
+        if skip < 0:
+            row[:0] = self.new_row(-skip)
+
+        rows = self.rows
+        while len(rows) <= y:
+            rows.append(self.new_row(0))
+
+        old = rows[y]
+        self.count += len(row) - len(old) + old.count(0) - row.count(0)
+        self.resized(len(old), len(row))
+        rows[y] = row
+
+    def delete_row(self, y):
+        """
+        Remove every token from row `y`.
+
+        :param y: int
+        :return:
+        """
+
+        y -= self.origin[0]
+        if 0 <= y < len(self.rows):
+            old = self.rows[y]
+            self.count -= len(old) - old.count(0)
+            self.resized(len(old), 0)
+            self.rows[y] = self.new_row(0)
+
+
+class ObjectGrid(Grid):
+    """
+    Holds the objects placed on the map, one list slot per cell.  `None` marks a cell that is not on the map.
+    """
+    absent = None
+
+    def new_row(self, size):
+        return [None] * size
+
+    def __getitem__(self, key):
+        # The lookup every move and draw goes through, so it does as little as it can.
+        y, x = key
+        oy, ox = self.origin
+        if y >= oy and x >= ox:
+            try:
+                stored = self.rows[y - oy][x - ox]
+            except IndexError:
+                raise KeyError(key)
+            if stored is not None:
+                return stored
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        # Same as __getitem__, without going through the KeyError of MutableMapping.get.
+        y, x = key
+        oy, ox = self.origin
+        if y >= oy and x >= ox:
+            try:
+                stored = self.rows[y - oy][x - ox]
+            except IndexError:
+                return default
+            if stored is not None:
+                return stored
+        return default
+
+    def __setitem__(self, key, value):
+        # Moving objects replaces cells that are on the map already, which doesn't change the count.
+        y, x = key
+        oy, ox = self.origin
+        if y >= oy and x >= ox:
+            try:
+                row = self.rows[y - oy]
+                if row[x - ox] is not None:
+                    row[x - ox] = value
+                    return
+            except IndexError:
+                pass
+        Grid.__setitem__(self, key, value)
+
+    def set_row(self, y, objects):
+        """
+        Replace row `y` with the given list of objects.
+
+        :param y: int
+        :param objects: list
+        :return:
+        """
+
+        y -= self.origin[0]
+        rows = self.rows
+        while len(rows) <= y:
+            rows.append([])
+
+        old = rows[y]
+        self.count += len(objects) - len(old) + old.count(None) - objects.count(None)
+        self.resized(len(old), len(objects))
+        rows[y] = objects
+
+
+# Marks a cell of a LazyObjectGrid whose object has not been created yet.
+UNLOADED = object()
+
+
+class LazyObjectGrid(ObjectGrid):
+    """
+    An ObjectGrid that creates each object the first time its cell is accessed.  Subclasses implement `load`,
+    which returns the object for a cell(or None if the cell is not on the map).
+
+    widths      -   The length of every row when the grid is created.  Rows that were accessed since are as
+                    long as their list, see `row_length`.
+    count       -   The number of cells on the map.
+    """
+
+    def __init__(self, widths, count, origin=(0, 0)):
+        ObjectGrid.__init__(self, origin)
+        self.widths = widths
+        # A row is None until one of its cells is accessed, then a list holding UNLOADED for every cell
+        # that has not been created yet.
+        self.rows = [None] * len(widths)
+        self.count = count
+
+    def load(self, y, x):
+        raise NotImplementedError
+
+    def row_length(self, y):
+        # Rows that were accessed can have grown or shrunk since, the ones that weren't still have their
+        # width from when the grid was created.
+        row = self.rows[y]
+        return self.widths[y] if row is None else len(row)
+
+    @property
+    def width(self):
+        if self.widest is None:
+            self.widest = max([self.row_length(y) for y in range(len(self.rows))] or [0])
+        return self.widest
+
+    def window(self, top, left, height, width):
+        # Only create the objects inside the window.
+        get = self.get
+        oy, ox = self.origin
+        for y in range(max(top, oy), min(top + height, oy + len(self.rows))):
+            for x in range(max(left, ox), min(left + width, ox + self.row_length(y - oy))):
+                map_object = get((y, x))
+                if map_object is not None:
+                    yield (y, x), map_object
+
+    def loaded_row(self, y):
+        row = self.rows[y]
+        if row is None:
+            row = self.rows[y] = [UNLOADED] * self.widths[y]
+        return row
+
+    def row(self, y):
+        local_y = y - self.origin[0]
+        if not 0 <= local_y < len(self.rows):
+            return []
+        row = self.loaded_row(local_y)
+        if UNLOADED in row:
+            first_column = self.origin[1]
+            for x, stored in enumerate(row):
+                if stored is UNLOADED:
+                    row[x] = self.load(y, x + first_column)
+        return row
+
+    def __getitem__(self, key):
+        y, x = key
+        local_y = y - self.origin[0]
+        local_x = x - self.origin[1]
+        if local_y < 0 or local_x < 0:
+            raise KeyError(key)
+        try:
+            row = self.rows[local_y]
+            if row is None:
+                row = self.loaded_row(local_y)
+            stored = row[local_x]
+        except IndexError:
+            raise KeyError(key)
+        if stored is UNLOADED:
+            stored = row[local_x] = self.load(y, x)
+        if stored is None:
+            raise KeyError(key)
+        return stored
+
+    def get(self, key, default=None):
+        # The cell may still have to be created, which __getitem__ takes care of.
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        # Make sure the count knows if the cell was on the map before.
+        self.get(key)
+        ObjectGrid.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self[key]
+        ObjectGrid.__delitem__(self, key)
+
+    def iter_items(self):
+        oy = self.origin[0]
+        for y in range(oy, oy + len(self.rows)):
+            for x, stored in enumerate(self.row(y), self.origin[1]):
+                if stored is not None:
+                    yield (y, x), stored
+
+    def __iter__(self):
+        for key, _ in self.iter_items():
+            yield key
+
+    def set_row(self, y, objects):
+        self.row(y)
+        ObjectGrid.set_row(self, y, objects)
+
+    def truncate(self, height):
+        # Create the objects of the removed rows, so the count knows which of their cells were on the map.
+        oy = self.origin[0]
+        for y in range(oy + height, oy + len(self.rows)):
+            self.row(y)
+        ObjectGrid.truncate(self, height)
+        del self.widths[height:]
+
+
+def class_rows(game_map, value, absent=0):
+    """
+    Turn the game_map into rows of bytes with one value per cell, for grids that only depend on the class of
+    each object(like passability or opacity).  `value` is called once per class(with `str` for plain tokens)
+    and has to return an int from 0 to 255.  Cells that are not on the map get `absent`.
+
+    :param game_map: Map
+    :param value: callable
+    :param absent: int
+    :return list: A bytearray per row.
+    """
+
+    values = {}
+    rows = []
+    width = game_map.width
+    for y in range(game_map.height):
+        row = bytearray([absent]) * width
+        for (_, x), map_object in game_map.viewport(y, 0, 1, width):
+            map_object_class = type(map_object)
+            try:
+                row[x] = values[map_object_class]
+            except KeyError:
+                row[x] = values[map_object_class] = value(str if isinstance(map_object, str) else map_object_class)
+        rows.append(row)
+    return rows
+
+
+def update_class_rows(rows, game_map, cells, value, absent=0):
+    """
+    Read the value of the given cells from the game_map again, for rows made by `class_rows`.  Cells outside
+    the rows are skipped.
+
+    :param rows: list
+    :param game_map: Map
+    :param cells: iterable
+    :param value: callable
+    :param absent: int
+    :return list: The (cell, old value, new value) of every cell whose value changed.
+    """
+
+    changes = []
+    height = len(rows)
+    for y, x in cells:
+        if not (0 <= y < height and 0 <= x < len(rows[y])):
+            continue
+        map_object = game_map.objects.get((y, x))
+        if map_object is None:
+            new = absent
+        else:
+            new = value(str if isinstance(map_object, str) else type(map_object))
+        old = rows[y][x]
+        if old != new:
+            rows[y][x] = new
+            changes.append(((y, x), old, new))
+    return changes
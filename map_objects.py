@@ -1,31 +1,95 @@
 
 
+# The shared instance of each class that uses flyweights, see `EmptyTile.flyweight`.
+FLYWEIGHTS = {}
+
+
 class EmptyTile(object):
     """
     The EmptyTile tile is the tile that all other MapObjects inherit from.
 
     EmptyTile->Ground->MapObject
+
+    Tiles use `__slots__` so they don't carry a `__dict__` around.  Subclasses should declare `__slots__` as
+    well(an empty tuple if they don't add any attributes), otherwise every instance gets a `__dict__` again.
+
+    Classes with `shared` set keep no state besides their position, so a Map created with `flyweights=True`
+    puts one shared instance(`flyweight`) in every cell with such a tile instead of creating one per cell.
     """
+    __slots__ = ('y', 'x')
     token = str
     drawing = ''
     color = 0
     ch_number = 0
+    shared = True
+    # What it costs to walk onto the tile, None if it can't be walked on.  See `pathfinding`.
+    move_cost = None
+    # If the tile blocks the view.  See `fov`.
+    opaque = False
 
     def __init__(self, y, x):
         self.y, self.x = y, x
 
     def place(self, game_map):
         game_map.objects[self.y, self.x] = self
+        if game_map.watchers:
+            # Placed on a map that is in use, see `Map.watch`.
+            game_map.changed((self.y, self.x))
+
+    @classmethod
+    def flyweight(cls):
+        """
+        Get the instance of this class that is shared by every cell holding one.  It has no `y` and `x`, its
+        position is wherever it is found on the map(see `Map.materialize`).
+
+        :return:
+        """
+
+        try:
+            return FLYWEIGHTS[cls]
+        except KeyError:
+            instance = FLYWEIGHTS[cls] = cls.__new__(cls)
+            return instance
+
+    @classmethod
+    def uses_flyweight(cls):
+        return cls.shared and cls.place is EmptyTile.place
+
+    def is_flyweight(self):
+        return FLYWEIGHTS.get(type(self)) is self
+
+    def __reduce_ex__(self, protocol):
+        # Unpickling a flyweight gives back the shared instance instead of a copy.
+        if self.is_flyweight():
+            return type(self).flyweight, ()
+        return object.__reduce_ex__(self, protocol)
+
+    @classmethod
+    def create(cls, y, x, game_map):
+        """
+        Get a tile of this class for the given cell, sharing the flyweight if the game_map uses them.
+
+        :param y:
+        :param x:
+        :param game_map:
+        :return:
+        """
+
+        if game_map.flyweights and cls.uses_flyweight():
+            return cls.flyweight()
+        return cls(y, x)
 
 
 class Ground(EmptyTile):
     """
     The Ground tile is the base of the map that all other objects exist upon.
     """
+    __slots__ = ()
     token = ' '
     drawing = ' '
     color = 0
     ch_number = 32
+    move_cost = 1
 
     def move(self, y, x, game_map, replacement=EmptyTile):
         """
@@ -39,9 +103,10 @@ class Ground(EmptyTile):
         """
 
         c = self.y, self.x
-        game_map.objects[c] = replacement(*c)
+        game_map.objects[c] = replacement.create(*c, game_map=game_map)
         self.y, self.x = y, x
         game_map.objects[y, x] = self
+        game_map.changed(c, (y, x))
 
 
 class MapObject(Ground):
@@ -50,10 +115,12 @@ class MapObject(Ground):
     are not MapObjects, but Wall, Treasure and Food are.  Moving a MapObject leaves a Ground object in its
     place.
     """
+    __slots__ = ()
     token = str
     drawing = ''
     color = 0
     ch_number = 0
+    shared = False
 
     def move(self, y, x, game_map, replacement=Ground):
         """
@@ -70,6 +137,7 @@ class MapObject(Ground):
 
 
 class Treasure(MapObject):
+    __slots__ = ()
     token = '$'
     color = 203
     drawing = '$'
@@ -77,17 +145,32 @@ class Treasure(MapObject):
 
 
 class Food(MapObject):
+    __slots__ = ()
     token = 'f'
     color = 11
     drawing = ''
     ch_number = None
 
 
+# Bits of a wall's neighbour mask.  A bit is set when the neighbour in that direction is also a wall.
+NORTH, SOUTH, EAST, WEST = 1, 2, 4, 8
+
+
 class Wall(MapObject):
+    """
+    Walls pick their own character from their neighbours, so unlike the other tiles each one keeps its
+    `ch_number`, `drawing` and `color` in a `__dict__`.
+    """
     token = '#'
     color = 10
     drawing = None
     ch_number = None
+    move_cost = None
+    opaque = True
+
+    # (ch_number, drawing, color) for each of the 16 neighbour masks.  A color of None keeps the class color.
+    # Filled in below the class from `pick_glyph`.
+    glyphs = []
 
     def check_wall_borders(self, y, x, game_map):
         """
@@ -99,31 +182,38 @@ class Wall(MapObject):
         :return dict borders:
         """
 
-        target_coordinates = self.get_target_coordinates(y, x)
-        north_piece, south_piece, east_piece, west_piece = False, False, False, False
-        for direction, target_coordinate in target_coordinates.items():
-            try:
-                target = game_map.tokens[target_coordinate]
-                if target == '#':
-                    if direction == 'n':
-                        north_piece = True
-                    elif direction == 's':
-                        south_piece = True
-                    elif direction == 'e':
-                        east_piece = True
-                    elif direction == 'w':
-                        west_piece = True
-            except KeyError:
-                pass
-
+        mask = self.border_mask(y, x, game_map)
         borders = {
-            'n': north_piece,
-            's': south_piece,
-            'e': east_piece,
-            'w': west_piece
+            'n': bool(mask & NORTH),
+            's': bool(mask & SOUTH),
+            'e': bool(mask & EAST),
+            'w': bool(mask & WEST)
         }
         return borders
 
+    @staticmethod
+    def border_mask(y, x, game_map):
+        """
+        Get the neighbour mask(see NORTH, SOUTH, EAST & WEST) of the given coordinates.
+
+        :param y:
+        :param x:
+        :param game_map:
+        :return int:
+        """
+
+        get = game_map.tokens.get
+        mask = 0
+        if get((y - 1, x)) == '#':
+            mask |= NORTH
+        if get((y + 1, x)) == '#':
+            mask |= SOUTH
+        if get((y, x + 1)) == '#':
+            mask |= EAST
+        if get((y, x - 1)) == '#':
+            mask |= WEST
+        return mask
+
     def get_target_coordinates(self, y, x):
         """
         Get the x/y coordinates of possible target locations directly surrounding the given x and y
@@ -162,25 +252,21 @@ class Wall(MapObject):
             'se': se_target_coordinates
         }
 
-    def place(self, game_map):
+    @staticmethod
+    def pick_glyph(n_piece, s_piece, e_piece, w_piece):
         """
-        Place a wall at the given coordinates.  This method will figure out which character
-        to use based on the current map data.
+        Figure out which character a wall uses based on which of its neighbours are walls.
 
-        :param game_map:
-        :return:
+        :param n_piece: bool
+        :param s_piece: bool
+        :param e_piece: bool
+        :param w_piece: bool
+        :return tuple: (ch_number, drawing, color)
         """
 
-        y, x = self.y, self.x
-
-        borders = self.check_wall_borders(y, x, game_map)
-        n_piece = borders['n']
-        s_piece = borders['s']
-        e_piece = borders['e']
-        w_piece = borders['w']
-
         char_num = 0
         debug_char = ' '
+        color = None
 
         # Upper left corner.
         if (not n_piece and not w_piece) and (e_piece and s_piece):
@@ -192,7 +278,7 @@ class Wall(MapObject):
             # 4194417   -   ─
             char_num = 4194417
             debug_char = '─'
-            self.color = 12
+            color = 12
 
         elif (not w_piece and not e_piece) and (n_piece or s_piece):
             # 4194424     -   │
@@ -239,21 +325,65 @@ class Wall(MapObject):
             char_num = 4194414
             debug_char = '┼'
 
-        self.ch_number = char_num
-        self.drawing = debug_char
+        return char_num, debug_char, color
+
+    def set_mask(self, mask):
+        """
+        Use the character for the given neighbour mask.
+
+        :param mask: int
+        :return:
+        """
+
+        self.ch_number, self.drawing, color = self.glyphs[mask]
+        if color is None:
+            color = type(self).color
+        # Walls that are autotiled again can go back to the class color.
+        if self.color != color:
+            self.color = color
+
+    def place(self, game_map):
+        """
+        Place a wall at the given coordinates.  This method will figure out which character
+        to use based on the current map data.
+
+        :param game_map:
+        :return:
+        """
+
+        self.set_mask(self.border_mask(self.y, self.x, game_map))
 
         game_map.objects[self.y, self.x] = self
+        if game_map.watchers:
+            game_map.changed((self.y, self.x))
         return
 
 
-class VerticalDoor(MapObject):
+Wall.glyphs = [
+    Wall.pick_glyph(bool(mask & NORTH), bool(mask & SOUTH), bool(mask & EAST), bool(mask & WEST))
+    for mask in range(16)
+]
+
+
+class Door(MapObject):
+    """
+    Doors join the rooms of a map(see `regions`).  They can be walked through but block the view.
+    """
+    __slots__ = ()
+    opaque = True
+    shared = True
+
+
+class VerticalDoor(Door):
+    __slots__ = ()
     token = '|'
     drawing = '▒'
     color = 233
     ch_number = 4194401
 
 
-class HorizontalDoor(MapObject):
+class HorizontalDoor(Door):
+    __slots__ = ()
     token = '-'
     drawing = '▒'
     color = 233
@@ -261,7 +391,22 @@ class HorizontalDoor(MapObject):
 
 
 class Water(MapObject):
+    __slots__ = ()
     token = 'w'
     drawing = '▒'
     color = 22
     ch_number = 4194401
+    move_cost = 3
+    shared = True
+
+
+# The map objects for the tokens used in the examples, for tools that build map files(see `buildstats`).
+MAP_OBJECTS = {
+    'vdoor': VerticalDoor,
+    'hdoor': HorizontalDoor,
+    'wall': Wall,
+    'ground': Ground,
+    'treasure': Treasure,
+    'food': Food,
+    'water': Water
+}
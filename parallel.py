@@ -0,0 +1,221 @@
+"""
+Build many maps at once on all cores.
+
+    game_maps = parallel.build_many([level_text, Path('level2.txt'), ...], map_objects)
+
+Every map is built in a worker process and sent back compiled(see `compiled.dumps`), so a map crosses
+the process boundary as one bytes object instead of having every map object pickled on its own.  The maps
+that come back are `compiled.CompiledMap`s, which create their objects as they are accessed.
+
+A single large map can be built on all cores as well:
+
+    game_map = parallel.build_bands(map_text, map_objects)
+
+The map is cut into bands of rows that are built and compiled by the workers and stitched back together
+into one map that is the same as building it with `MapBuilder.build`.
+"""
+import os
+from array import array
+from multiprocessing import Pool
+
+import compiled
+from editor import Map, MapBuilder, TokenClasses
+
+# The map objects of a worker process, sent once when the worker starts.
+worker_map_objects = None
+
+
+def start_worker(map_objects):
+    global worker_map_objects
+    worker_map_objects = map_objects
+
+
+def build_compiled(source, map_objects=None):
+    """
+    Build the map for a single source and compile it.
+
+    :param source: str or os.PathLike
+    :param map_objects: dict
+    :return bytes:
+    """
+
+    if map_objects is None:
+        map_objects = worker_map_objects
+    if isinstance(source, os.PathLike):
+        game_map = MapBuilder.build_stream(source, Map(), map_objects)
+    else:
+        game_map = MapBuilder.build(source, Map(), map_objects)
+    return compiled.dumps(game_map)
+
+
+def build_many(sources, map_objects, processes=None, chunksize=1):
+    """
+    Build a map for each of the sources in a pool of worker processes.
+
+    sources         -   Map texts(`str`) or paths of map files(`os.PathLike`, like `pathlib.Path`).
+    map_objects     -   A dictionary of map objects, the classes are imported by name in the workers so
+                        they have to live in a module.
+    processes       -   Number of worker processes, the number of cores if None.  With 1 the maps are
+                        built one after another in this process.
+
+    :param sources: iterable
+    :param map_objects: dict
+    :param processes: int
+    :param chunksize: int
+    :return list: A CompiledMap for each source, in the same order.
+    """
+
+    sources = list(sources)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(sources))
+
+    if processes <= 1:
+        data = [build_compiled(source, map_objects) for source in sources]
+    else:
+        with Pool(processes, start_worker, (map_objects,)) as pool:
+            data = pool.map(build_compiled, sources, chunksize)
+
+    return [compiled.loads(map_data, map_objects) for map_data in data]
+
+
+def build_band(rows, first, count, map_objects=None):
+    """
+    Build and encode one band of a map.
+
+    rows            -   The token rows of the band, with the row above and the row below it(if there are
+                        any) so the walls along the edges of the band know about their neighbours.
+    first           -   Index in `rows` of the first row of the band.
+    count           -   Number of rows in the band.
+
+    :param rows: list
+    :param first: int
+    :param count: int
+    :param map_objects: dict
+    :return compiled.Encoded: The encoded objects of the band, without its tokens.
+    """
+
+    if map_objects is None:
+        map_objects = worker_map_objects
+    band = Map()
+    for y, row in enumerate(rows):
+        band.tokens.set_row(y, row)
+
+    registry = MapBuilder.registry(map_objects)
+    token_classes = TokenClasses(band, registry)
+    for y in range(first, first + count):
+        MapBuilder.place_row(band, y, registry, token_classes=token_classes)
+
+    # The parent process has the tokens already.
+    return compiled.encode(band, first, count, tokens=False)
+
+
+def build_bands(map_text, map_objects, processes=None, band_height=None):
+    """
+    Build a single map in a pool of worker processes, a band of rows per task.  Objects are placed with
+    their own rows and the rows next to them, so objects that look further than one row away when they are
+    placed(the walls don't) should be built with `MapBuilder.build` instead.
+
+    processes       -   Number of worker processes, the number of cores if None.  With 1 the bands are
+                        built one after another in this process.
+    band_height     -   Number of rows in a band.  By default every process gets about 4 bands.
+
+    :param map_text: str
+    :param map_objects: dict
+    :param processes: int
+    :param band_height: int
+    :return CompiledMap: The map, the same as the one `MapBuilder.build` makes.
+    """
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    rows = list(MapBuilder.rows(map_text.split('\n')))
+    height = len(rows)
+    if band_height is None:
+        band_height = -(-height // (processes * 4))
+    band_height = max(band_height, 1)
+
+    bands = []
+    for top in range(0, height, band_height):
+        bottom = min(top + band_height, height)
+        halo_top = max(top - 1, 0)
+        bands.append((rows[halo_top:bottom + 1], top - halo_top, bottom - top))
+
+    game_map = Map()
+    for y, row in enumerate(rows):
+        game_map.tokens.set_row(y, row)
+
+    processes = min(processes, len(bands))
+    if processes <= 1:
+        encoded = [build_band(*band, map_objects=map_objects) for band in bands]
+    else:
+        with Pool(processes, start_worker, (map_objects,)) as pool:
+            encoded = pool.starmap(build_band, bands)
+
+    return compiled.loads(compiled.pack(stitch(game_map.tokens, encoded)), map_objects)
+
+
+def stitch(tokens, bands):
+    """
+    Put encoded bands(see `build_band`) below each other, giving them one class and glyph table.
+
+    :param tokens: TokenGrid
+    :param bands: list
+    :return compiled.Encoded:
+    """
+
+    height = max(sum(band.height for band in bands), tokens.height)
+    width = max([tokens.width] + [band.width for band in bands])
+
+    if len(tokens.symbols) > 256:
+        raise ValueError('The map has too many distinct tokens, classes or glyphs to compile.')
+    token_grid = bytearray(height * width)
+    for y in range(tokens.height):
+        row = tokens.row(y)
+        token_grid[y * width:y * width + len(row)] = row
+
+    class_names = [None, None]
+    class_ids = {}
+    glyphs = [[None, None, None]]
+    glyph_ids = {}
+    class_grid = bytearray(height * width)
+    glyph_grid = array('H', bytes(2 * height * width))
+    object_count = 0
+
+    top = 0
+    for band in bands:
+        # Translate the ids of the band to the ids of the whole map.
+        class_table = bytearray(range(256))
+        for class_id, name in enumerate(band.class_names[2:], 2):
+            if name not in class_ids:
+                class_ids[name] = len(class_names)
+                class_names.append(name)
+            if class_ids[name] > 255:
+                raise ValueError('The map has too many distinct tokens, classes or glyphs to compile.')
+            class_table[class_id] = class_ids[name]
+
+        glyph_table = [0]
+        for entry in band.glyphs[1:]:
+            key = tuple(entry)
+            if key not in glyph_ids:
+                glyph_ids[key] = len(glyphs)
+                glyphs.append(entry)
+            glyph_table.append(glyph_ids[key])
+
+        band_classes = band.class_grid.translate(class_table)
+        band_glyphs = array('H', map(glyph_table.__getitem__, band.glyph_grid))
+        if band.width == width:
+            class_grid[top * width:(top + band.height) * width] = band_classes
+            glyph_grid[top * width:(top + band.height) * width] = band_glyphs
+        else:
+            for y in range(band.height):
+                start, band_start = (top + y) * width, y * band.width
+                class_grid[start:start + band.width] = band_classes[band_start:band_start + band.width]
+                glyph_grid[start:start + band.width] = band_glyphs[band_start:band_start + band.width]
+
+        object_count += band.object_count
+        top += band.height
+
+    return compiled.Encoded(height, width, list(tokens.symbols), class_names, glyphs, token_grid, class_grid,
+                            glyph_grid, tokens.count, object_count)
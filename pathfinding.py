@@ -0,0 +1,307 @@
+"""
+Routing over a built Map.
+
+The map is turned into a `PassabilityGrid` once, holding what it costs to walk onto every cell(taken from
+the `move_cost` of each map object class), and paths are searched on that grid instead of the map objects:
+
+    pathfinder = Pathfinder(game_map)
+    path = pathfinder.path((1, 1), (12, 40))            # [(1, 1), (1, 2), ..., (12, 40)]
+    paths = pathfinder.paths([(start, goal), ...])      # many agents at once
+
+Movement is up, down, left and right.  `astar` honours the cost of every cell, `jps`(jump point search)
+treats every walkable cell as costing 1 and is much faster on large open maps.  The Pathfinder caches paths
+and watches the map, so moving a tile updates the grid and drops the cached paths it affects.
+"""
+import heapq
+from collections import OrderedDict
+
+from grid import class_rows, update_class_rows
+
+# Cells with this cost can't be walked on.
+BLOCKED = 0
+
+
+def move_cost(map_object_class):
+    """
+    Get the cost of walking onto objects of the given class as a grid value(BLOCKED or 1 to 255).  Plain
+    tokens(`str`) are walked on like floor.
+
+    :param map_object_class: class
+    :return int:
+    """
+
+    if map_object_class is str:
+        return 1
+    cost = getattr(map_object_class, 'move_cost', 1)
+    if cost is None:
+        return BLOCKED
+    return min(max(int(cost), 1), 255)
+
+
+class PassabilityGrid(object):
+    """
+    The cost of walking onto every cell of a map, one byte per cell.
+    """
+
+    def __init__(self, game_map, cost=move_cost):
+        self.cost_of = cost
+        self.rows = class_rows(game_map, cost, BLOCKED)
+        self.height = len(self.rows)
+        self.width = len(self.rows[0]) if self.rows else 0
+
+    def cost(self, y, x):
+        if 0 <= y < self.height and 0 <= x < self.width:
+            return self.rows[y][x]
+        return BLOCKED
+
+    def passable(self, y, x):
+        return self.cost(y, x) != BLOCKED
+
+    def update(self, game_map, cells):
+        """
+        Read the cost of the given cells from the game_map again.
+
+        :param game_map: Map
+        :param cells: iterable
+        :return list: The (cell, old cost, new cost) of every cell whose cost changed.
+        """
+
+        return update_class_rows(self.rows, game_map, cells, self.cost_of, BLOCKED)
+
+
+def neighbours(y, x):
+    return (y - 1, x), (y + 1, x), (y, x + 1), (y, x - 1)
+
+
+def astar(grid, start, goal):
+    """
+    Find the cheapest path from start to goal with A*.
+
+    :param grid: PassabilityGrid
+    :param start: tuple
+    :param goal: tuple
+    :return list: The cells of the path including start and goal, None if there is no path.
+    """
+
+    if not grid.passable(*start) or not grid.passable(*goal):
+        return None
+
+    rows, height, width = grid.rows, grid.height, grid.width
+    goal_y, goal_x = goal
+    came_from = {start: None}
+    costs = {start: 0}
+    heap = [(0, 0, start)]
+    counter = 0
+
+    while heap:
+        _, _, current = heapq.heappop(heap)
+        if current == goal:
+            return rebuild_path(came_from, goal)
+
+        current_cost = costs[current]
+        for y, x in neighbours(*current):
+            if not (0 <= y < height and 0 <= x < width):
+                continue
+            step = rows[y][x]
+            if step == BLOCKED:
+                continue
+            cost = current_cost + step
+            if cost < costs.get((y, x), cost + 1):
+                costs[y, x] = cost
+                came_from[y, x] = current
+                counter += 1
+                heapq.heappush(heap, (cost + abs(goal_y - y) + abs(goal_x - x), counter, (y, x)))
+
+    return None
+
+
+def jps(grid, start, goal):
+    """
+    Find the shortest path from start to goal with jump point search.  Every walkable cell costs 1.
+
+    Instead of adding every cell to the open list, the search runs along straight lines and only stops at
+    cells where a side passage opens up(jump points).  Moving vertically, every cell checks for jump points
+    to its left and right.
+
+    :param grid: PassabilityGrid
+    :param start: tuple
+    :param goal: tuple
+    :return list: The cells of the path including start and goal, None if there is no path.
+    """
+
+    if not grid.passable(*start) or not grid.passable(*goal):
+        return None
+
+    rows, height, width = grid.rows, grid.height, grid.width
+    goal_y, goal_x = goal
+    # Stands in for the rows above the first and below the last row.
+    outside = bytes(width)
+
+    def jump_horizontal(y, x, dx):
+        row = rows[y]
+        above = rows[y - 1] if y > 0 else outside
+        below = rows[y + 1] if y + 1 < height else outside
+        while True:
+            x += dx
+            if not (0 <= x < width) or row[x] == BLOCKED:
+                return None
+            if y == goal_y and x == goal_x:
+                return y, x
+            # A cell above or below that was blocked one step back is open here.
+            if (above[x] and not above[x - dx]) or (below[x] and not below[x - dx]):
+                return y, x
+
+    def jump_vertical(y, x, dy):
+        while True:
+            y += dy
+            if not (0 <= y < height) or rows[y][x] == BLOCKED:
+                return None
+            if y == goal_y and x == goal_x:
+                return y, x
+            if jump_horizontal(y, x, 1) or jump_horizontal(y, x, -1):
+                return y, x
+
+    came_from = {start: None}
+    costs = {start: 0}
+    # Entries are (estimate, counter, cell, direction the cell was reached in).
+    heap = [(0, 0, start, None)]
+    counter = 0
+
+    while heap:
+        _, _, current, direction = heapq.heappop(heap)
+        if current == goal:
+            return expand_path(rebuild_path(came_from, goal))
+
+        y, x = current
+        if direction is None:
+            directions = ((-1, 0), (1, 0), (0, 1), (0, -1))
+        elif direction[0]:
+            directions = (direction, (0, 1), (0, -1))
+        else:
+            directions = (direction, (-1, 0), (1, 0))
+
+        for dy, dx in directions:
+            if dy:
+                point = jump_vertical(y, x, dy)
+            else:
+                point = jump_horizontal(y, x, dx)
+            if point is None:
+                continue
+
+            cost = costs[current] + abs(point[0] - y) + abs(point[1] - x)
+            if cost < costs.get(point, cost + 1):
+                costs[point] = cost
+                came_from[point] = current
+                counter += 1
+                estimate = cost + abs(goal_y - point[0]) + abs(goal_x - point[1])
+                heapq.heappush(heap, (estimate, counter, point, (dy, dx)))
+
+    return None
+
+
+def rebuild_path(came_from, goal):
+    path = []
+    cell = goal
+    while cell is not None:
+        path.append(cell)
+        cell = came_from[cell]
+    path.reverse()
+    return path
+
+
+def expand_path(points):
+    """
+    Fill in the cells between the jump points of a path.
+
+    :param points: list
+    :return list:
+    """
+
+    path = [points[0]]
+    for y, x in points[1:]:
+        last_y, last_x = path[-1]
+        step_y = (y > last_y) - (y < last_y)
+        step_x = (x > last_x) - (x < last_x)
+        while (last_y, last_x) != (y, x):
+            last_y += step_y
+            last_x += step_x
+            path.append((last_y, last_x))
+    return path
+
+
+class Pathfinder(object):
+    """
+    Finds and caches paths on a game_map.  The pathfinder watches the map(see `Map.watch`): when tiles move,
+    the passability grid is updated and cached paths that could have changed are dropped.  Call `close` when
+    the pathfinder is no longer needed so the map stops telling it about changes.
+
+    method          -   `astar` or `jps`.
+    cache_size      -   How many paths to keep.
+    regions         -   Optional `regions.Regions` of the map.  Goals in another part of the map than the
+                        start are then turned down without searching the whole part the start is in.
+    """
+
+    methods = {'astar': astar, 'jps': jps}
+
+    def __init__(self, game_map, method='astar', cache_size=4096, regions=None):
+        self.map = game_map
+        self.regions = regions
+        self.grid = PassabilityGrid(game_map)
+        self.search = self.methods[method]
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        game_map.watch(self.changed)
+
+    def path(self, start, goal):
+        """
+        Get the path from start to goal(see `astar`).
+
+        :param start: tuple
+        :param goal: tuple
+        :return list:
+        """
+
+        key = start, goal
+        try:
+            path = self.cache[key]
+            self.cache.move_to_end(key)
+            return path
+        except KeyError:
+            pass
+
+        if self.regions is not None and not self.regions.reachable(start, goal):
+            return None
+        path = self.search(self.grid, start, goal)
+        self.cache[key] = path
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return path
+
+    def paths(self, routes):
+        """
+        Get the paths for many (start, goal) pairs at once.
+
+        :param routes: iterable
+        :return list:
+        """
+
+        return [self.path(start, goal) for start, goal in routes]
+
+    def changed(self, game_map, cells):
+        changes = self.grid.update(game_map, cells)
+        if not changes:
+            return
+
+        if any(new != BLOCKED and (old == BLOCKED or new < old) for _, old, new in changes):
+            # A cheaper way opened up, any path could be shorter now.
+            self.cache.clear()
+            return
+
+        # Otherwise only the paths through the cells that got more expensive change.
+        worse = {cell for cell, _, _ in changes}
+        for key, path in list(self.cache.items()):
+            if path is not None and not worse.isdisjoint(path):
+                del self.cache[key]
+
+    def close(self):
+        self.map.unwatch(self.changed)
@@ -0,0 +1,303 @@
+"""
+The rooms of a built Map and the doors between them.
+
+Every cell is one of three kinds, by the class of its object: blocked(walls and anything else that can't
+be walked on), door(`map_objects.Door`) or floor(everything else, including plain tokens).  Floor cells
+that touch each other(up, down, left or right) form a room, door cells that touch each other a door, and
+the rooms next to a door are joined by it:
+
+    regions = Regions(game_map)             # or MapBuilder.build(..., regions=True) and game_map.regions
+    room = regions.room(y, x)               # the room the cell is in, None for walls and doors
+    regions.reachable(player_cell, treasure_cell)
+    regions.room_path(player_cell, treasure_cell)   # [room, door, room, ...]
+
+Rooms are found a run of cells at a time: the runs of floor in each row are joined with the runs they
+touch in the row above, so the whole map is labelled in one pass.  The regions watch the map and label it
+again the next time they are asked something after a cell changed its kind.
+"""
+import re
+from array import array
+from collections import deque
+
+from grid import class_rows
+from map_objects import Door
+
+# The kinds of cells.
+BLOCKED, FLOOR, DOOR = 0, 1, 2
+RUNS = {FLOOR: re.compile(b'\x01+'), DOOR: re.compile(b'\x02+')}
+
+
+def kind(map_object_class):
+    """
+    Get the kind of cell objects of the given class make.
+
+    :param map_object_class: class
+    :return int:
+    """
+
+    if map_object_class is str:
+        return FLOOR
+    if issubclass(map_object_class, Door):
+        return DOOR
+    if getattr(map_object_class, 'move_cost', 1) is None:
+        return BLOCKED
+    return FLOOR
+
+
+def find(parent, label):
+    while parent[label] != label:
+        parent[label] = parent[parent[label]]
+        label = parent[label]
+    return label
+
+
+def label_runs(kinds, cell_kind):
+    """
+    Find the connected areas of one kind of cell.
+
+    :param kinds: list
+    :param cell_kind: int
+    :return tuple: The (y, start, end, area) of every run of the kind and the number of areas.  Areas are
+                   numbered from 1.
+    """
+
+    pattern = RUNS[cell_kind]
+    parent = [0]
+    runs = []
+    above = []
+    for y, row in enumerate(kinds):
+        current = []
+        index = 0
+        for match in pattern.finditer(row):
+            start, end = match.span()
+            label = len(parent)
+            parent.append(label)
+            # Join every run above that shares a column with this one.
+            while index < len(above) and above[index][1] <= start:
+                index += 1
+            other = index
+            while other < len(above) and above[other][0] < end:
+                root, own = find(parent, above[other][2]), find(parent, label)
+                if root != own:
+                    parent[max(root, own)] = min(root, own)
+                other += 1
+            if other > index:
+                # The last run above can touch the next run in this row as well.
+                index = other - 1
+            current.append((start, end, label))
+            runs.append((y, start, end, label))
+        above = current
+
+    numbers = {}
+    labelled = []
+    for y, start, end, label in runs:
+        root = find(parent, label)
+        area = numbers.get(root)
+        if area is None:
+            area = numbers[root] = len(numbers) + 1
+        labelled.append((y, start, end, area))
+    return labelled, len(numbers)
+
+
+class Regions(object):
+    """
+    The rooms and doors of a game_map.
+
+    labels          -   A row of labels per map row: the room number(from 1) for floor cells, minus the
+                        door number(from 1) for door cells and 0 for blocked cells.
+    rooms           -   Number of rooms.
+    doors           -   Number of doors.
+    sizes           -   Number of cells of each room, by room number.
+    door_rooms      -   The set of rooms next to each door, by door number.
+    room_doors      -   The set of doors next to each room, by room number.
+    graph           -   The rooms next to each room, by room number: {room: {next room: [doors]}}.
+    """
+
+    def __init__(self, game_map, kind=kind):
+        self.map = game_map
+        self.kind_of = kind
+        self.stale = True
+        self.segment()
+        game_map.watch(self.changed)
+
+    def segment(self):
+        """
+        Label the rooms and doors of the map again.
+
+        :return:
+        """
+
+        game_map = self.map
+        self.kinds = kinds = class_rows(game_map, self.kind_of, BLOCKED)
+        width = len(kinds[0]) if kinds else 0
+        self.labels = labels = [array('i', bytes(4 * width)) for _ in kinds]
+
+        room_runs, self.rooms = label_runs(kinds, FLOOR)
+        door_runs, self.doors = label_runs(kinds, DOOR)
+
+        self.sizes = [0] * (self.rooms + 1)
+        for y, start, end, room in room_runs:
+            labels[y][start:end] = array('i', [room]) * (end - start)
+            self.sizes[room] += end - start
+        for y, start, end, door in door_runs:
+            labels[y][start:end] = array('i', [-door]) * (end - start)
+
+        # The rooms next to each door.
+        self.door_rooms = door_rooms = [set() for _ in range(self.doors + 1)]
+        for y, start, end, door in door_runs:
+            rooms = door_rooms[door]
+            row = labels[y]
+            if start > 0:
+                rooms.add(row[start - 1])
+            if end < width:
+                rooms.add(row[end])
+            if y > 0:
+                rooms.update(labels[y - 1][start:end])
+            if y + 1 < len(labels):
+                rooms.update(labels[y + 1][start:end])
+        for door, rooms in enumerate(door_rooms):
+            # Only rooms, not walls or the door itself.
+            door_rooms[door] = {room for room in rooms if room > 0}
+
+        self.room_doors = room_doors = [set() for _ in range(self.rooms + 1)]
+        self.graph = graph = {room: {} for room in range(1, self.rooms + 1)}
+        for door, rooms in enumerate(door_rooms):
+            for room in rooms:
+                room_doors[room].add(door)
+                for other in rooms:
+                    if other != room:
+                        graph[room].setdefault(other, []).append(door)
+
+        # Rooms that can reach each other through doors share a component, doors take the component of
+        # their rooms.
+        self.components = components = {}
+        for room in graph:
+            if room in components:
+                continue
+            components[room] = room
+            queue = deque([room])
+            while queue:
+                for other in graph[queue.popleft()]:
+                    if other not in components:
+                        components[other] = room
+                        queue.append(other)
+        for door, rooms in enumerate(door_rooms):
+            if door:
+                components[-door] = components[min(rooms)] if rooms else -door
+
+        self.stale = False
+
+    def changed(self, game_map, cells):
+        if self.stale:
+            return
+        kinds = self.kinds
+        objects = game_map.objects
+        for y, x in cells:
+            map_object = objects.get((y, x))
+            if map_object is None:
+                cell_kind = BLOCKED
+            else:
+                cell_kind = self.kind_of(str if isinstance(map_object, str) else type(map_object))
+            if not (0 <= y < len(kinds) and 0 <= x < len(kinds[y])) or kinds[y][x] != cell_kind:
+                self.stale = True
+                return
+
+    def label(self, y, x):
+        """
+        Get the label of a cell(see `labels`).
+
+        :param y: int
+        :param x: int
+        :return int:
+        """
+
+        if self.stale:
+            self.segment()
+        if 0 <= y < len(self.labels) and 0 <= x < len(self.labels[y]):
+            return self.labels[y][x]
+        return 0
+
+    def room(self, y, x):
+        """
+        Get the room the cell is in, None for doors and blocked cells.
+
+        :param y: int
+        :param x: int
+        :return int:
+        """
+
+        label = self.label(y, x)
+        return label if label > 0 else None
+
+    def door(self, y, x):
+        """
+        Get the door the cell is part of, None for floor and blocked cells.
+
+        :param y: int
+        :param x: int
+        :return int:
+        """
+
+        label = self.label(y, x)
+        return -label if label < 0 else None
+
+    def reachable(self, start, goal):
+        """
+        Get if goal can be walked to from start, through the rooms and doors between them.
+
+        :param start: tuple
+        :param goal: tuple
+        :return bool:
+        """
+
+        start_label, goal_label = self.label(*start), self.label(*goal)
+        if not start_label or not goal_label:
+            return False
+        return self.components[start_label] == self.components[goal_label]
+
+    def room_path(self, start, goal):
+        """
+        Get the rooms and doors to go through to get from start to goal, as [room, door, room, ...] with
+        the fewest doors.  A start or goal on a door begins or ends the path with that door.
+
+        :param start: tuple
+        :param goal: tuple
+        :return list: None if goal can't be reached.
+        """
+
+        if not self.reachable(start, goal):
+            return None
+        start_label, goal_label = self.label(*start), self.label(*goal)
+        if start_label == goal_label:
+            return [self.room(*start)] if start_label > 0 else [self.door(*start)]
+
+        # Doors are searched as nodes of their own(negative labels), so paths can start and end on them.
+        def neighbours(label):
+            if label > 0:
+                for door in self.room_doors[label]:
+                    yield -door
+            else:
+                for room in self.door_rooms[-label]:
+                    yield room
+
+        came_from = {start_label: None}
+        queue = deque([start_label])
+        while queue:
+            label = queue.popleft()
+            if label == goal_label:
+                break
+            for other in neighbours(label):
+                if other not in came_from:
+                    came_from[other] = label
+                    queue.append(other)
+
+        path = []
+        label = goal_label
+        while label is not None:
+            path.append(label if label > 0 else -label)
+            label = came_from[label]
+        path.reverse()
+        return path
+
+    def close(self):
+        self.map.unwatch(self.changed)
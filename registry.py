@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+
+class DuplicateTokenError(ValueError):
+    """
+    Raised when two different map object classes use the same token.
+    """
+
+
+class TokenRegistry(object):
+    """
+    Look up the map object class for a token in constant time.
+
+    A registry is built from the same dict of map objects that `MapBuilder.build` takes:
+
+        registry = TokenRegistry.of({'wall': Wall, 'ground': Ground})
+        registry['#']               # Wall
+        '$' in registry             # False
+
+    `TokenRegistry.of` caches the registry for a set of map objects, so building many maps with the same
+    map objects only checks the tokens once.  Two different classes with the same token raise a
+    DuplicateTokenError instead of the first one silently winning.  Classes without a string token(like
+    `MapObject` itself) are never matched and are left out.
+
+    cache_size      -   How many registries `of` keeps.  The least recently used one is dropped first, so
+                        programs that make up new sets of map objects don't keep every registry around.
+    """
+    cache = OrderedDict()
+    cache_size = 64
+
+    def __init__(self, map_objects=None):
+        self.map_objects = dict(map_objects or {})
+        self.classes = {}
+
+        for name, map_object in self.map_objects.items():
+            token = map_object.token
+            if not isinstance(token, str):
+                continue
+
+            registered = self.classes.get(token)
+            if registered is not None and registered is not map_object:
+                raise DuplicateTokenError(
+                    'Token {!r} is used by both {} and {}.'.format(token, registered.__name__, map_object.__name__)
+                )
+            self.classes[token] = map_object
+
+    @classmethod
+    def of(cls, map_objects):
+        """
+        Get the registry for the given map objects, building it the first time they are seen.
+
+        :param map_objects: dict or TokenRegistry
+        :return TokenRegistry:
+        """
+
+        if isinstance(map_objects, TokenRegistry):
+            return map_objects
+
+        cache = cls.cache
+        key = frozenset((map_objects or {}).items())
+        try:
+            registry = cache[key]
+        except KeyError:
+            registry = cache[key] = cls(map_objects)
+            if len(cache) > cls.cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return registry
+
+    def __getitem__(self, token):
+        return self.classes[token]
+
+    def __contains__(self, token):
+        return token in self.classes
+
+    def __iter__(self):
+        return iter(self.classes)
+
+    def __len__(self):
+        return len(self.classes)
+
+    def get(self, token, default=None):
+        return self.classes.get(token, default)
+
+    def for_symbols(self, symbols):
+        """
+        Get a list with the class for every code of a `grid.TokenGrid`'s symbol table(None for codes without
+        a class), so cells can be dispatched by their code directly.
+
+        :param symbols: list
+        :return list:
+        """
+
+        get = self.classes.get
+        return [get(symbol) if isinstance(symbol, str) else None for symbol in symbols]
@@ -0,0 +1,189 @@
+from camera import Camera
+
+# curses is only imported once a Renderer is created, so importing this module(or any of the map modules)
+# never loads it.  See `terminal` for running maps in a terminal.
+curses = None
+
+# How a kind of object is drawn.
+STRING, CHARACTER, DRAWING = 0, 1, 2
+
+
+def load_curses():
+    """
+    Import curses the first time it is needed.
+
+    :return module:
+    """
+
+    global curses
+    if curses is None:
+        import curses as curses_module
+
+        curses = curses_module
+    return curses
+
+
+class Renderer(object):
+    """
+    Draws a Map onto a curses window.
+
+    The renderer remembers what it put on the screen, so drawing a frame only sends the cells that changed
+    since the last frame to the terminal, and the whole frame is sent with a single update:
+
+        renderer = Renderer(stdscr)
+        while True:
+            renderer.draw(game_map)
+            # move things around...
+
+    Maps larger than the window can be scrolled with a camera:
+
+        camera = renderer.camera(margin=5)
+        camera.follow(player, game_map)
+        renderer.draw(game_map, camera)
+
+    Call `invalidate` after clearing the window so the next frame draws everything again.
+    """
+
+    def __init__(self, window):
+        load_curses()
+        self.window = window
+        # What is on the screen, (y, x) -> (kind, value, color).
+        self.front = {}
+        # How each class is drawn and the curses attribute for each color.
+        self.kinds = {}
+        self.attributes = {}
+
+    def kind(self, map_object):
+        """
+        Get how objects of the given object's class are drawn.  Strings(tokens without a map object) are drawn
+        as they are, objects with a `ch_number` are drawn with `addch` and the rest with their `drawing`.
+
+        :param map_object:
+        :return int:
+        """
+
+        map_object_class = type(map_object)
+        try:
+            return self.kinds[map_object_class]
+        except KeyError:
+            pass
+
+        if isinstance(map_object, str):
+            kind = STRING
+        elif isinstance(map_object.ch_number, int):
+            kind = CHARACTER
+        else:
+            kind = DRAWING
+        self.kinds[map_object_class] = kind
+        return kind
+
+    def cell(self, map_object):
+        """
+        Get the (kind, value, color) the object is drawn with.
+
+        :param map_object:
+        :return tuple:
+        """
+
+        kind = self.kind(map_object)
+        if kind == STRING:
+            return kind, map_object, 0
+        if kind == CHARACTER:
+            return kind, map_object.ch_number, map_object.color
+        return kind, map_object.drawing, map_object.color
+
+    def attribute(self, color):
+        try:
+            return self.attributes[color]
+        except KeyError:
+            attribute = self.attributes[color] = curses.color_pair(color)
+            return attribute
+
+    def draw(self, game_map, camera=None):
+        """
+        Draw the game_map and update the terminal.  With a camera(see `camera.Camera`) only the part of the
+        map the camera looks at is drawn, so a frame costs the same no matter how large the map is.
+
+        :param game_map: Map
+        :param camera: Camera
+        :return:
+        """
+
+        if camera is None:
+            self.draw_cells(game_map.objects.items())
+        else:
+            top, left = camera.top, camera.left
+            self.draw_cells(
+                ((y - top, x - left), map_object) for (y, x), map_object in game_map.viewport(*camera.window)
+            )
+        self.present()
+
+    def camera(self, **kwargs):
+        """
+        Get a Camera the size of the window.
+
+        :return Camera:
+        """
+
+        height, width = self.window.getmaxyx()
+        return Camera(height, width, **kwargs)
+
+    def draw_cells(self, cells):
+        """
+        Draw a frame made of the given ((y, x), map_object) pairs onto the window, without updating the
+        terminal yet.  Only cells that look different from the last frame are drawn, and cells that were
+        drawn last frame but are not part of this one are blanked.
+
+        :param cells: iterable
+        :return:
+        """
+
+        window = self.window
+        height, width = window.getmaxyx()
+        front = self.front
+        frame = {}
+
+        for (y, x), map_object in cells:
+            if y >= height or x >= width:
+                continue
+            cell = self.cell(map_object)
+            frame[y, x] = cell
+            if front.get((y, x)) != cell:
+                self.draw_cell(y, x, cell)
+
+        for y, x in front.keys() - frame.keys():
+            self.draw_cell(y, x, (STRING, ' ', 0))
+
+        self.front = frame
+
+    def draw_cell(self, y, x, cell):
+        kind, value, color = cell
+        try:
+            if kind == CHARACTER:
+                self.window.addch(y, x, value, self.attribute(color))
+            elif kind == DRAWING:
+                self.window.addstr(y, x, value, self.attribute(color))
+            else:
+                self.window.addstr(y, x, value)
+        except curses.error:
+            # curses reports an error after writing to the bottom right corner of a window.
+            pass
+
+    def present(self):
+        """
+        Send everything drawn since the last call to the terminal in one update.
+
+        :return:
+        """
+
+        self.window.noutrefresh()
+        curses.doupdate()
+
+    def invalidate(self):
+        """
+        Forget what is on the screen, so the next frame draws every cell.
+
+        :return:
+        """
+
+        self.front = {}
@@ -0,0 +1,185 @@
+"""
+Run a map with asyncio: the simulation moves forward in fixed ticks, input is queued without blocking and
+frames are drawn at most `fps` times a second, independently of the ticks.
+
+    def update(game_loop, events, tick):
+        for dy, dx in events:
+            player.move(player.y + dy, player.x + dx, game_loop.map)
+
+    game_loop = GameLoop(game_map, update, render=lambda game_map: renderer.draw(game_map), tick_rate=20)
+    game_loop.send((0, 1))
+    asyncio.run(game_loop.run())
+
+Every GameLoop only awaits between ticks and frames, so many maps(or sessions) can run in one process:
+
+    await asyncio.gather(*(game_loop.run() for game_loop in game_loops))
+"""
+import asyncio
+import inspect
+from collections import deque
+
+
+class TickMetrics(object):
+    """
+    Timings of the ticks and frames of a GameLoop, in seconds.
+
+    ticks           -   Number of ticks run.
+    frames          -   Number of frames drawn.
+    overruns        -   Ticks whose update took longer than a tick.
+    skipped         -   Ticks that were dropped because the loop fell too far behind.
+    events          -   Number of input events handled.
+    tick_times      -   How long the updates of the last `history` ticks took.
+    lateness        -   How late the last `history` ticks started.
+    frame_times     -   How long the last `history` frames took to draw.
+    """
+
+    def __init__(self, history=120):
+        self.ticks = self.frames = self.overruns = self.skipped = self.events = 0
+        self.tick_times = deque(maxlen=history)
+        self.lateness = deque(maxlen=history)
+        self.frame_times = deque(maxlen=history)
+
+    def add_tick(self, seconds, late, events, tick_seconds):
+        self.ticks += 1
+        self.events += events
+        if seconds > tick_seconds:
+            self.overruns += 1
+        self.tick_times.append(seconds)
+        self.lateness.append(late)
+
+    def add_frame(self, seconds):
+        self.frames += 1
+        self.frame_times.append(seconds)
+
+    def summary(self):
+        """
+        Get the counters and the average and worst recent timings.
+
+        :return dict:
+        """
+
+        result = {'ticks': self.ticks, 'frames': self.frames, 'overruns': self.overruns,
+                  'skipped': self.skipped, 'events': self.events}
+        for name in ('tick_times', 'lateness', 'frame_times'):
+            times = getattr(self, name)
+            result[name] = {
+                'average': sum(times) / len(times) if times else 0.0,
+                'max': max(times) if times else 0.0,
+            }
+        return result
+
+
+class GameLoop(object):
+    """
+    Runs the simulation of a game_map in fixed ticks and draws it at a limited frame rate.
+
+    update          -   Called with `(game_loop, events, tick)` every tick, with the list of events sent
+                        since the last tick(see `send`).  This is where objects are moved.
+    render          -   Called with the game_map to draw a frame, after at least one tick has run since
+                        the last frame.  It may be a coroutine function, like one sending the frame to a
+                        client.
+    tick_rate       -   Ticks per second.
+    fps             -   Frames per second at most.
+    max_catch_up    -   Most ticks run in a row to catch up after the loop was held up.  Ticks beyond that
+                        are skipped, so a slow machine runs the game slower instead of never drawing.
+    """
+
+    def __init__(self, game_map, update, render=None, tick_rate=20, fps=30, max_catch_up=5, history=120):
+        self.map = game_map
+        self.update = update
+        self.render = render
+        self.tick_seconds = 1.0 / tick_rate
+        self.frame_seconds = 1.0 / fps
+        self.max_catch_up = max_catch_up
+        self.events = deque()
+        self.metrics = TickMetrics(history)
+        self.tick = 0
+        self.running = False
+
+    def send(self, event):
+        """
+        Queue an input event for the next tick.  This never blocks and can be called from any coroutine or
+        callback running in the loop's thread.
+
+        :param event:
+        :return:
+        """
+
+        self.events.append(event)
+
+    def stop(self):
+        """
+        Stop running after the current tick.
+
+        :return:
+        """
+
+        self.running = False
+
+    def step(self, clock, scheduled):
+        """
+        Run a single tick with the events queued so far.
+
+        :param clock: callable
+        :param scheduled: float
+        :return:
+        """
+
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+
+        start = clock()
+        self.update(self, events, self.tick)
+        self.tick += 1
+        self.metrics.add_tick(clock() - start, max(start - scheduled, 0.0), len(events), self.tick_seconds)
+
+    async def draw(self, clock):
+        start = clock()
+        result = self.render(self.map)
+        if inspect.isawaitable(result):
+            await result
+        self.metrics.add_frame(clock() - start)
+
+    async def run(self, ticks=None):
+        """
+        Run ticks and draw frames until `stop` is called, or `ticks` ticks have run.
+
+        :param ticks: int
+        :return TickMetrics:
+        """
+
+        clock = asyncio.get_running_loop().time
+        next_tick = clock()
+        next_frame = next_tick
+        drawn_tick = None
+        self.running = True
+
+        while self.running and (ticks is None or self.tick < ticks):
+            caught_up = 0
+            while clock() >= next_tick and caught_up < self.max_catch_up:
+                self.step(clock, next_tick)
+                next_tick += self.tick_seconds
+                caught_up += 1
+                if not self.running or (ticks is not None and self.tick >= ticks):
+                    break
+
+            now = clock()
+            if now >= next_tick + self.tick_seconds:
+                # Too far behind, drop the ticks that couldn't be run.
+                behind = int((now - next_tick) / self.tick_seconds)
+                self.metrics.skipped += behind
+                next_tick += behind * self.tick_seconds
+
+            if self.render is not None and drawn_tick != self.tick and now >= next_frame:
+                await self.draw(clock)
+                drawn_tick = self.tick
+                next_frame = max(next_frame + self.frame_seconds, now)
+
+            wake = next_tick
+            if self.render is not None and drawn_tick != self.tick:
+                wake = min(wake, next_frame)
+            await asyncio.sleep(max(wake - clock(), 0))
+
+        self.running = False
+        return self.metrics
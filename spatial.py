@@ -0,0 +1,232 @@
+"""
+Find map objects by class and position without going through the whole map.
+
+A SpatialIndex keeps, for every indexed class, the cells holding objects of that class in a grid of square
+buckets.  Queries only look at the buckets of the classes asked for that are near the given position:
+
+    index = game_map.spatial_index()
+    index.of_type(Treasure)                     # every Treasure cell
+    index.within(Treasure, y, x, 10)            # Treasure cells at most 10 cells away
+    index.nearest(Water, y, x)                  # the closest Water cell
+
+The index watches the map(see `Map.watch`), so objects that are placed or moved are indexed again.
+"""
+from map_objects import MapObject
+
+
+def indexed(map_object_class):
+    """
+    The default for which classes are indexed: every MapObject, but not the floor and plain tokens.
+
+    :param map_object_class: class
+    :return bool:
+    """
+
+    return issubclass(map_object_class, MapObject)
+
+
+class SpatialIndex(object):
+    """
+    Per-class bucket grids of the cells of a game_map.
+
+    bucket_size     -   Width and height of a bucket in cells.  Queries look at whole buckets, so it should
+                        be in the order of the usual query radius.
+    classes         -   Called with a class to decide if objects of it are indexed.
+    """
+
+    def __init__(self, game_map, bucket_size=16, classes=indexed):
+        self.map = game_map
+        self.bucket_size = bucket_size
+        self.classes = classes
+        # class -> {(bucket y, bucket x): set of cells}
+        self.buckets = {}
+        # cell -> class of every indexed cell.
+        self.cells = {}
+        # class asked for -> the indexed classes that are subclasses of it.
+        self.matches = {}
+        self.checked = {}
+        # The first and last bucket rows and columns that were ever used, to know when to stop searching.
+        self.extent = None
+
+        for (y, x), map_object in game_map.objects.items():
+            self.add((y, x), map_object)
+        game_map.watch(self.changed)
+
+    def is_indexed(self, map_object_class):
+        try:
+            return self.checked[map_object_class]
+        except KeyError:
+            result = self.checked[map_object_class] = bool(self.classes(map_object_class))
+            return result
+
+    def add(self, cell, map_object):
+        if isinstance(map_object, str):
+            return
+        map_object_class = type(map_object)
+        if not self.is_indexed(map_object_class):
+            return
+
+        size = self.bucket_size
+        buckets = self.buckets.get(map_object_class)
+        if buckets is None:
+            buckets = self.buckets[map_object_class] = {}
+            self.matches.clear()
+        bucket_y, bucket_x = bucket = cell[0] // size, cell[1] // size
+        buckets.setdefault(bucket, set()).add(cell)
+        self.cells[cell] = map_object_class
+
+        extent = self.extent
+        if extent is None:
+            self.extent = bucket_y, bucket_y, bucket_x, bucket_x
+        elif not (extent[0] <= bucket_y <= extent[1] and extent[2] <= bucket_x <= extent[3]):
+            self.extent = (min(extent[0], bucket_y), max(extent[1], bucket_y),
+                           min(extent[2], bucket_x), max(extent[3], bucket_x))
+
+    def remove(self, cell):
+        map_object_class = self.cells.pop(cell, None)
+        if map_object_class is None:
+            return
+        size = self.bucket_size
+        buckets = self.buckets[map_object_class]
+        bucket = cell[0] // size, cell[1] // size
+        bucket_cells = buckets[bucket]
+        bucket_cells.discard(cell)
+        if not bucket_cells:
+            del buckets[bucket]
+
+    def changed(self, game_map, cells):
+        objects = game_map.objects
+        for cell in cells:
+            self.remove(cell)
+            map_object = objects.get(cell)
+            if map_object is not None:
+                self.add(cell, map_object)
+
+    def close(self):
+        self.map.unwatch(self.changed)
+
+    def classes_of(self, map_object_class):
+        """
+        Get the bucket grids of the given class and its subclasses.
+
+        :param map_object_class: class
+        :return list:
+        """
+
+        try:
+            return self.matches[map_object_class]
+        except KeyError:
+            pass
+        matches = self.matches[map_object_class] = [
+            buckets for indexed_class, buckets in self.buckets.items() if issubclass(indexed_class, map_object_class)
+        ]
+        return matches
+
+    def of_type(self, map_object_class):
+        """
+        Get every cell holding an object of the given class(or a subclass).
+
+        :param map_object_class: class
+        :return list:
+        """
+
+        return [cell for buckets in self.classes_of(map_object_class)
+                for bucket_cells in buckets.values() for cell in bucket_cells]
+
+    def within(self, map_object_class, y, x, radius):
+        """
+        Get the cells holding an object of the given class that are at most `radius` cells away from (y, x),
+        closest first.
+
+        :param map_object_class: class
+        :param y: int
+        :param x: int
+        :param radius: float
+        :return list:
+        """
+
+        size = self.bucket_size
+        top, bottom = int(y - radius) // size, int(y + radius) // size
+        left, right = int(x - radius) // size, int(x + radius) // size
+        limit = radius * radius
+
+        found = []
+        for buckets in self.classes_of(map_object_class):
+            if (bottom - top + 1) * (right - left + 1) > len(buckets):
+                # Fewer buckets hold this class than the query covers.
+                candidates = [bucket_cells for (bucket_y, bucket_x), bucket_cells in buckets.items()
+                              if top <= bucket_y <= bottom and left <= bucket_x <= right]
+            else:
+                candidates = [buckets[bucket_y, bucket_x]
+                              for bucket_y in range(top, bottom + 1) for bucket_x in range(left, right + 1)
+                              if (bucket_y, bucket_x) in buckets]
+            for bucket_cells in candidates:
+                for cell in bucket_cells:
+                    distance = (cell[0] - y) ** 2 + (cell[1] - x) ** 2
+                    if distance <= limit:
+                        found.append((distance, cell))
+
+        found.sort()
+        return [cell for _, cell in found]
+
+    def nearest(self, map_object_class, y, x, radius=None):
+        """
+        Get the closest cell holding an object of the given class, None if there is none(within `radius`).
+        The buckets are searched in rings around (y, x), so the search stops as soon as no closer cell can be
+        found.
+
+        :param map_object_class: class
+        :param y: int
+        :param x: int
+        :param radius: float
+        :return tuple:
+        """
+
+        grids = [buckets for buckets in self.classes_of(map_object_class) if buckets]
+        if not grids:
+            return None
+
+        size = self.bucket_size
+        center_y, center_x = y // size, x // size
+        # The furthest ring that can hold a bucket.
+        top, bottom, left, right = self.extent
+        last_ring = max(center_y - top, bottom - center_y, center_x - left, right - center_x)
+        if radius is not None:
+            last_ring = min(last_ring, int(radius) // size + 1)
+
+        best, best_distance = None, None
+        for ring in range(last_ring + 1):
+            # Cells in this ring are at least (ring - 1) * size cells away.
+            if best is not None and best_distance <= ((ring - 1) * size) ** 2:
+                break
+            for bucket in ring_buckets(center_y, center_x, ring):
+                for buckets in grids:
+                    for cell in buckets.get(bucket, ()):
+                        distance = (cell[0] - y) ** 2 + (cell[1] - x) ** 2
+                        if best is None or (distance, cell) < (best_distance, best):
+                            best, best_distance = cell, distance
+
+        if best is not None and radius is not None and best_distance > radius * radius:
+            return None
+        return best
+
+
+def ring_buckets(center_y, center_x, ring):
+    """
+    Get the buckets exactly `ring` buckets away from the center bucket.
+
+    :param center_y: int
+    :param center_x: int
+    :param ring: int
+    :return generator:
+    """
+
+    if ring == 0:
+        yield center_y, center_x
+        return
+    for bucket_x in range(center_x - ring, center_x + ring + 1):
+        yield center_y - ring, bucket_x
+        yield center_y + ring, bucket_x
+    for bucket_y in range(center_y - ring + 1, center_y + ring):
+        yield bucket_y, center_x - ring
+        yield bucket_y, center_x + ring
@@ -0,0 +1,82 @@
+"""
+Draw maps in a terminal with curses.  This is the entry point for running maps in a terminal, the map
+modules(see `core`) and the headless renderers never import curses:
+
+    python terminal.py level.txt other_level.txt [--seconds 5]
+
+Or from code, with a function that is handed the curses screen once colors are set up:
+
+    def main(stdscr):
+        renderer = Renderer(stdscr)
+        renderer.draw(game_map)
+
+    terminal.run(main)
+
+The terminal is put back the way it was when `main` returns or raises.
+"""
+import argparse
+import sys
+from time import sleep
+
+
+def run(main, *args):
+    """
+    Set up curses and its color pairs(pair n + 1 draws color n on the default background), call
+    `main(stdscr, *args)` and restore the terminal.
+
+    :param main: callable
+    :return: What main returns.
+    """
+
+    import curses
+
+    s = curses.initscr()
+    try:
+        curses.start_color()
+        curses.use_default_colors()
+        for i in range(0, curses.COLORS):
+            curses.init_pair(i + 1, i, -1)
+        return main(s, *args)
+    finally:
+        try:
+            curses.nocbreak()
+        except curses.error:
+            sys.exit()
+
+        s.keypad(False)
+        curses.echo()
+        curses.endwin()
+
+
+def show(stdscr, maps, seconds=5):
+    """
+    Draw each of the maps for a few seconds.  Maps larger than the terminal show their top left corner.
+
+    :param stdscr: window
+    :param maps: list
+    :param seconds: float
+    :return:
+    """
+
+    import curses
+    from renderer import Renderer
+
+    curses.curs_set(0)
+    renderer = Renderer(stdscr)
+    for game_map in maps:
+        renderer.draw(game_map, renderer.camera())
+        sleep(seconds)
+        stdscr.clear()
+        renderer.invalidate()
+
+
+if __name__ == '__main__':
+    from core import Map, MapBuilder, MAP_OBJECTS
+
+    parser = argparse.ArgumentParser(description='Draw map files in the terminal.')
+    parser.add_argument('paths', nargs='+', help='map files to draw')
+    parser.add_argument('--seconds', type=float, default=5, help='how long to show each map')
+    args = parser.parse_args()
+
+    maps = [MapBuilder.build_stream(path, Map(), MAP_OBJECTS) for path in args.paths]
+    run(show, maps, args.seconds)
@@ -0,0 +1,549 @@
+"""
+Tests for building maps and changing them afterwards.  Run them with:
+
+    python -m unittest test_maps
+"""
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import compiled
+import delta
+from benchmarks import synthetic_map
+from chunks import ChunkedMap
+from editor import Map, MapBuilder
+from fov import FieldOfView, OpacityGrid
+from map_objects import MAP_OBJECTS, EmptyTile, Ground, MapObject, Wall
+from pathfinding import PassabilityGrid, Pathfinder
+from registry import TokenRegistry
+from textrender import TextRenderer
+from transaction import MoveConflict
+
+
+def glyphs(game_map):
+    """
+    Get what every cell of the game_map holds and how it is drawn.
+
+    :param game_map: Map
+    :return dict: (y, x) -> (class, ch_number, drawing, color)
+    """
+
+    result = {}
+    for cell, map_object in game_map.objects.items():
+        if isinstance(map_object, str):
+            result[cell] = str, None, map_object, 0
+        else:
+            result[cell] = type(map_object), map_object.ch_number, map_object.drawing, map_object.color
+    return result
+
+
+def ragged_rows(rng, height, width):
+    rows = [row for row in synthetic_map(height, width, 0.35, seed=rng.randrange(1000)).split('\n') if row]
+    return [row[:rng.randrange(1, width + 1)] for row in rows]
+
+
+class MapTestCase(unittest.TestCase):
+    def assertSameMap(self, game_map, expected):
+        self.assertEqual(glyphs(game_map), glyphs(expected))
+        self.assertEqual(len(game_map.objects), len(expected.objects))
+        self.assertEqual((game_map.height, game_map.width), (expected.height, expected.width))
+        renderer = TextRenderer()
+        self.assertEqual(list(renderer.rows(game_map)), list(renderer.rows(expected)))
+
+
+class CompiledMapTest(MapTestCase):
+    def assertRoundTrip(self, built, map_objects=None):
+        loaded = compiled.loads(compiled.dumps(built), map_objects)
+        self.assertSameMap(loaded, built)
+        self.assertEqual(dict(loaded.tokens.items()), dict(built.tokens.items()))
+        return loaded
+
+    def test_ragged_maps(self):
+        rng = random.Random(5)
+        for _ in range(10):
+            map_text = '\n'.join(ragged_rows(rng, rng.randrange(1, 30), rng.randrange(1, 50)))
+            self.assertRoundTrip(MapBuilder.build(map_text, Map(), MAP_OBJECTS))
+            self.assertRoundTrip(MapBuilder.build(map_text, Map(flyweights=True), MAP_OBJECTS), MAP_OBJECTS)
+
+    def test_tokens_without_objects(self):
+        # Characters no map object uses are kept as plain tokens, rows start with gaps and end unevenly.
+        map_text = '  ##  \n#ab$#\n\n   ~~~~~~~~\n#'
+        self.assertRoundTrip(MapBuilder.build(map_text, Map(), MAP_OBJECTS))
+
+    def test_changed_map(self):
+        rng = random.Random(6)
+        game_map = MapBuilder.build('\n'.join(ragged_rows(rng, 20, 30)), Map(), MAP_OBJECTS)
+        for _ in range(50):
+            MapBuilder.place_token(game_map, rng.randrange(22), rng.randrange(32), rng.choice('# $w'), MAP_OBJECTS)
+        self.assertRoundTrip(game_map)
+
+    def test_replace_rows(self):
+        # Rows of a compiled map are slices of the compiled bytes until they are changed.
+        rng = random.Random(14)
+        for _ in range(10):
+            rows = ragged_rows(rng, 15, 25)
+            game_map = compiled.loads(compiled.dumps(MapBuilder.build('\n'.join(rows), Map(), MAP_OBJECTS)),
+                                      MAP_OBJECTS)
+            lines = {y: ''.join(rng.choice('##   $') for _ in range(rng.randrange(1, 30)))
+                     for y in rng.sample(range(len(rows)), 3)}
+            height = max(len(rows) - rng.randrange(1, 4), max(lines) + 1)
+            rows = rows[:height]
+            for y, line in lines.items():
+                rows[y] = line
+            MapBuilder.replace_rows(game_map, lines, MAP_OBJECTS, height)
+            # Every row of a compiled map is as wide as the widest one, so only the cells are compared.
+            expected = MapBuilder.build('\n'.join(rows), Map(), MAP_OBJECTS)
+            self.assertEqual(glyphs(game_map), glyphs(expected))
+            self.assertEqual(dict(game_map.tokens.items()), dict(expected.tokens.items()))
+            self.assertEqual((len(game_map.tokens), game_map.height), (len(expected.tokens), expected.height))
+
+    def test_save_and_load(self):
+        rng = random.Random(7)
+        built = MapBuilder.build('\n'.join(ragged_rows(rng, 20, 30)), Map(), MAP_OBJECTS)
+        handle, path = tempfile.mkstemp(suffix='.map')
+        os.close(handle)
+        try:
+            compiled.save(built, path)
+            loaded = compiled.load(path, MAP_OBJECTS)
+            try:
+                self.assertSameMap(loaded, built)
+            finally:
+                loaded.close()
+        finally:
+            os.remove(path)
+
+
+class DeltaTest(MapTestCase):
+    def test_patch(self):
+        rng = random.Random(11)
+        for flyweights in (False, True):
+            map_text = '\n'.join(ragged_rows(rng, 20, 30))
+            game_map = MapBuilder.build(map_text, Map(flyweights=flyweights), MAP_OBJECTS)
+            remote = MapBuilder.build(map_text, Map(flyweights=flyweights), MAP_OBJECTS)
+            seen = delta.snapshot(game_map)
+            for _ in range(100):
+                MapBuilder.place_token(game_map, rng.randrange(20), rng.randrange(30), rng.choice('# $w|'), MAP_OBJECTS)
+            delta.patch(remote, delta.diff(seen, game_map), MAP_OBJECTS)
+            self.assertSameMap(remote, game_map)
+
+    def test_wide_map(self):
+        # More distinct tokens than the compiled format holds, see WideTokenTest.
+        rng = random.Random(13)
+        rows = ragged_rows(rng, 20, 30)
+        rows[3:3] = [''.join(chr(0x4e00 + i) for i in range(300))]
+        map_text = '\n'.join(rows)
+        game_map = MapBuilder.build(map_text, Map(), MAP_OBJECTS)
+        remote = MapBuilder.build(map_text, Map(), MAP_OBJECTS)
+        self.assertTrue(game_map.tokens.wide)
+        seen = delta.snapshot(game_map)
+        for _ in range(100):
+            MapBuilder.place_token(game_map, rng.randrange(20), rng.randrange(30), rng.choice('# $w|'), MAP_OBJECTS)
+        delta.patch(remote, delta.diff(seen, game_map), MAP_OBJECTS)
+        self.assertSameMap(remote, game_map)
+
+
+class ChunkedMapTest(MapTestCase):
+    def setUp(self):
+        rng = random.Random(12)
+        self.text = '\n'.join(ragged_rows(rng, 30, 40))
+        handle, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as stream:
+            stream.write(self.text + '\n')
+        self.built = MapBuilder.build(self.text, Map(), MAP_OBJECTS)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_edits(self):
+        # The same edits on a chunked map and on the whole map built at once, with so few chunks loaded at a
+        # time that most edits drop a changed chunk and later load it back from the store.
+        height, width = self.built.height, self.built.width
+        for max_chunks in (1, 2, 3, 4):
+            rng = random.Random(max_chunks)
+            store = {}
+            game_map = MapBuilder.build(self.text, Map(), MAP_OBJECTS)
+            chunked = ChunkedMap(self.path, MAP_OBJECTS, chunk_size=8, max_chunks=max_chunks, store=store)
+            for _ in range(300):
+                # Mostly cells on either side of a chunk edge, whose walls look into the next chunk.
+                y = rng.choice((rng.randrange(height), rng.randrange(1, height // 8 + 1) * 8 - rng.randrange(2)))
+                x = rng.choice((rng.randrange(width), rng.randrange(1, width // 8 + 1) * 8 - rng.randrange(2)))
+                y, x = min(y, height - 1), min(x, width - 1)
+                map_object = game_map.objects.get((y, x))
+                cells = [(y + dy, x + dx) for dy, dx in ((-1, 0), (1, 0), (0, 1), (0, -1))]
+                cells = [cell for cell in cells if type(game_map.objects.get(cell)) is Ground]
+                if isinstance(map_object, MapObject) and cells and rng.random() < 0.5:
+                    cell = rng.choice(cells)
+                    map_object.move(cell[0], cell[1], game_map)
+                    chunked.objects[y, x].move(cell[0], cell[1], chunked)
+                else:
+                    token = rng.choice('##  $w|')
+                    MapBuilder.place_token(game_map, y, x, token, MAP_OBJECTS)
+                    MapBuilder.place_token(chunked, y, x, token, MAP_OBJECTS)
+                self.assertLessEqual(len(chunked.chunks), max_chunks)
+            self.assertTrue(store)
+            self.assertEqual(glyphs(chunked), glyphs(game_map))
+            self.assertEqual(dict(chunked.tokens.items()), dict(game_map.tokens.items()))
+            chunked.close()
+
+            # A new chunked map over the same store has every change.
+            with ChunkedMap(self.path, MAP_OBJECTS, chunk_size=8, max_chunks=max_chunks, store=store) as reloaded:
+                self.assertEqual(glyphs(reloaded), glyphs(game_map))
+
+    def test_compile(self):
+        with ChunkedMap(self.path, MAP_OBJECTS, chunk_size=8, max_chunks=2) as chunked:
+            built = MapBuilder.build(self.text, Map(), MAP_OBJECTS)
+            loaded = compiled.loads(compiled.dumps(chunked), MAP_OBJECTS)
+            self.assertSameMap(loaded, built)
+            self.assertEqual(dict(loaded.tokens.items()), dict(built.tokens.items()))
+
+            # Remote copies of a chunked map are kept up to date the same way.
+            seen = delta.snapshot(chunked)
+            MapBuilder.place_token(chunked, 8, 8, '#', MAP_OBJECTS)
+            MapBuilder.place_token(built, 8, 8, '#', MAP_OBJECTS)
+            delta.patch(loaded, delta.diff(seen, chunked), MAP_OBJECTS)
+            self.assertSameMap(loaded, built)
+
+
+class WideTokenTest(MapTestCase):
+    """
+    Maps with more than 255 distinct tokens keep two bytes per cell in their token grid.
+    """
+
+    def setUp(self):
+        rng = random.Random(9)
+        self.rows = ragged_rows(rng, 20, 30)
+        # A line of CJK text is enough to run out of byte codes.
+        self.rows[3:3] = [''.join(chr(0x4e00 + i) for i in range(300)), '#' * 10 + '  $  ' + '#' * 10]
+        self.text = '\n'.join(self.rows)
+
+    def test_build(self):
+        game_map = MapBuilder.build(self.text, Map(), MAP_OBJECTS)
+        self.assertTrue(game_map.tokens.wide)
+        for y, row in enumerate(self.rows):
+            self.assertEqual(''.join(game_map.tokens[y, x] for x in range(len(row))), row)
+
+        # Walls are tiled the same as on a map whose tokens fit in a byte.
+        narrow = MapBuilder.build(self.text.replace(self.rows[3], ' ' * len(self.rows[3])), Map(), MAP_OBJECTS)
+        self.assertFalse(narrow.tokens.wide)
+        actual, expected = glyphs(game_map), glyphs(narrow)
+        for x in range(len(self.rows[3])):
+            self.assertIs(actual.pop((3, x))[0], str)
+            self.assertIs(expected.pop((3, x))[0], Ground)
+        self.assertEqual(actual, expected)
+
+    def test_widen_built_map(self):
+        # Rows that were stored a byte per cell keep their tokens when the grid switches.
+        game_map = MapBuilder.build('\n'.join(self.rows[:3] + [' '] + self.rows[4:]), Map(), MAP_OBJECTS)
+        self.assertFalse(game_map.tokens.wide)
+        MapBuilder.replace_rows(game_map, {3: self.rows[3]}, MAP_OBJECTS, len(self.rows))
+        self.assertTrue(game_map.tokens.wide)
+        self.assertSameMap(game_map, MapBuilder.build(self.text, Map(), MAP_OBJECTS))
+
+        MapBuilder.place_token(game_map, 4, 12, '#', MAP_OBJECTS)
+        self.rows[4] = '#' * 10 + '  #  ' + '#' * 10
+        self.assertSameMap(game_map, MapBuilder.build('\n'.join(self.rows), Map(), MAP_OBJECTS))
+
+    def test_build_stream(self):
+        # The rows placed first are read before the tokens of the later ones are known.
+        streamed = MapBuilder.build_stream(iter(self.rows), Map(), MAP_OBJECTS)
+        self.assertSameMap(streamed, MapBuilder.build(self.text, Map(), MAP_OBJECTS))
+
+    def test_lazy(self):
+        lazy = MapBuilder.build(self.text, Map(lazy=True), MAP_OBJECTS)
+        self.assertSameMap(lazy, MapBuilder.build(self.text, Map(), MAP_OBJECTS))
+
+    def test_compile(self):
+        # The compiled format keeps one byte per token.
+        with self.assertRaises(ValueError):
+            compiled.dumps(MapBuilder.build(self.text, Map(), MAP_OBJECTS))
+
+
+class RetileTest(MapTestCase):
+    """
+    Changing cells of a built map has to leave it the same as building the changed text from scratch.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(8)
+        self.rows = [list(row) for row in ragged_rows(self.rng, 25, 35)]
+        self.game_map = MapBuilder.build(self.text(), Map(), MAP_OBJECTS)
+
+    def text(self):
+        return '\n'.join(''.join(row) for row in self.rows)
+
+    def rebuilt(self):
+        return MapBuilder.build(self.text(), Map(), MAP_OBJECTS)
+
+    def neighbour(self, y, x, accept):
+        # A random cell next to (y, x) whose object passes `accept`.
+        cells = [(y + dy, x + dx) for dy, dx in ((-1, 0), (1, 0), (0, 1), (0, -1))]
+        cells = [cell for cell in cells if accept(self.game_map.objects.get(cell))]
+        return self.rng.choice(cells) if cells else None
+
+    def test_place_token(self):
+        for _ in range(300):
+            y = self.rng.randrange(len(self.rows))
+            x = self.rng.randrange(len(self.rows[y]))
+            token = self.rng.choice('#   $w|')
+            self.rows[y][x] = token
+            MapBuilder.place_token(self.game_map, y, x, token, MAP_OBJECTS)
+        self.assertSameMap(self.game_map, self.rebuilt())
+
+    def test_watched_walls_with_own_place(self):
+        # Walls that place themselves are placed again by `Map.changed`, which must not call it once more.
+        class OwnWall(Wall):
+            def place(self, game_map):
+                Wall.place(self, game_map)
+
+        map_objects = dict(MAP_OBJECTS, wall=OwnWall)
+        game_map = MapBuilder.build(self.text(), Map(), map_objects)
+        notified = []
+        game_map.watch(lambda changed_map, cells: notified.append(cells))
+        for _ in range(100):
+            y = self.rng.randrange(len(self.rows))
+            x = self.rng.randrange(len(self.rows[y]))
+            token = self.rng.choice('#  ')
+            self.rows[y][x] = token
+            MapBuilder.place_token(game_map, y, x, token, map_objects)
+        self.assertTrue(notified)
+        self.assertSameMap(game_map, MapBuilder.build(self.text(), Map(), map_objects))
+
+    def test_move_walls(self):
+        # MapObject.move leaves Ground behind, walls next to both cells pick their characters again.
+        for _ in range(300):
+            walls = [map_object for map_object in self.game_map.objects.values() if type(map_object) is Wall]
+            wall = self.rng.choice(walls)
+            cell = self.neighbour(wall.y, wall.x, lambda map_object: type(map_object) is Ground)
+            if cell is None:
+                continue
+            self.rows[wall.y][wall.x], self.rows[cell[0]][cell[1]] = ' ', '#'
+            wall.move(cell[0], cell[1], self.game_map)
+        self.assertSameMap(self.game_map, self.rebuilt())
+
+    def test_move_ground_onto_walls(self):
+        # Ground.move leaves an EmptyTile behind, which has no token, so walls treat it like the floor it was.
+        moved = set()
+        for _ in range(200):
+            grounds = [map_object for map_object in self.game_map.objects.values() if type(map_object) is Ground]
+            ground = self.rng.choice(grounds)
+            cell = self.neighbour(ground.y, ground.x, lambda map_object: type(map_object) is Wall)
+            if cell is None:
+                continue
+            moved.add((ground.y, ground.x))
+            moved.discard(cell)
+            self.rows[cell[0]][cell[1]] = ' '
+            ground.move(cell[0], cell[1], self.game_map)
+
+        expected = glyphs(self.rebuilt())
+        actual = glyphs(self.game_map)
+        self.assertTrue(moved)
+        for cell in moved:
+            self.assertIs(actual.pop(cell)[0], EmptyTile)
+            self.assertIs(expected.pop(cell)[0], Ground)
+        self.assertEqual(actual, expected)
+
+
+class TransactionTest(unittest.TestCase):
+    map_text = '########\n#$ $ f$#\n#  $   #\n########'
+
+    def assertConsistent(self, game_map):
+        # Every tile is where it says it is, none is in two cells and the tokens match the objects.
+        seen = set()
+        for (y, x), map_object in game_map.objects.items():
+            if isinstance(map_object, str):
+                continue
+            if not map_object.is_flyweight():
+                self.assertEqual((map_object.y, map_object.x), (y, x))
+                self.assertNotIn(id(map_object), seen)
+                seen.add(id(map_object))
+            token = map_object.token
+            self.assertEqual(game_map.tokens.get((y, x)), token if isinstance(token, str) else None)
+
+    def test_swap_and_chain(self):
+        game_map = MapBuilder.build(self.map_text, Map(), MAP_OBJECTS)
+        objects = game_map.objects
+        first, second, food, last, lower = (objects[cell] for cell in ((1, 1), (1, 3), (1, 5), (1, 6), (2, 3)))
+        floor, below, ground = objects[2, 2], objects[2, 1], objects[2, 5]
+        version = game_map.version
+
+        transaction = game_map.transaction()
+        # Two treasures swap places.
+        transaction.move(first, 1, 3)
+        transaction.move(second, 1, 1)
+        # A treasure follows the food onto the floor.
+        transaction.move(food, 2, 5)
+        transaction.move(last, 1, 5)
+        # A treasure moves onto a floor tile that moves away itself, so that tile isn't left behind anywhere.
+        transaction.move(lower, 2, 2)
+        transaction.move(floor, 2, 1)
+        transaction.commit()
+
+        self.assertEqual(game_map.version, version + 1)
+        for cell, map_object in (((1, 3), first), ((1, 1), second), ((2, 5), food), ((1, 5), last),
+                                 ((2, 2), lower), ((2, 1), floor)):
+            self.assertIs(objects[cell], map_object)
+        # The floor tiles that were moved onto are put into the cells that were left, but not the tile that
+        # moved itself.
+        self.assertEqual({id(objects[1, 6]), id(objects[2, 3])}, {id(below), id(ground)})
+        self.assertConsistent(game_map)
+
+    def test_conflicts(self):
+        game_map = MapBuilder.build(self.map_text, Map(), MAP_OBJECTS)
+        objects = game_map.objects
+        first, second, food, last, lower = (objects[cell] for cell in ((1, 1), (1, 3), (1, 5), (1, 6), (2, 3)))
+        before, version = glyphs(game_map), game_map.version
+
+        transaction = game_map.transaction()
+        transaction.move(first, 1, 2)
+        transaction.move(second, 1, 2)
+        transaction.move(last, 1, 7)
+        # Waits for the last treasure, which can't move onto the wall.
+        transaction.move(food, 1, 6)
+        transaction.move(lower, 2, 4)
+        with self.assertRaises(MoveConflict) as raised:
+            transaction.commit()
+        self.assertEqual([map_object for map_object, _, _ in raised.exception.conflicts], [first, second, last])
+        self.assertEqual((glyphs(game_map), game_map.version), (before, version))
+
+        transaction.commit(skip_conflicts=True)
+        for cell, map_object in (((1, 1), first), ((1, 3), second), ((1, 6), last), ((1, 5), food), ((2, 4), lower)):
+            self.assertIs(objects[cell], map_object)
+        self.assertConsistent(game_map)
+
+        # Shared flyweight tiles have no position of their own to move from.
+        game_map = MapBuilder.build(self.map_text, Map(flyweights=True), MAP_OBJECTS)
+        transaction = game_map.transaction()
+        transaction.move(game_map.objects[1, 2], 2, 2)
+        self.assertEqual([reason for _, _, reason in transaction.conflicts()], ['shared tile, see Map.materialize'])
+
+    def test_skip_conflicts(self):
+        # Crowded maps where many moves conflict, directly or by waiting on an object that stays put.
+        for seed in range(50):
+            rng = random.Random(seed)
+            map_text = '\n'.join(''.join(rng.choice('$$$ f#') for _ in range(8)) for _ in range(8))
+            game_map = MapBuilder.build(map_text, Map(), MAP_OBJECTS)
+            movers = [map_object for map_object in game_map.objects.values() if not isinstance(map_object, Wall)]
+            transaction = game_map.transaction()
+            for map_object in rng.sample(movers, min(len(movers), 30)):
+                dy, dx = rng.choice(((-1, 0), (1, 0), (0, 1), (0, -1), (0, 0)))
+                transaction.move(map_object, map_object.y + dy, map_object.x + dx)
+            moves = [(map_object, (map_object.y, map_object.x), cell) for map_object, cell, _ in transaction.moves]
+            transaction.commit(skip_conflicts=True)
+            self.assertConsistent(game_map)
+            # Objects either made their move or stayed where they were, floor tiles can be moved onto.
+            for map_object, source, cell in moves:
+                if isinstance(map_object, MapObject):
+                    self.assertIn((map_object.y, map_object.x), (source, cell))
+                    self.assertIs(game_map.objects[map_object.y, map_object.x], map_object)
+
+
+class TokenRegistryTest(unittest.TestCase):
+    def test_cache_is_bounded(self):
+        used = TokenRegistry.of(MAP_OBJECTS)
+        for i in range(TokenRegistry.cache_size * 2):
+            # New sets of map objects, the one in use is looked up again now and then.
+            TokenRegistry.of(dict(MAP_OBJECTS, extra=type('Extra%d' % i, (Ground,), {'token': chr(0x100 + i)})))
+            self.assertIs(TokenRegistry.of(MAP_OBJECTS), used)
+            self.assertLessEqual(len(TokenRegistry.cache), TokenRegistry.cache_size)
+
+
+class RendererTest(unittest.TestCase):
+    def test_fake_screen_without_curses(self):
+        # In a fresh interpreter, since anything imported before would stay in sys.modules.
+        script = '\n'.join([
+            'import sys',
+            'from benchmarks import FakeScreen, FakeScreenRenderer, synthetic_map',
+            'from core import Map, MapBuilder, MAP_OBJECTS',
+            'renderer = FakeScreenRenderer(FakeScreen(20, 30))',
+            'renderer.draw(MapBuilder.build(synthetic_map(20, 30), Map(), MAP_OBJECTS))',
+            'assert renderer.window.drawn',
+            'assert "curses" not in sys.modules and "_curses" not in sys.modules, "curses was imported"',
+        ])
+        subprocess.run([sys.executable, '-c', script], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+class ClassGridTest(unittest.TestCase):
+    def test_watched_grids(self):
+        # The grids kept by a Pathfinder and a FieldOfView hold the same values as ones made from scratch.
+        rng = random.Random(10)
+        game_map = MapBuilder.build('\n'.join(ragged_rows(rng, 20, 30)), Map(), MAP_OBJECTS)
+        pathfinder, field_of_view = Pathfinder(game_map), FieldOfView(game_map)
+        # The grids keep the size the map had when they were made.
+        height, width = game_map.height, game_map.width
+        for _ in range(200):
+            y, x = rng.randrange(height), rng.randrange(width)
+            MapBuilder.place_token(game_map, y, x, rng.choice('# $w|'), MAP_OBJECTS)
+        self.assertEqual(pathfinder.grid.rows, PassabilityGrid(game_map).rows)
+        self.assertEqual(field_of_view.grid.rows, OpacityGrid(game_map).rows)
+
+
+class LazyMapTest(MapTestCase):
+    def test_build(self):
+        rng = random.Random(1)
+        for flyweights in (False, True):
+            map_text = '\n'.join(ragged_rows(rng, 30, 40))
+            lazy = MapBuilder.build(map_text, Map(flyweights=flyweights, lazy=True), MAP_OBJECTS)
+            eager = MapBuilder.build(map_text, Map(flyweights=flyweights), MAP_OBJECTS)
+            self.assertSameMap(lazy, eager)
+
+    def test_place_token(self):
+        rng = random.Random(2)
+        map_text = '\n'.join(ragged_rows(rng, 20, 30))
+        lazy = MapBuilder.build(map_text, Map(lazy=True), MAP_OBJECTS)
+        eager = MapBuilder.build(map_text, Map(), MAP_OBJECTS)
+        # Cells past the end of rows and in new rows as well, some rows are never looked at before the end.
+        for _ in range(200):
+            y, x, token = rng.randrange(24), rng.randrange(36), rng.choice('# $w|')
+            MapBuilder.place_token(lazy, y, x, token, MAP_OBJECTS)
+            MapBuilder.place_token(eager, y, x, token, MAP_OBJECTS)
+        self.assertSameMap(lazy, eager)
+
+    def test_replace_rows(self):
+        rng = random.Random(3)
+        for _ in range(20):
+            rows = ragged_rows(rng, 15, 25)
+            lazy = MapBuilder.build('\n'.join(rows), Map(lazy=True), MAP_OBJECTS)
+            lazy.objects.get((rng.randrange(15), 0))
+            for _ in range(5):
+                # Change a few rows, maybe add one at the bottom or cut the last ones off.
+                lines = {y: ''.join(rng.choice('##   $') for _ in range(rng.randrange(1, 30)))
+                         for y in rng.sample(range(len(rows) + 1), 3)}
+                height = max(len(rows) - rng.randrange(3), max(lines) + 1)
+                rows = (rows + [''])[:height]
+                for y, line in lines.items():
+                    rows[y] = line
+                MapBuilder.replace_rows(lazy, lines, MAP_OBJECTS, height)
+            self.assertSameMap(lazy, MapBuilder.build('\n'.join(rows), Map(), MAP_OBJECTS))
+
+    def test_width(self):
+        # The widths are kept between calls, so ask for them after every change, including ones that make the
+        # longest row shorter.
+        rng = random.Random(5)
+        for lazy in (False, True):
+            rows = ragged_rows(rng, 15, 25)
+            game_map = MapBuilder.build('\n'.join(rows), Map(lazy=lazy), MAP_OBJECTS)
+            for _ in range(100):
+                if rng.random() < 0.5:
+                    MapBuilder.place_token(game_map, rng.randrange(18), rng.randrange(30), '#', MAP_OBJECTS)
+                else:
+                    lines = {y: '$' * rng.randrange(1, 30) for y in rng.sample(range(game_map.height + 1), 2)}
+                    height = max(game_map.height - rng.randrange(3), max(lines) + 1)
+                    MapBuilder.replace_rows(game_map, lines, MAP_OBJECTS, height)
+                objects, tokens = game_map.objects, game_map.tokens
+                self.assertEqual(game_map.width, max(objects.row_length(y) if lazy else len(objects.rows[y])
+                                                     for y in range(game_map.height)))
+                self.assertEqual(tokens.width, max(len(row) for row in tokens.rows))
+
+    def test_build_stream(self):
+        rng = random.Random(4)
+        rows = ragged_rows(rng, 20, 30)
+        lazy =MapBuilder.build_stream(iter(rows), Map(lazy=True), MAP_OBJECTS)
+        self.assertFalse(any(lazy.objects.rows))
+        self.assertSameMap(lazy, MapBuilder.build('\n'.join(rows), Map(), MAP_OBJECTS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+Draw maps into strings instead of onto a terminal, as plain text or with ANSI colors:
+
+    print(TextRenderer(ansi=True).render(game_map))
+    snapshot = TextRenderer().render(game_map)
+
+Objects are drawn with their `drawing` and `color`, like the curses `renderer.Renderer` does, but without
+needing curses or a terminal.  Colors follow the color pairs the examples set up, where pair `n` is the
+terminal color `n - 1` on the default background.
+"""
+from grid import ObjectGrid, LazyObjectGrid
+
+# Back to the default foreground color.
+DEFAULT_COLOR = '\x1b[39m'
+RESET = '\x1b[0m'
+
+
+def escape(color):
+    """
+    Get the ANSI escape sequence for a curses color pair.
+
+    :param color: int
+    :return str:
+    """
+
+    if not color:
+        return DEFAULT_COLOR
+    return '\x1b[38;5;{}m'.format(color - 1)
+
+
+class TextRenderer(object):
+    """
+    Draws a Map into a string, a row at a time.  The character and color of every class whose objects all
+    look the same are worked out once, only objects that draw themselves differently(like walls) are asked
+    for their drawing and color.
+
+    ansi            -   Color the text with ANSI escape sequences.  The color is only switched where it
+                        changes along a row.
+    """
+
+    def __init__(self, ansi=False):
+        self.ansi = ansi
+        # class -> (character, color) for classes whose instances don't have their own drawing.
+        self.classes = {}
+        self.escapes = {}
+
+    def glyph(self, map_object):
+        """
+        Get the (character, color) an object is drawn with.  Cells without an object and objects without a
+        drawing are drawn as a space.
+
+        :param map_object:
+        :return tuple:
+        """
+
+        if map_object is None:
+            return ' ', 0
+        if isinstance(map_object, str):
+            return map_object or ' ', 0
+
+        map_object_class = type(map_object)
+        glyph = self.classes.get(map_object_class)
+        if glyph is not None:
+            return glyph
+        glyph = map_object.drawing or ' ', map_object.color or 0
+        if not hasattr(map_object, '__dict__'):
+            # Without a __dict__ the drawing and color can only come from the class.
+            self.classes[map_object_class] = glyph
+        return glyph
+
+    def escape(self, color):
+        try:
+            return self.escapes[color]
+        except KeyError:
+            sequence = self.escapes[color] = escape(color)
+            return sequence
+
+    def render_row(self, row):
+        """
+        Draw a row of objects(None for cells without one).
+
+        :param row: list
+        :return str:
+        """
+
+        classes = self.classes
+        glyph = self.glyph
+        if not self.ansi:
+            return ''.join([(classes.get(type(map_object)) or glyph(map_object))[0] for map_object in row])
+
+        parts = []
+        current = 0
+        for map_object in row:
+            character, color = classes.get(type(map_object)) or glyph(map_object)
+            if color != current:
+                parts.append(self.escape(color))
+                current = color
+            parts.append(character)
+        if current:
+            parts.append(RESET)
+        return ''.join(parts)
+
+    def rows(self, game_map, top=0, left=0, height=None, width=None):
+        """
+        Draw the rows of a window of the game_map, the whole map by default.  Rows end at the last cell of
+        the map inside the window.
+
+        :param game_map: Map
+        :param top: int
+        :param left: int
+        :param height: int
+        :param width: int
+        :return generator: The string of each row.
+        """
+
+        if height is None:
+            height = game_map.height - top
+        if width is None:
+            width = game_map.width - left
+
+        objects = game_map.objects
+        # Plain grids hand out their rows as they are.
+        whole_rows = (isinstance(objects, ObjectGrid) and not isinstance(objects, LazyObjectGrid)
+                      and objects.origin == (0, 0) and top >= 0 and left >= 0)
+        for y in range(top, top + height):
+            if whole_rows:
+                row = objects.row(y)[left:left + width]
+            else:
+                row = []
+                for (_, x), map_object in game_map.viewport(y, left, 1, width):
+                    row.extend([None] * (x - left - len(row)))
+                    row.append(map_object)
+            yield self.render_row(row)
+
+    def render(self, game_map, camera=None):
+        """
+        Draw the game_map into a string with a line for each row.  With a camera(see `camera.Camera`) only
+        the part of the map the camera looks at is drawn.
+
+        :param game_map: Map
+        :param camera: Camera
+        :return str:
+        """
+
+        if camera is None:
+            return '\n'.join(self.rows(game_map))
+        return '\n'.join(self.rows(game_map, *camera.window))
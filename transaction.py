@@ -0,0 +1,284 @@
+"""
+Move many objects at once, and keep track of what changed.
+
+    with game_map.transaction() as moves:
+        for monster in monsters:
+            moves.move(monster, monster.y + 1, monster.x)
+
+All the moves of a transaction are checked before any of them is made, so either every move is made or
+none is(see `MoveConflict`).  The map is told about every changed cell with a single `Map.changed` call,
+and each transaction bumps `Map.version` once.
+
+A ChangeJournal remembers the cells changed by every version of the map, so renderers and network sync
+can ask for what changed since the version they last saw instead of comparing the whole map:
+
+    journal = ChangeJournal(game_map)
+    seen = game_map.version
+    ...
+    cells = journal.since(seen)     # None if the journal no longer goes back that far
+"""
+from array import array
+from collections import Counter, deque
+from itertools import chain, compress
+
+from map_objects import EmptyTile, Ground, MapObject
+
+
+class MoveConflict(ValueError):
+    """
+    Raised when the moves of a transaction can't all be made.  `conflicts` holds a (map_object, (y, x),
+    reason) for every move that can't be made.
+    """
+
+    def __init__(self, conflicts):
+        ValueError.__init__(self, '{} conflicting move(s): {}'.format(
+            len(conflicts), '; '.join('{} to {}: {}'.format(type(map_object).__name__, cell, reason)
+                                      for map_object, cell, reason in conflicts[:5])))
+        self.conflicts = conflicts
+
+
+class Transaction(object):
+    """
+    A batch of moves that are made together by `commit`.
+
+    A move can go to a cell that holds no object, a plain token or a tile that isn't a MapObject(floor),
+    or to the cell of an object that moves away in the same transaction, so objects can follow each other
+    or swap places.  Moving two objects to the same cell, moving an object twice, moving an object that
+    isn't where it says it is, moving a shared flyweight tile(see `Map.materialize`) or moving onto a
+    MapObject that stays put are conflicts.
+
+    The floor tile an object moves onto is put into the cell the object leaves when it is of the right
+    class, so moves don't create new tiles.
+    """
+
+    def __init__(self, game_map):
+        self.map = game_map
+        # (map_object, (y, x), replacement class) of each move.
+        self.moves = []
+
+    def move(self, map_object, y, x, replacement=None):
+        """
+        Add a move to the transaction.
+
+        replacement     -   Class of the tile left behind, `Ground` for MapObjects and `EmptyTile` for
+                            other tiles by default(like their `move` methods).
+
+        :param map_object: Ground
+        :param y: int
+        :param x: int
+        :param replacement: class
+        :return:
+        """
+
+        if replacement is None:
+            replacement = Ground if isinstance(map_object, MapObject) else EmptyTile
+        self.moves.append((map_object, (y, x), replacement))
+
+    def conflicts(self, moves=None):
+        """
+        Get the moves that can't be made.
+
+        :param moves: list
+        :return list: (map_object, (y, x), reason) for each conflicting move.
+        """
+
+        if moves is None:
+            moves = self.moves
+        reasons, _ = self.check(moves)
+        return [(map_object, cell, reason) for (map_object, cell, _), reason in zip(moves, reasons)
+                if reason is not None]
+
+    def check(self, moves, movers=None, targets=None):
+        """
+        Get why each of the moves can't be made, and what is in the cell each of them moves onto.
+
+        movers          -   The ids of the moved objects and the cells they move to, if the caller already has
+        targets             them(see `commit`).
+
+        :param moves: list
+        :param movers: set
+        :param targets: set
+        :return tuple: (reasons, occupants), with a reason of None for the moves that can be made.
+        """
+
+        get = self.map.objects.get
+        tokens = self.map.tokens
+        if movers is None:
+            movers = {id(map_object) for map_object, _, _ in moves}
+        if targets is None:
+            targets = {cell for _, cell, _ in moves}
+        # Only count the objects moving to each cell, and look for objects that are moved twice, if any are.
+        counts = Counter(cell for _, cell, _ in moves) if len(targets) < len(moves) else {}
+        crowded = {cell for cell, count in counts.items() if count > 1}
+        seen = set() if len(movers) < len(moves) else None
+
+        reasons = []
+        occupants = []
+        for map_object, cell, _ in moves:
+            reason = None
+            occupant = get(cell)
+            if (seen is None and occupant is not None and not isinstance(occupant, MapObject)
+                    and cell not in crowded and not map_object.is_flyweight()
+                    and get((map_object.y, map_object.x)) is map_object):
+                # Most moves go onto the floor.
+                reasons.append(None)
+                occupants.append(occupant)
+                continue
+            if seen is not None and id(map_object) in seen:
+                reason = 'moved more than once'
+            elif map_object.is_flyweight():
+                reason = 'shared tile, see Map.materialize'
+            elif get((map_object.y, map_object.x)) is not map_object:
+                reason = 'not on the map at its position'
+            elif cell in crowded:
+                reason = 'cell targeted by {} objects'.format(counts[cell])
+            elif occupant is None and tokens.get(cell) is None:
+                reason = 'cell is not on the map'
+            elif isinstance(occupant, MapObject) and occupant is not map_object and id(occupant) not in movers:
+                reason = 'cell holds a {}'.format(type(occupant).__name__)
+            if seen is not None:
+                seen.add(id(map_object))
+            reasons.append(reason)
+            occupants.append(occupant)
+        return reasons, occupants
+
+    def without_conflicts(self, moves, reasons, occupants):
+        """
+        Leave out the conflicting moves, and the moves onto the cells of objects that stay put because their
+        own move was left out.
+
+        :param moves: list
+        :param reasons: list
+        :param occupants: list
+        :return tuple: The (moves, occupants) that are left.
+        """
+
+        dropped = {id(map_object) for (map_object, _, _), reason in zip(moves, reasons) if reason is not None}
+
+        # The objects waiting for each object to move away from its cell.
+        waiting = {}
+        for (map_object, _, _), occupant in zip(moves, occupants):
+            if isinstance(occupant, MapObject) and occupant is not map_object:
+                waiting.setdefault(id(occupant), []).append(map_object)
+
+        stack = list(dropped)
+        while stack:
+            for map_object in waiting.pop(stack.pop(), ()):
+                if id(map_object) not in dropped:
+                    dropped.add(id(map_object))
+                    stack.append(id(map_object))
+        kept = [id(map_object) not in dropped for map_object, _, _ in moves]
+        return list(compress(moves, kept)), list(compress(occupants, kept))
+
+    def commit(self, skip_conflicts=False):
+        """
+        Make the moves.
+
+        skip_conflicts  -   Leave out the conflicting moves(and the moves that conflict because of them)
+                            instead of raising MoveConflict.
+
+        :param skip_conflicts: bool
+        :return list: The (y, x) cells that changed, see `Map.changed`.
+        """
+
+        moves = self.moves
+        movers = {id(map_object) for map_object, _, _ in moves}
+        targets = {cell for _, cell, _ in moves}
+        reasons, occupants = self.check(moves, movers, targets)
+        if reasons.count(None) < len(reasons):
+            if not skip_conflicts:
+                raise MoveConflict([(map_object, cell, reason)
+                                    for (map_object, cell, _), reason in zip(moves, reasons) if reason is not None])
+            moves, occupants = self.without_conflicts(moves, reasons, occupants)
+            movers = {id(map_object) for map_object, _, _ in moves}
+            targets = {cell for _, cell, _ in moves}
+        self.moves = []
+        if not moves:
+            return []
+
+        game_map = self.map
+        objects = game_map.objects
+        cells = []
+        # Cells that are left but not moved onto, with the class of the tile they get.
+        left = []
+        displaced = {}
+        for (map_object, cell, replacement), occupant in zip(moves, occupants):
+            source = map_object.y, map_object.x
+            cells.append(source)
+            cells.append(cell)
+            map_object.y, map_object.x = cell
+            objects[cell] = map_object
+            # Keep the floor tiles that are moved onto for the cells that are left.  Objects that move
+            # themselves aren't left behind anywhere.
+            if source not in targets:
+                if type(occupant) is replacement and id(occupant) not in movers and not occupant.is_flyweight():
+                    # Most moves just trade places with the floor.
+                    occupant.y, occupant.x = source
+                    objects[source] = occupant
+                    continue
+                left.append((source, replacement))
+            if (isinstance(occupant, EmptyTile) and not isinstance(occupant, MapObject)
+                    and id(occupant) not in movers and not occupant.is_flyweight()):
+                displaced.setdefault(type(occupant), []).append(occupant)
+
+        for (y, x), replacement in left:
+            recycled = displaced.get(replacement)
+            if recycled:
+                tile = recycled.pop()
+                tile.y, tile.x = y, x
+            else:
+                tile = replacement.create(y, x, game_map=game_map)
+            objects[y, x] = tile
+
+        if targets.isdisjoint(cells[::2]):
+            return game_map.changed(*cells)
+        # Cells that are left and moved onto are only reported once.
+        return game_map.changed(*dict.fromkeys(cells))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+
+class ChangeJournal(object):
+    """
+    Remembers which cells changed in each of the last `size` versions of a game_map.  The journal
+    watches the map(see `Map.watch`), call `close` when it is no longer needed.
+
+    entries         -   (version, cells) for each version, the cells are stored flat as y, x, y, x, ...
+    """
+
+    def __init__(self, game_map, size=1024):
+        self.map = game_map
+        self.entries = deque(maxlen=size)
+        # The journal knows about every change after this version.
+        self.start = game_map.version
+        game_map.watch(self.changed)
+
+    def changed(self, game_map, cells):
+        if len(self.entries) == self.entries.maxlen:
+            self.start = self.entries[0][0]
+        self.entries.append((game_map.version, array('l', chain.from_iterable(cells))))
+
+    def since(self, version):
+        """
+        Get the cells that changed after the given version of the map.
+
+        :param version: int
+        :return set: None if the journal doesn't go back to that version.
+        """
+
+        if version < self.start:
+            return None
+        cells = set()
+        for entry_version, flat in reversed(self.entries):
+            if entry_version <= version:
+                break
+            cells.update(zip(flat[::2], flat[1::2]))
+        return cells
+
+    def close(self):
+        self.map.unwatch(self.changed)